@@ -0,0 +1,286 @@
+"""
+准入控制（按用户公平分配）
+在 /api/dify/* 和 /api/translate-image 前面做限流：
+- 每个用户一个令牌桶，限制请求速率
+- 每个用户、每个工作流分别限制并发数
+超限的请求返回 429，并带上 Retry-After
+
+计数器默认保存在进程内存中；多节点部署时设置 ADMISSION_BACKEND=redis 使用共享计数，
+Redis 不可用时自动退回本地内存计数
+"""
+import os
+import time
+import functools
+import threading
+
+from flask import request, jsonify, make_response
+
+# ============= 配置区域 =============
+ADMISSION_BACKEND = os.getenv("ADMISSION_BACKEND", "memory")  # memory / redis
+ADMISSION_REDIS_URL = os.getenv("ADMISSION_REDIS_URL", "redis://localhost:6379/0")
+
+# 每个用户每分钟允许的请求数和突发容量
+USER_RATE_PER_MINUTE = float(os.getenv("USER_RATE_PER_MINUTE", "20"))
+USER_BURST = int(os.getenv("USER_BURST", "10"))
+
+# 每个用户同时进行的请求数
+USER_MAX_CONCURRENCY = int(os.getenv("USER_MAX_CONCURRENCY", "3"))
+
+# 前面反向代理的层数：X-Forwarded-For 只信任最右边这么多跳，0 表示忽略该请求头、直接使用连接地址
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+
+# 每个工作流全局同时进行的请求数
+WORKFLOW_MAX_CONCURRENCY = {
+    "upload": int(os.getenv("UPLOAD_MAX_CONCURRENCY", "16")),
+    "academic_convert": int(os.getenv("ACADEMIC_CONVERT_MAX_CONCURRENCY", "8")),
+    "academic_translate": int(os.getenv("ACADEMIC_TRANSLATE_MAX_CONCURRENCY", "8")),
+    "country_report": int(os.getenv("COUNTRY_REPORT_MAX_CONCURRENCY", "4")),
+    "quarterly_report": int(os.getenv("QUARTERLY_REPORT_MAX_CONCURRENCY", "4")),
+    "image_translate": int(os.getenv("IMAGE_TRANSLATE_MAX_CONCURRENCY", "8")),
+    "pipeline": int(os.getenv("PIPELINE_MAX_CONCURRENCY", "4")),
+}
+
+# 并发计数的过期时间，防止节点崩溃后计数无法归还；
+# 批量转换、流水线在整个任务期间占用名额（可能持续数小时），所以取一天
+SLOT_TTL = 24 * 3600
+
+# 当前请求的释放函数保存在 request.environ 中（调度器复制的请求上下文共用同一个 environ）
+ADMISSION_RELEASE_KEY = "admission.release"
+
+
+class MemoryCounterBackend:
+    """进程内计数器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, 上次更新时间)
+        self._slots = {}    # key -> 当前并发数
+
+    def take_token(self, key, rate, burst):
+        """从令牌桶取一个令牌，返回 (是否允许, 需要等待的秒数)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return True, 0
+            self._buckets[key] = (tokens, now)
+            return False, (1 - tokens) / rate
+
+    def acquire_slot(self, key, limit):
+        """占用一个并发名额"""
+        with self._lock:
+            current = self._slots.get(key, 0)
+            if current >= limit:
+                return False
+            self._slots[key] = current + 1
+            return True
+
+    def release_slot(self, key):
+        """归还并发名额"""
+        with self._lock:
+            current = self._slots.get(key, 0) - 1
+            if current > 0:
+                self._slots[key] = current
+            else:
+                self._slots.pop(key, None)
+
+    def in_flight(self):
+        with self._lock:
+            return dict(self._slots)
+
+
+class RedisCounterBackend:
+    """基于 Redis 的共享计数器（多节点部署）"""
+
+    TOKEN_BUCKET_SCRIPT = """
+local tokens_key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local data = redis.call('HMGET', tokens_key, 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', tokens_key, 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', tokens_key, math.ceil(burst / rate) + 60)
+return {allowed, tostring(retry_after)}
+"""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+        self._take_token = self.client.register_script(self.TOKEN_BUCKET_SCRIPT)
+
+    def take_token(self, key, rate, burst):
+        allowed, retry_after = self._take_token(keys=[f"admission:bucket:{key}"], args=[rate, burst, time.time()])
+        return bool(allowed), float(retry_after)
+
+    def acquire_slot(self, key, limit):
+        slot_key = f"admission:slot:{key}"
+        pipe = self.client.pipeline()
+        pipe.incr(slot_key)
+        pipe.expire(slot_key, SLOT_TTL)
+        current, _ = pipe.execute()
+        if current > limit:
+            self.client.decr(slot_key)
+            return False
+        return True
+
+    def release_slot(self, key):
+        self.client.decr(f"admission:slot:{key}")
+
+    def in_flight(self):
+        result = {}
+        for slot_key in self.client.scan_iter("admission:slot:*"):
+            value = int(self.client.get(slot_key) or 0)
+            if value > 0:
+                result[slot_key.decode().split("admission:slot:", 1)[1]] = value
+        return result
+
+
+def create_counter_backend():
+    """根据配置创建计数器，Redis 不可用时退回内存计数"""
+    if ADMISSION_BACKEND == "redis":
+        try:
+            backend = RedisCounterBackend(ADMISSION_REDIS_URL)
+            print(f"[Admission] 使用 Redis 共享计数: {ADMISSION_REDIS_URL}")
+            return backend
+        except Exception as e:
+            print(f"[Admission] Redis 不可用，退回内存计数: {e}")
+    return MemoryCounterBackend()
+
+
+class AdmissionRejected(Exception):
+    """请求超出限额"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """令牌桶 + 并发上限"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def admit(self, user, workflow):
+        """检查并占用名额，返回释放函数；超限时抛出 AdmissionRejected"""
+        allowed, retry_after = self.backend.take_token(f"user:{user}", USER_RATE_PER_MINUTE / 60.0, USER_BURST)
+        if not allowed:
+            raise AdmissionRejected("rate limit exceeded", retry_after)
+
+        user_key = f"user:{user}"
+        workflow_key = f"workflow:{workflow}"
+        if not self.backend.acquire_slot(user_key, USER_MAX_CONCURRENCY):
+            raise AdmissionRejected("too many concurrent requests for user", 5)
+        if not self.backend.acquire_slot(workflow_key, WORKFLOW_MAX_CONCURRENCY.get(workflow, USER_MAX_CONCURRENCY)):
+            self.backend.release_slot(user_key)
+            raise AdmissionRejected("too many concurrent requests for workflow", 5)
+
+        released = threading.Event()
+
+        def release():
+            if released.is_set():
+                return
+            released.set()
+            self.backend.release_slot(workflow_key)
+            self.backend.release_slot(user_key)
+
+        return release
+
+
+admission_controller = AdmissionController(create_counter_backend())
+
+
+def client_ip(forwarded, remote_addr):
+    """
+    客户端 IP：X-Forwarded-For 最左边的条目由客户端自己填写，不可信；
+    只取最右边 TRUSTED_PROXY_COUNT 跳中最左的一跳（与 werkzeug ProxyFix(x_for=N) 相同）
+    """
+    if TRUSTED_PROXY_COUNT > 0:
+        hops = [hop.strip() for hop in (forwarded or '').split(',') if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_COUNT:
+            return hops[-TRUSTED_PROXY_COUNT]
+    return remote_addr or ''
+
+
+def get_request_user():
+    """识别请求的用户，未指定用户时按客户端 IP 区分"""
+    data = request.get_json(silent=True) or {}
+    user = data.get('user') or request.form.get('user') or 'default'
+    if user == 'default':
+        return f"ip:{client_ip(request.headers.get('X-Forwarded-For'), request.remote_addr)}"
+    return user
+
+
+def hold_admission_slot():
+    """
+    把当前请求占用的准入名额转交给后台任务：响应发送后不再自动归还，
+    由调用方在任务结束时调用返回的函数归还（重复调用无副作用）。
+    不在 admission_controlled 路由中时返回空函数
+    """
+    return request.environ.pop(ADMISSION_RELEASE_KEY, None) or (lambda: None)
+
+
+def admission_controlled(workflow):
+    """
+    路由装饰器：按用户和工作流做准入控制
+
+    名额在响应发送完成后归还；接口返回 202 后仍在后台执行的任务用 hold_admission_slot() 接管名额
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            user = get_request_user()
+            try:
+                release = admission_controller.admit(user, workflow)
+            except AdmissionRejected as e:
+                retry_after = max(1, int(e.retry_after + 0.999))
+                print(f"[Admission] 拒绝请求: user={user}, workflow={workflow}, 原因={e.reason}")
+                response = jsonify({
+                    "error": "Too many requests",
+                    "reason": e.reason,
+                    "retry_after": retry_after
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+
+            request.environ[ADMISSION_RELEASE_KEY] = release
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                release()
+                raise
+            # 流式响应要等到发送完成后才归还名额；已被后台任务接管时由任务归还
+            if request.environ.pop(ADMISSION_RELEASE_KEY, None):
+                response.call_on_close(release)
+            return response
+        return wrapper
+    return decorator
+
+
+def register_admission_routes(app):
+    """注册准入控制监控路由"""
+
+    @app.route('/api/admission/stats', methods=['GET'])
+    def get_admission_stats():
+        """当前各用户、各工作流占用的并发数"""
+        return jsonify({
+            "success": True,
+            "backend": type(admission_controller.backend).__name__,
+            "in_flight": admission_controller.backend.in_flight()
+        }), 200
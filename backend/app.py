@@ -4,15 +4,20 @@ import requests
 import json
 import time
 import uuid
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from flask import Flask, request, jsonify, Response, stream_with_context, send_file
 from flask_cors import CORS
+from werkzeug.datastructures import FileStorage
 from typing import Optional, Generator
 from datetime import datetime
-from PIL import Image
-from openai import OpenAI
+from urllib.parse import quote
+from PIL import Image, ImageChops
+from openai import OpenAI, APIConnectionError
 import io
-import base64
-import re
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -64,10 +69,24 @@ UPLOAD_TIMEOUT = 120
 WORKFLOW_TIMEOUT = 1800
 MAX_IMAGE_SIZE = 1600
 JPEG_QUALITY = 85
+# 不需要重新编码的 JPEG 的大小上限
+MAX_PASSTHROUGH_BYTES = 2 * 1024 * 1024
+# 缩放时先按整数倍缩小，直到剩余倍数小于该值再用 LANCZOS
+RESIZE_REDUCING_GAP = 3.0
 MAX_RETRIES = 5
 RETRY_DELAY = 10
 DOWNLOAD_TIMEOUT = 180
 
+# 端点池：每个工作流可配置多个 Key / 地址，按进行中请求数做负载均衡
+from key_pool import EndpointPool, Endpoint, build_pool, register_pool_routes
+DIFY_POOLS = {
+    "academic_convert": build_pool("academic_convert", "ACADEMIC_TO_OFFICIAL_API_KEYS", ACADEMIC_TO_OFFICIAL_API_KEY, "DIFY_BASE_URLS", DIFY_BASE_URL),
+    "academic_translate": build_pool("academic_translate", "TRANSLATE_API_KEYS", TRANSLATE_API_KEY, "DIFY_BASE_URLS", DIFY_BASE_URL),
+    "country_situation": build_pool("country_situation", "COUNTRY_SITUATION_API_KEYS", COUNTRY_SITUATION_API_KEY, "DIFY_BASE_URLS", DIFY_BASE_URL),
+    "quarterly_report": build_pool("quarterly_report", "QUARTERLY_REPORT_API_KEYS", QUARTERLY_REPORT_API_KEY, "DIFY_BASE_URLS", DIFY_BASE_URL),
+}
+OPENAI_POOL = build_pool("image_translate", "OPENAI_API_KEYS", OPENAI_API_KEY, "OPENAI_API_URLS", OPENAI_API_URL)
+
 # 图片翻译提示词
 IMAGE_TRANSLATION_PROMPT = "帮我生成图片：请检查图中的所有英文，包括竖写和横写，并将英文翻译为简体中文，其余元素保持不变。原比例。"
 
@@ -88,39 +107,79 @@ def write_log(message):
     print(message.encode('utf-8', errors='ignore').decode('utf-8'))
 
 
+# 允许跨域访问的前端地址（asgi_app 的异步路由共用这份配置）
+CORS_ORIGINS = [
+    "http://localhost:5173",
+    "http://localhost:5174",
+    "http://localhost:5181",
+    "http://localhost:5182",
+    "http://localhost:5183",
+    "http://localhost:5184",
+    "http://localhost:5185",
+    "http://localhost:5186",
+    "http://localhost:5187",
+    "http://localhost:5188",
+    "http://localhost:5190",
+    "http://localhost:5200",
+    "http://localhost:3000",
+    "https://banksmart-report.vercel.app",
+    "https://smart-report-jade.vercel.app",
+    "https://jx-report.nfeyre.top",
+    "https://smartdocx.jxchen.me"
+]
+
 app = Flask(__name__)
 CORS(app, resources={
     r"/api/*": {
-        "origins": [
-            "http://localhost:5173",
-            "http://localhost:5174",
-            "http://localhost:5181",
-            "http://localhost:5182",
-            "http://localhost:5183",
-            "http://localhost:5184",
-            "http://localhost:5185",
-            "http://localhost:5186",
-            "http://localhost:5187",
-            "http://localhost:5188",
-            "http://localhost:5190",
-            "http://localhost:5200",
-            "http://localhost:3000",
-            "https://banksmart-report.vercel.app",
-            "https://smart-report-jade.vercel.app",
-            "https://jx-report.nfeyre.top",
-            "https://smartdocx.jxchen.me"
-        ],
+        "origins": CORS_ORIGINS,
         "methods": ["GET", "POST", "OPTIONS", "PATCH", "DELETE"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"],
+        "expose_headers": ["Retry-After", "Idempotent-Replayed", "X-Translation-Cache", "X-Failed-Items",
+                           "X-Image-Payload-Bytes", "X-Image-Encode-Ms", "X-Image-Encoding",
+                           "ETag", "X-Artifact-Url"]
     }
 })
 
 # 注册文档管理路由
-from document_local_api import register_document_routes
+from document_local_api import register_document_routes, get_document_row, get_storage_url
 register_document_routes(app)
 
+# 注册产物缓存路由
+from artifact_cache import (register_artifact_routes, rehost_remote_file, current_base_url,
+                            artifact_cache, artifact_url, artifact_hash_from_url)
+register_artifact_routes(app)
+
+# 注册后台任务路由
+from batch_jobs import BatchJob, job_store, register_job_routes
+register_job_routes(app)
+
+# 注册调度器（交互式 / 批处理分池执行）
+from scheduler import scheduled, register_scheduler_routes, scheduler, SchedulerBusy, INTERACTIVE, BATCH
+register_scheduler_routes(app)
+
+# 注册准入控制（按用户限流）
+from admission import admission_controlled, hold_admission_slot, register_admission_routes
+register_admission_routes(app)
+
+# 注册幂等键路由
+from idempotency import idempotent, register_idempotency_routes
+register_idempotency_routes(app)
+
+# 注册文档流水线路由
+from pipelines import parse_stages, stage_key, stage_cache, register_pipeline_routes
+register_pipeline_routes(app)
+
+# 注册端点池监控路由
+register_pool_routes(app, {**DIFY_POOLS, "image_translate": OPENAI_POOL})
+
 # ============= 本地历史记录存储 =============
-HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conversion_history.json')
+HISTORY_FILE = os.getenv(
+    "CONVERSION_HISTORY_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conversion_history.json')
+)
+
+# 历史记录文件的读写锁（批量任务会在多个线程中同时更新记录）
+_history_lock = threading.RLock()
 
 def load_history() -> list:
     """加载历史记录"""
@@ -148,11 +207,12 @@ def save_history(history: list):
 
 def add_conversion_record(record: dict):
     """添加转换记录"""
-    history = load_history()
-    history.insert(0, record)  # 添加到最前面
-    # 最多保存 100 条记录
-    history = history[:100]
-    save_history(history)
+    with _history_lock:
+        history = load_history()
+        history.insert(0, record)  # 添加到最前面
+        # 最多保存 100 条记录
+        history = history[:100]
+        save_history(history)
 
 def get_conversion_records(user_id: str = 'default', task_type: str = None, limit: int = 50) -> list:
     """获取用户的转换记录"""
@@ -176,20 +236,21 @@ def get_conversion_records(user_id: str = 'default', task_type: str = None, limi
 
 def update_conversion_record(record_id: str, status: str, output_url: str = None, error_message: str = None, output_content: str = None):
     """更新转换记录"""
-    history = load_history()
-    for record in history:
-        if record.get('id') == record_id:
-            record['status'] = status
-            if output_url:
-                record['output_url'] = output_url
-            if output_content:
-                record['output_content'] = output_content
-            if error_message:
-                record['error_message'] = error_message
-            if status == 'completed':
-                record['completed_at'] = datetime.now().isoformat()
-            break
-    save_history(history)
+    with _history_lock:
+        history = load_history()
+        for record in history:
+            if record.get('id') == record_id:
+                record['status'] = status
+                if output_url:
+                    record['output_url'] = output_url
+                if output_content:
+                    record['output_content'] = output_content
+                if error_message:
+                    record['error_message'] = error_message
+                if status == 'completed':
+                    record['completed_at'] = datetime.now().isoformat()
+                break
+        save_history(history)
 
 # 历史记录 API
 @app.route('/api/conversions', methods=['GET'])
@@ -233,13 +294,14 @@ def get_conversion_record(record_id):
 def delete_conversion_record(record_id):
     """删除单个转换记录"""
     try:
-        history = load_history()
-        new_history = [r for r in history if r.get('id') != record_id]
+        with _history_lock:
+            history = load_history()
+            new_history = [r for r in history if r.get('id') != record_id]
 
-        if len(new_history) == len(history):
-            return jsonify({"error": "记录不存在"}), 404
+            if len(new_history) == len(history):
+                return jsonify({"error": "记录不存在"}), 404
 
-        save_history(new_history)
+            save_history(new_history)
         return jsonify({
             "success": True,
             "message": "记录已删除"
@@ -261,21 +323,102 @@ def clear_all_conversions():
         return jsonify({"error": str(e)}), 500
 
 
+class WorkflowStartError(Exception):
+    """工作流启动失败（上游返回非 200）"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"Failed to start workflow: {status_code}")
+        self.status_code = status_code
+        self.text = text
+
+
+class WorkflowStreamCollector:
+    """逐行解析 Dify 流式响应，收集节点输出和工作流状态"""
+
+    def __init__(self, timeout_seconds=WORKFLOW_TIMEOUT):
+        self.outputs = []
+        self.workflow_status = None
+        self.all_data = []
+        self.done_received = False
+        self.timeout_seconds = timeout_seconds
+        self.last_data_time = time.time()
+
+    def _collect_outputs(self, new_outputs, label):
+        if isinstance(new_outputs, dict):
+            for key, value in new_outputs.items():
+                self.outputs.append(value)
+            write_log(f"收到{label}(字典): {len(new_outputs)} 个, 总输出数: {len(self.outputs)} 个, 键: {list(new_outputs.keys())}")
+        else:
+            for output in new_outputs:
+                self.outputs.append(output)
+            write_log(f"收到{label}(列表): {len(new_outputs)} 个, 总输出数: {len(self.outputs)} 个, 内容: {json.dumps(new_outputs, ensure_ascii=False)}")
+
+    def feed_line(self, line):
+        """处理一行数据，返回 False 表示流已结束或超时"""
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+
+        if time.time() - self.last_data_time > self.timeout_seconds:
+            write_log(f"接收数据超时，最后数据时间: {self.last_data_time}")
+            return False
+
+        if line.startswith('data:'):
+            try:
+                data = json.loads(line[5:])
+            except json.JSONDecodeError as e:
+                write_log(f"解析数据行失败: {e}, 行内容: {line}")
+                return True
+
+            self.all_data.append(data)
+            self.last_data_time = time.time()
+            write_log(f"收到数据: {json.dumps(data, ensure_ascii=False)}")
+
+            if 'status' in data:
+                self.workflow_status = data['status']
+                write_log(f"工作流状态: {self.workflow_status}")
+
+            event = data.get('event')
+            event_data = data.get('data') if isinstance(data.get('data'), dict) else {}
+            if event == 'node_finished':
+                write_log(f"节点完成: node_id={event_data.get('node_id', 'unknown')}, status={event_data.get('status', 'unknown')}")
+                if 'error' in event_data:
+                    write_log(f"节点错误: {event_data['error']}")
+                if 'outputs' in event_data:
+                    self._collect_outputs(event_data['outputs'], "输出")
+            elif event == 'workflow_finished':
+                if 'outputs' in event_data:
+                    write_log(f"工作流完成，最终输出: {json.dumps(event_data['outputs'], ensure_ascii=False)}")
+                    self._collect_outputs(event_data['outputs'], "工作流输出")
+                if 'status' in event_data:
+                    self.workflow_status = event_data['status']
+                    write_log(f"工作流最终状态: {self.workflow_status}")
+
+        elif line == '[DONE]':
+            write_log("工作流完成")
+            self.done_received = True
+            return False
+
+        return True
+
+    def result(self):
+        """返回 (outputs, workflow_status, all_data, done_received)"""
+        write_log(f"最终状态: {self.workflow_status}")
+        write_log(f"最终输出: {len(self.outputs)} 个")
+        write_log(f"所有数据: {len(self.all_data)} 条")
+        write_log(f"是否收到DONE: {self.done_received}")
+        return self.outputs, self.workflow_status, self.all_data, self.done_received
+
+
 class DifyAPIClient:
     """Dify API 客户端类"""
 
-    def __init__(self, api_key, base_url="https://api.dify.ai/v1"):
-        self.api_key = api_key
-        self.base_url = base_url
-        self.headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
+    def __init__(self, api_key=None, base_url="https://api.dify.ai/v1", pool=None):
+        # 未指定端点池时，用单个 key 构建一个只有一个端点的池
+        self.pool = pool or EndpointPool("dify", [Endpoint(api_key, base_url)])
 
     def upload_file(self, file, user=""):
         """上传文件到Dify的存储服务"""
-        upload_url = f"{self.base_url}/files/upload"
-
         mime_types = {
             'pdf': 'application/pdf',
             'doc': 'application/msword',
@@ -300,8 +443,11 @@ class DifyAPIClient:
             data = {'user': user}
 
             write_log(f"上传文件到Dify: {filename}, MIME类型: {mime_type}")
-            response = requests.post(upload_url, headers={'Authorization': f'Bearer {self.api_key}'},
-                                       files=files, data=data, timeout=UPLOAD_TIMEOUT)
+            with self.pool.lease() as lease:
+                response = requests.post(f"{lease.endpoint.base_url}/files/upload",
+                                           headers={'Authorization': f'Bearer {lease.endpoint.api_key}'},
+                                           files=files, data=data, timeout=UPLOAD_TIMEOUT)
+                lease.record_status(response.status_code)
 
             if response.status_code in [200, 201]:
                 result = response.json()
@@ -321,8 +467,6 @@ class DifyAPIClient:
 
     def run_workflow_blocking(self, workflow_inputs, user="", max_retries=3):
         """执行工作流（阻塔回复模式）"""
-        workflow_url = f"{self.base_url}/workflows/run"
-
         data = {
             "inputs": workflow_inputs,
             "response_mode": "blocking",
@@ -335,8 +479,11 @@ class DifyAPIClient:
         for attempt in range(max_retries):
             try:
                 print(f"尝试 {attempt + 1}/{max_retries}...")
-                response = requests.post(workflow_url, headers=self.headers,
-                                           json=data, timeout=WORKFLOW_TIMEOUT)
+                with self.pool.lease() as lease:
+                    response = requests.post(f"{lease.endpoint.base_url}/workflows/run",
+                                               headers=lease.endpoint.headers,
+                                               json=data, timeout=WORKFLOW_TIMEOUT)
+                    lease.record_status(response.status_code)
 
                 if response.status_code == 200:
                     result = response.json()
@@ -377,8 +524,6 @@ class DifyAPIClient:
 
     def run_workflow_streaming(self, workflow_inputs, user=""):
         """执行工作流（流式响应）"""
-        workflow_url = f"{self.base_url}/workflows/run"
-
         data = {
             "inputs": workflow_inputs,
             "response_mode": "streaming",
@@ -390,21 +535,24 @@ class DifyAPIClient:
 
         def generate():
             try:
-                response = requests.post(workflow_url, headers=self.headers,
-                                           json=data,
-                                           stream=True,
-                                           timeout=WORKFLOW_TIMEOUT)
-
-                if response.status_code == 200:
-                    for line in response.iter_lines():
-                        line = line.strip()
-                        if line.startswith('data:'):
-                            data = json.loads(line[5:])
-                            print(f"数据: {json.dumps(data, ensure_ascii=False)}")
-                            yield data
-                        elif line == '[DONE]':
-                            print("工作流完成")
-                            break
+                with self.pool.lease() as lease:
+                    response = requests.post(f"{lease.endpoint.base_url}/workflows/run",
+                                               headers=lease.endpoint.headers,
+                                               json=data,
+                                               stream=True,
+                                               timeout=WORKFLOW_TIMEOUT)
+                    lease.record_status(response.status_code)
+
+                    if response.status_code == 200:
+                        for line in response.iter_lines():
+                            line = line.strip()
+                            if line.startswith('data:'):
+                                data = json.loads(line[5:])
+                                print(f"数据: {json.dumps(data, ensure_ascii=False)}")
+                                yield data
+                            elif line == '[DONE]':
+                                print("工作流完成")
+                                break
             except requests.exceptions.Timeout:
                 print("工作流超时")
                 return
@@ -414,14 +562,114 @@ class DifyAPIClient:
 
         return Response(generate(), mimetype='text/event-stream')
 
+    def run_workflow_collect(self, workflow_inputs, user=""):
+        """
+        执行工作流（流式响应），在后端收集全部事件后返回
+
+        使用流式模式避免长时间工作流被网关超时断开；端点在整个流结束前保持占用
+        返回 (outputs, workflow_status, all_data, done_received)，启动失败时抛出 WorkflowStartError
+        """
+        request_data = {
+            "inputs": workflow_inputs,
+            "response_mode": "streaming",
+            "user": user
+        }
+
+        with self.pool.lease() as lease:
+            response = requests.post(f"{lease.endpoint.base_url}/workflows/run",
+                                       headers=lease.endpoint.headers,
+                                       json=request_data,
+                                       stream=True,
+                                       timeout=WORKFLOW_TIMEOUT)
+            lease.record_status(response.status_code)
+
+            if response.status_code != 200:
+                write_log(f"工作流启动失败: {response.status_code}")
+                write_log(f"错误信息: {response.text}")
+                raise WorkflowStartError(response.status_code, response.text)
+
+            write_log("开始接收流式数据...")
+            collector = WorkflowStreamCollector()
+            for line in response.iter_lines():
+                if not collector.feed_line(line):
+                    break
+            response.close()
+
+        return collector.result()
+
+
+class WorkflowCall:
+    """工作流任务发出的一次 Dify 调用"""
+
+    def __init__(self, pool, inputs, user):
+        self.pool = pool
+        self.inputs = inputs
+        self.user = user
+
+
+def run_workflow_task(task):
+    """
+    在当前线程中执行工作流任务
+
+    工作流任务是生成器：准备好输入后 yield WorkflowCall，执行器调用 Dify 并把
+    (outputs, workflow_status, all_data, done_received) 发送回去（调用失败时把异常抛回任务），
+    任务最后 return (响应数据, HTTP 状态码)。asgi_app 用协程执行同一个任务
+    """
+    try:
+        call = next(task)
+        while True:
+            try:
+                result = DifyAPIClient(pool=call.pool).run_workflow_collect(call.inputs, call.user)
+            except Exception as e:
+                call = task.throw(e)
+            else:
+                call = task.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+from image_encoding import EncodedImage, encode_image, image_mime_type, IMAGE_PAYLOAD_BUDGET
+
+
+def image_translation_request(image_b64):
+    """图片翻译的 chat.completions.create 参数（同步、异步客户端共用）"""
+    return {
+        "model": OPENAI_MODEL_NAME,
+        "messages": [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": IMAGE_TRANSLATION_PROMPT},
+                {"type": "image_url", "image_url": {"url": f"data:{image_mime_type(image_b64)};base64,{image_b64}"}}
+            ]
+        }],
+        "extra_headers": {
+            "HTTP-Referer": "https://pdf.local",
+            "X-Title": "PDF-Image-Extractor"
+        },
+        "extra_body": {"modalities": ["image"]},
+        "timeout": 300
+    }
+
+
+from completion_images import extract_images
+from image_delivery import (TranslatedImage, deliver_image, validator_headers, negotiate_image_format,
+                            format_from_ext, format_from_content_type)
+
+# 按 (key, 地址) 复用 OpenAI 客户端及其连接池
+_openai_clients = {}
+
 
 class OpenAIClient:
     """OpenAI API 客户端类（用于图片翻译）"""
 
-    def __init__(self, api_key, base_url="https://openrouter.ai/api/v1"):
-        self.api_key = api_key
-        self.base_url = base_url
-        self.client = OpenAI(base_url=base_url, api_key=api_key)
+    def __init__(self, api_key=None, base_url="https://openrouter.ai/api/v1", pool=None):
+        self.pool = pool or EndpointPool("openai", [Endpoint(api_key, base_url)])
+
+    def _client_for(self, endpoint):
+        key = (endpoint.api_key, endpoint.base_url)
+        if key not in _openai_clients:
+            _openai_clients[key] = OpenAI(base_url=endpoint.base_url, api_key=endpoint.api_key)
+        return _openai_clients[key]
 
     def translate_image(self, image_b64):
         """调用OpenAI API进行图片翻译"""
@@ -429,22 +677,18 @@ class OpenAIClient:
             try:
                 print(f"API调用尝试 {attempt + 1}/{MAX_RETRIES}...")
 
-                completion = self.client.chat.completions.create(
-                    model=OPENAI_MODEL_NAME,
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": IMAGE_TRANSLATION_PROMPT},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}}
-                    ]
-                }],
-                    extra_headers={
-                        "HTTP-Referer": "https://pdf.local",
-                        "X-Title": "PDF-Image-Extractor"
-                    },
-                    extra_body={"modalities": ["image"]},
-                    timeout=300
-                )
+                with self.pool.lease() as lease:
+                    try:
+                        completion = self._client_for(lease.endpoint).chat.completions.create(
+                            **image_translation_request(image_b64)
+                        )
+                    except Exception as e:
+                        # 限流 / 服务端错误 / 连接失败时把这个 key 移出冷却
+                        lease.record_status(getattr(e, 'status_code', None))
+                        if isinstance(e, APIConnectionError):
+                            lease.mark_failed()
+                        raise
+                    lease.record_status(200)
 
                 print("API调用成功!")
                 return completion
@@ -461,119 +705,277 @@ class OpenAIClient:
                     raise
 
     def extract_image_from_completion(self, completion):
-        """从API响应中提取图片"""
-        items = []
-        seen = set()
-
-        def add_http(url):
-            u = url.strip()
-            if u.endswith((")", "]", "}", ",")):
-                u = u.rstrip(")]},")
-            key = ("http", u)
-            if key not in seen:
-                seen.add(key)
-                items.append({"type": "http", "url": u, "fmt": None, "b64": None})
-
-        def add_data(fmt, b64):
-            key = ("data", fmt, b64)
-            if key not in seen:
-                seen.add(key)
-                items.append({"type": "data", "url": None, "fmt": fmt.lower(), "b64": b64})
-
-        def add_from_str(s):
-            for m in re.findall(r"https?://\S+", s):
-                add_http(m)
-            for m in re.findall(r"!\[[^\]]*\]\((https?://[^\)]+)\)", s):
-                add_http(m)
-            for m in re.findall(r"data:image/(png|jpeg|jpg);base64,([A-Za-z0-9+/=]+)", s):
-                add_data(m[0], m[1])
-
-        def walk(x):
-            if isinstance(x, dict):
-                for k, v in x.items():
-                    if isinstance(v, str):
-                        if k.lower() in ("url", "image_url"):
-                            if v.startswith("http") or v.startswith("data:image"):
-                                add_from_str(v)
-                        add_from_str(v)
-                    elif isinstance(v, dict):
-                        if "url" in v and isinstance(v["url"], str):
-                            add_from_str(v["url"])
-                    walk(v)
-            elif isinstance(x, list):
-                for v in x:
-                    walk(v)
-            elif isinstance(x, str):
-                add_from_str(x)
-
-        if hasattr(completion, "model_dump"):
-            obj = completion.model_dump()
-        elif hasattr(completion, "__dict__"):
-            obj = completion.__dict__
-        else:
-            obj = {"raw": str(completion)}
-
-        # 调试日志
-        print(f"[DEBUG] Completion type: {type(completion)}")
-        print(f"[DEBUG] Response keys: {list(obj.keys()) if isinstance(obj, dict) else 'not a dict'}")
-        import json
-        print(f"[DEBUG] Response preview: {json.dumps(obj, ensure_ascii=False)[:500]}...")
-
-        walk(obj)
-        print(f"[DEBUG] Extracted {len(items)} image items")
+        """从API响应中提取图片（只读取已知字段，找不到时再通用扫描）"""
+        items = extract_images(completion)
+        print(f"[Image Extract] 提取到 {len(items)} 项图片")
         return items
 
-    def get_image_from_response(self, completion):
-        """从API响应中获取图片"""
+    def first_image_item(self, completion):
         all_items = self.extract_image_from_completion(completion)
         if not all_items:
             raise Exception("No image found in response")
+        return all_items[0]
 
-        image_item = all_items[0]
+    def open_image_from_response(self, completion):
+        """从API响应中获取图片，远程链接只读取响应头，正文由调用方逐块转发（TranslatedImage）"""
+        image_item = self.first_image_item(completion)
+        if image_item["type"] == "http":
+            upstream = requests.get(image_item["url"], stream=True, timeout=DOWNLOAD_TIMEOUT)
+            try:
+                upstream.raise_for_status()
+            except Exception:
+                upstream.close()
+                raise
+            return TranslatedImage(format_from_content_type(upstream.headers.get("Content-Type")), upstream=upstream)
+        ext = ".jpg" if image_item["fmt"] == "jpeg" else ".png"
+        return TranslatedImage(ext, data=image_item["data"])
+
+    def get_image_from_response(self, completion):
+        """从API响应中获取图片"""
+        image_item = self.first_image_item(completion)
 
         if image_item["type"] == "http":
             r = requests.get(image_item["url"], timeout=DOWNLOAD_TIMEOUT)
             r.raise_for_status()
             return r.content, ".jpg"
         else:
-            fmt = image_item["fmt"]
-            b64 = image_item["b64"]
-            ext = ".jpg" if fmt in ("jpeg", "jpg") else ".png"
-            return base64.b64decode(b64), ext
+            ext = ".jpg" if image_item["fmt"] == "jpeg" else ".png"
+            return image_item["data"], ext
 
 
 def init_dify_client():
     """初始化Dify API客户端（学术报告转公文）"""
-    return DifyAPIClient(ACADEMIC_TO_OFFICIAL_API_KEY, DIFY_BASE_URL)
+    return DifyAPIClient(pool=DIFY_POOLS['academic_convert'])
 
 
 def init_openai_client():
     """初始化OpenAI API客户端（图片翻译）"""
-    return OpenAIClient(OPENAI_API_KEY, OPENAI_API_URL)
+    return OpenAIClient(pool=OPENAI_POOL)
 
 
-def load_and_preprocess_image(image_file):
-    """加载并预处理图片"""
+def _source_bytes(image_file):
+    """读取上传图片的原始字节；内存中的文件直接返回缓冲区视图，避免复制"""
+    stream = getattr(image_file, 'stream', image_file)
+    if isinstance(stream, io.BytesIO):
+        return stream.getbuffer()
+    stream.seek(0)
+    return stream.read()
+
+
+# 图片翻译结果缓存（精确 hash + 感知 hash）
+from image_cache import create_image_translation_cache, fingerprint_image, register_image_cache_routes
+image_translation_cache = create_image_translation_cache(OPENAI_MODEL_NAME, IMAGE_TRANSLATION_PROMPT)
+register_image_cache_routes(app, image_translation_cache)
+
+
+def lookup_translated_image(image_b64):
+    """查询翻译缓存，返回 (指纹, 命中结果)；未启用缓存时都为 None"""
+    if not image_translation_cache:
+        return None, None
+    fingerprint = fingerprint_image(image_b64)
+    cached = image_translation_cache.get(fingerprint)
+    if cached:
+        print(f"图片翻译缓存命中（{cached[2]}）: {fingerprint.exact[:12]}")
+    return fingerprint, cached
+
+
+def store_translated_image(fingerprint, image_bytes, ext):
+    if fingerprint is not None:
+        image_translation_cache.put(fingerprint, image_bytes, ext)
+
+
+def translate_image_cached(image_b64):
+    """翻译预处理后的图片，优先使用缓存，返回 (图片字节, 扩展名, 缓存状态 hit/miss)"""
+    fingerprint, cached = lookup_translated_image(image_b64)
+    if cached:
+        return cached[0], cached[1], 'hit'
+
+    client = init_openai_client()
+    completion = client.translate_image(image_b64)
+    image_bytes, ext = client.get_image_from_response(completion)
+    store_translated_image(fingerprint, image_bytes, ext)
+    return image_bytes, ext, 'miss'
+
+
+def preprocess_image(image_file):
+    """
+    加载并预处理图片，返回 EncodedImage（编码后的字节、格式、尺寸、编码耗时）
+
+    - 已经是 RGB JPEG、尺寸和大小都不超限时直接使用原始字节，不重新编码
+    - 大尺寸 JPEG 使用 draft 模式在解码时按 1/2、1/4、1/8 缩小，其余格式用 reducing_gap 先整数倍缩小再 LANCZOS
+    - 编码按 IMAGE_PAYLOAD_BUDGET 自适应选择格式、质量和尺寸（见 image_encoding）
+    """
+    started_at = time.perf_counter()
     try:
-        im = Image.open(image_file).convert("RGB")
-        w, h = im.size
-
-        m = max(w, h)
-        if m > MAX_IMAGE_SIZE:
-            scale = MAX_IMAGE_SIZE / float(m)
-            new_w, new_h = int(w * scale), int(h * scale)
-            im = im.resize((new_w, new_h), Image.LANCZOS)
-            print(f"Resized: {w}x{h} -> {new_w}x{new_h}")
-
-        buf = io.BytesIO()
-        im.save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
-        b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-        return b64, (w, h)
+        with Image.open(image_file) as src:
+            w, h = src.size
+            m = max(w, h)
+
+            # 带 EXIF 旋转信息的 JPEG 仍然重新编码，保证发送的像素方向和原来一致
+            if (src.format == 'JPEG' and src.mode == 'RGB' and m <= MAX_IMAGE_SIZE
+                    and src.getexif().get(0x0112, 1) == 1):
+                data = _source_bytes(image_file)
+                if len(data) <= min(MAX_PASSTHROUGH_BYTES, IMAGE_PAYLOAD_BUDGET):
+                    return EncodedImage(bytes(data), 'jpeg', (w, h), (w, h),
+                                        encode_ms=(time.perf_counter() - started_at) * 1000)
+
+            if m > MAX_IMAGE_SIZE:
+                scale = MAX_IMAGE_SIZE / float(m)
+                new_w, new_h = int(w * scale), int(h * scale)
+                if src.format == 'JPEG':
+                    src.draft('RGB', (new_w, new_h))
+                im = src.convert("RGB")
+                im = im.resize((new_w, new_h), Image.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+                print(f"Resized: {w}x{h} -> {new_w}x{new_h}")
+            else:
+                im = src.convert("RGB")
+
+        return encode_image(im, (w, h), fixed_quality=JPEG_QUALITY, started_at=started_at)
     except Exception as e:
         print(f"Error processing image: {e}")
         raise
 
 
+def open_translated_image(image_b64):
+    """
+    翻译单张图片，返回 (TranslatedImage, 缓存状态 hit/miss)
+
+    模型返回远程链接时不先下载，由 translated_image_response 逐块转发，读完后再写入翻译缓存
+    """
+    fingerprint, cached = lookup_translated_image(image_b64)
+    if cached:
+        return TranslatedImage(cached[1], data=cached[0]), 'hit'
+
+    client = init_openai_client()
+    completion = client.translate_image(image_b64)
+    result = client.open_image_from_response(completion)
+    result.on_complete = lambda data, ext: store_translated_image(fingerprint, data, ext)
+    if not result.streaming:
+        result.on_complete(result.data, result.ext)
+    return result, 'miss'
+
+
+def load_and_preprocess_image(image_file):
+    """加载并预处理图片，返回 (base64, 原始尺寸)"""
+    encoded = preprocess_image(image_file)
+    return encoded.b64, encoded.original_size
+
+
+# ============= 分块翻译（高分辨率） =============
+# 大尺寸扫描图整体缩到 MAX_IMAGE_SIZE 后小字号无法辨认；分块模式按模型尺寸上限切成互相重叠的小块，
+# 并行翻译后按原分辨率拼回，重叠区域线性渐变融合，避免出现接缝
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "160"))
+TILE_CONCURRENCY = int(os.getenv("TILE_CONCURRENCY", "4"))
+MAX_TILES = 36
+TILED_OUTPUT_QUALITY = 90
+
+_tile_executor = ThreadPoolExecutor(max_workers=TILE_CONCURRENCY, thread_name_prefix="image-tile")
+
+
+def _tile_starts(length, tile, overlap):
+    """一个方向上各块的起点：块数最少且相邻块至少重叠 overlap，起点均匀分布"""
+    if length <= tile:
+        return [0]
+    count = -(-(length - overlap) // (tile - overlap))
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+
+def _tile_mask(size, left_overlap, top_overlap):
+    """拼接蒙版：与左侧、上方已拼好的内容重叠的部分从 0 渐变到 255"""
+    w, h = size
+    mask = Image.new('L', size, 255)
+    if left_overlap > 0:
+        ramp = Image.linear_gradient('L').rotate(90, expand=True)
+        mask.paste(ramp.resize((left_overlap, h)), (0, 0))
+    if top_overlap > 0:
+        ramp = Image.linear_gradient('L').resize((w, top_overlap))
+        mask = ImageChops.darker(mask, _pad_mask(ramp, size))
+    return mask
+
+
+def _pad_mask(ramp, size):
+    padded = Image.new('L', size, 255)
+    padded.paste(ramp, (0, 0))
+    return padded
+
+
+def _translate_tile(tile):
+    """翻译一个小块，返回与输入同尺寸的 RGB 图片、缓存状态和编码结果"""
+    encoded = encode_image(tile, fixed_quality=JPEG_QUALITY, allow_downscale=False)
+    image_bytes, ext, cache_status = translate_image_cached(encoded.b64)
+    with Image.open(io.BytesIO(image_bytes)) as translated:
+        translated = translated.convert("RGB")
+    if translated.size != tile.size:
+        translated = translated.resize(tile.size, Image.LANCZOS)
+    return translated, cache_status, encoded
+
+
+def translate_image_tiled(image_file):
+    """
+    分块翻译，返回 (图片字节, 扩展名, 缓存状态, 编码统计)
+
+    图片不超过 MAX_IMAGE_SIZE 时与普通模式相同
+    """
+    with Image.open(image_file) as src:
+        im = src.convert("RGB")
+    w, h = im.size
+    if max(w, h) <= MAX_IMAGE_SIZE:
+        image_file.seek(0)
+        return translate_upload(image_file)
+
+    xs = _tile_starts(w, MAX_IMAGE_SIZE, TILE_OVERLAP)
+    ys = _tile_starts(h, MAX_IMAGE_SIZE, TILE_OVERLAP)
+    if len(xs) * len(ys) > MAX_TILES:
+        raise ValueError(f"Image too large for tiled mode: {w}x{h}")
+    boxes = [(x, y, min(x + MAX_IMAGE_SIZE, w), min(y + MAX_IMAGE_SIZE, h)) for y in ys for x in xs]
+    print(f"分块翻译: {w}x{h} -> {len(xs)}x{len(ys)} 块")
+
+    futures = [_tile_executor.submit(_translate_tile, im.crop(box)) for box in boxes]
+    try:
+        results = [f.result() for f in futures]
+    finally:
+        for f in futures:
+            f.cancel()
+
+    canvas = Image.new("RGB", (w, h))
+    for (x, y, right, bottom), (translated, _, _) in zip(boxes, results):
+        # 按行优先顺序拼接：左侧和上方的块已经在画布上
+        left_overlap = max((r for (lx, ly, r, b) in boxes if ly == y and r > x and lx < x), default=x) - x
+        top_overlap = max((b for (lx, ly, r, b) in boxes if lx == x and b > y and ly < y), default=y) - y
+        canvas.paste(translated, (x, y), _tile_mask(translated.size, left_overlap, top_overlap))
+
+    buf = io.BytesIO()
+    canvas.save(buf, format="JPEG", quality=TILED_OUTPUT_QUALITY, optimize=True)
+    hits = len([1 for _, status, _ in results if status == 'hit'])
+    cache_status = 'hit' if hits == len(results) else ('partial' if hits else 'miss')
+    encoding = {
+        "format": "tiles",
+        "tiles": len(results),
+        "payload_bytes": sum(encoded.payload_bytes for _, _, encoded in results),
+        "encode_ms": round(sum(encoded.encode_ms for _, _, encoded in results), 1)
+    }
+    return buf.getvalue(), '.jpg', cache_status, encoding
+
+
+def translate_upload(image_file, mode='single'):
+    """按模式翻译上传的图片，返回 (图片字节, 扩展名, 缓存状态, 编码统计)"""
+    if mode == 'tiled':
+        return translate_image_tiled(image_file)
+    encoded = preprocess_image(image_file)
+    print(f"图片编码: {encoded.describe()}")
+    image_bytes, ext, cache_status = translate_image_cached(encoded.b64)
+    return image_bytes, ext, cache_status, encoded.report()
+
+
+def encoding_headers(encoding):
+    """图片编码统计的响应头"""
+    return {
+        'X-Image-Payload-Bytes': str(encoding['payload_bytes']),
+        'X-Image-Encode-Ms': str(encoding['encode_ms']),
+        'X-Image-Encoding': encoding['format'] + (f";q={encoding['quality']}" if encoding.get('quality') else '')
+    }
+
+
 # ============= API 路由 ============
 
 @app.route('/health', methods=['GET'])
@@ -583,6 +985,8 @@ def health():
 
 
 @app.route('/api/dify/upload', methods=['POST'])
+@admission_controlled('upload')
+@scheduled(INTERACTIVE)
 def upload_document():
     """上传文档到Dify"""
     if 'file' not in request.files:
@@ -626,42 +1030,14 @@ def upload_document():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/dify/convert', methods=['POST'])
-def convert_to_official():
-    """调用Dify工作流进行学术报告转公文（使用流式响应避免超时）"""
-    try:
-        data = request.get_json()
-
-        file_id = data.get('file_id')
-        user = data.get('user', 'default')
-        output_format = data.get('output_format', 'docx')
-        style = data.get('style', 'style1')
-
-        if not file_id:
-            return jsonify({"error": "file_id is required"}), 400
-
-        write_log(f"\n{'='*60}")
-        write_log(f"转公文请求: file_id={file_id}, format={output_format}, style={style}")
-        write_log(f"完整请求数据: {json.dumps(data, ensure_ascii=False)}")
-
-        # 创建历史记录
-        import uuid
-        record_id = str(uuid.uuid4())
-        record = {
-            "id": record_id,
-            "user_id": user,
-            "task_type": "academic_convert",
-            "input_file_id": file_id,
-            "input_file_name": data.get('filename', '未知文件'),
-            "status": "processing",
-            "created_at": datetime.now().isoformat(),
-            "extra_params": {
-                "style": style,
-                "output_format": output_format
-            }
-        }
-        add_conversion_record(record)
+def academic_convert_task(record_id, file_id, user, style='style1', output_format='docx',
+                          reference_files=None, artifact_base_url=None):
+    """
+    学术报告转公文任务：执行工作流并更新历史记录
 
+    单文件接口和批量接口共用，返回 (响应数据, HTTP 状态码)
+    """
+    try:
         workflow_inputs = {
             "wenjian": {
                 "type": "document",
@@ -672,7 +1048,7 @@ def convert_to_official():
         }
 
         # 获取参考文件（选填）
-        reference_files = data.get('reference_files', [])
+        reference_files = reference_files or []
         # 即使没有参考文件，也添加 conference_file 字段，设置为 null
         # 这样 Dify 工作流可以判断是否为空的参考文件
         if reference_files:
@@ -689,142 +1065,11 @@ def convert_to_official():
 
         write_log(f"工作流输入: {json.dumps(workflow_inputs, ensure_ascii=False)}")
 
-        client = init_dify_client()
-        
         write_log("使用流式响应模式...")
-        workflow_url = f"{client.base_url}/workflows/run"
-        request_data = {
-            "inputs": workflow_inputs,
-            "response_mode": "streaming",
-            "user": user
-        }
-
-        response = requests.post(workflow_url, headers=client.headers,
-                                   json=request_data,
-                                   stream=True,
-                                   timeout=WORKFLOW_TIMEOUT)
-
-        if response.status_code != 200:
-            write_log(f"工作流启动失败: {response.status_code}")
-            write_log(f"错误信息: {response.text}")
-            return jsonify({"error": "Failed to start workflow"}), 500
-
-        outputs = []
-        workflow_status = None
-        all_data = []
-        
-        write_log("开始接收流式数据...")
-        last_data_time = time.time()
-        timeout_seconds = 1800
-        done_received = False
-        
-        for line in response.iter_lines():
-            if isinstance(line, bytes):
-                line = line.decode('utf-8')
-            line = line.strip()
-            
-            if time.time() - last_data_time > timeout_seconds:
-                write_log(f"接收数据超时，最后数据时间: {last_data_time}")
-                break
-            
-            if line.startswith('data:'):
-                try:
-                    data = json.loads(line[5:])
-                    all_data.append(data)
-                    last_data_time = time.time()
-                    write_log(f"收到数据: {json.dumps(data, ensure_ascii=False)}")
-
-                    if 'status' in data:
-                        workflow_status = data['status']
-                        write_log(f"工作流状态: {workflow_status}")
-
-                    if 'event' in data and data['event'] == 'node_finished':
-                        # 检查节点是否失败
-                        node_status = data.get('data', {}).get('status', 'unknown')
-                        node_id = data.get('data', {}).get('node_id', 'unknown')
-                        write_log(f"节点完成: node_id={node_id}, status={node_status}")
-
-                        # 检查是否有错误信息
-                        if 'data' in data:
-                            if 'error' in data['data']:
-                                write_log(f"节点错误: {data['data']['error']}")
-                            if 'outputs' in data['data']:
-                                current_outputs = data['data']['outputs']
-                                if isinstance(current_outputs, dict):
-                                    for key, value in current_outputs.items():
-                                        outputs.append(value)
-                                    write_log(f"收到输出(字典): {len(current_outputs)} 个, 总输出数: {len(outputs)} 个, 键: {list(current_outputs.keys())}")
-                                else:
-                                    for output in current_outputs:
-                                        outputs.append(output)
-                                    write_log(f"收到输出(列表): {len(current_outputs)} 个, 总输出数: {len(outputs)} 个, 内容: {json.dumps(current_outputs, ensure_ascii=False)}")
-
-                    if 'event' in data and data['event'] == 'workflow_finished':
-                        if 'data' in data and 'outputs' in data['data']:
-                            workflow_outputs = data['data']['outputs']
-                            write_log(f"工作流完成，最终输出: {json.dumps(workflow_outputs, ensure_ascii=False)}")
-                            
-                            if isinstance(workflow_outputs, dict):
-                                for key, value in workflow_outputs.items():
-                                    outputs.append(value)
-                                write_log(f"收到工作流输出(字典): {len(workflow_outputs)} 个, 总输出数: {len(outputs)} 个, 键: {list(workflow_outputs.keys())}")
-                            else:
-                                for output in workflow_outputs:
-                                    outputs.append(output)
-                                write_log(f"收到工作流输出(列表): {len(workflow_outputs)} 个, 总输出数: {len(outputs)} 个, 内容: {json.dumps(workflow_outputs, ensure_ascii=False)}")
-                        
-                        if 'data' in data and 'status' in data['data']:
-                            workflow_status = data['data']['status']
-                            write_log(f"工作流最终状态: {workflow_status}")
-                    
-                    if 'event' in data and data['event'] == 'workflow_finished':
-                        if 'data' in data and 'outputs' in data['data']:
-                            workflow_outputs = data['data']['outputs']
-                            write_log(f"工作流完成，最终输出: {json.dumps(workflow_outputs, ensure_ascii=False)}")
-                            
-                            if isinstance(workflow_outputs, dict):
-                                for key, value in workflow_outputs.items():
-                                    outputs.append(value)
-                                write_log(f"收到工作流输出(字典): {len(workflow_outputs)} 个, 总输出数: {len(outputs)} 个, 键: {list(workflow_outputs.keys())}")
-                            else:
-                                for output in workflow_outputs:
-                                    outputs.append(output)
-                                write_log(f"收到工作流输出(列表): {len(workflow_outputs)} 个, 总输出数: {len(outputs)} 个, 内容: {json.dumps(workflow_outputs, ensure_ascii=False)}")
-                        
-                        if 'data' in data and 'status' in data['data']:
-                            workflow_status = data['data']['status']
-                            write_log(f"工作流最终状态: {workflow_status}")
-                    
-                    if 'event' in data and data['event'] == 'workflow_finished':
-                        if 'data' in data and 'outputs' in data['data']:
-                            workflow_outputs = data['data']['outputs']
-                            write_log(f"工作流完成，最终输出: {json.dumps(workflow_outputs, ensure_ascii=False)}")
-                            
-                            if isinstance(workflow_outputs, dict):
-                                for key, value in workflow_outputs.items():
-                                    outputs.append(value)
-                                write_log(f"收到工作流输出(字典): {len(workflow_outputs)} 个, 总输出数: {len(outputs)} 个, 键: {list(workflow_outputs.keys())}")
-                            else:
-                                for output in workflow_outputs:
-                                    outputs.append(output)
-                                write_log(f"收到工作流输出(列表): {len(workflow_outputs)} 个, 总输出数: {len(outputs)} 个, 内容: {json.dumps(workflow_outputs, ensure_ascii=False)}")
-                        
-                        if 'data' in data and 'status' in data['data']:
-                            workflow_status = data['data']['status']
-                            write_log(f"工作流最终状态: {workflow_status}")
-                    
-                except json.JSONDecodeError as e:
-                    write_log(f"解析数据行失败: {e}, 行内容: {line}")
-            
-            elif line == '[DONE]':
-                write_log("工作流完成")
-                done_received = True
-                break
-        
-        write_log(f"最终状态: {workflow_status}")
-        write_log(f"最终输出: {len(outputs)} 个")
-        write_log(f"所有数据: {len(all_data)} 条")
-        write_log(f"是否收到DONE: {done_received}")
+        try:
+            outputs, workflow_status, all_data, done_received = yield WorkflowCall(DIFY_POOLS['academic_convert'], workflow_inputs, user)
+        except WorkflowStartError:
+            return {"error": "Failed to start workflow"}, 500
         
         success_statuses = ['succeeded', 'success', 'completed', 'finished', 'running']
         failed_statuses = ['failed']
@@ -850,22 +1095,26 @@ def convert_to_official():
                 if isinstance(output, dict):
                     if output.get('remote_url'):
                         write_log(f"从failed状态直接提取remote_url: {output.get('remote_url')}")
-                        return jsonify({
+                        output_url = rehost_remote_file(output.get('remote_url'), output.get('filename'), base_url=artifact_base_url)
+                        update_conversion_record(record_id, 'completed', output_url)
+                        return {
                             "success": True,
-                            "output_url": output.get('remote_url'),
+                            "output_url": output_url,
                             "filename": output.get('filename', f"converted_document.{output_format}")
-                        })
+                        }, 200
                 # 处理列表类型（当输出是数组时）
                 elif isinstance(output, list) and len(output) > 0:
                     first_item = output[0]
                     write_log(f"Failed状态输出是列表，第一个元素: {json.dumps(first_item, ensure_ascii=False)[:200]}")
                     if isinstance(first_item, dict) and first_item.get('remote_url'):
                         write_log(f"从failed状态列表提取remote_url: {first_item.get('remote_url')}")
-                        return jsonify({
+                        output_url = rehost_remote_file(first_item.get('remote_url'), first_item.get('filename'), base_url=artifact_base_url)
+                        update_conversion_record(record_id, 'completed', output_url)
+                        return {
                             "success": True,
-                            "output_url": first_item.get('remote_url'),
+                            "output_url": output_url,
                             "filename": first_item.get('filename', f"converted_document.{output_format}")
-                        })
+                        }, 200
 
             output_url = ''
             if isinstance(output, str):
@@ -940,13 +1189,15 @@ def convert_to_official():
 
             if output_url:
                 write_log(f"✓ 返回成功，输出URL: {output_url}")
+                # 转存到本地产物缓存，之后的下载和历史预览不再回源 Dify
+                output_url = rehost_remote_file(output_url, f"converted_document.{output_format}", base_url=artifact_base_url)
                 # 更新历史记录
                 update_conversion_record(record_id, 'completed', output_url)
-                return jsonify({
+                return {
                     "success": True,
                     "output_url": output_url,
                     "filename": f"converted_document.{output_format}"
-                })
+                }, 200
             else:
                 # 详细调试信息
                 write_log(f"✗ 输出URL为空！")
@@ -1020,11 +1271,13 @@ def convert_to_official():
 
                     if output_url:
                         write_log(f"✓ 从历史数据中找到输出，返回成功，输出URL: {output_url}")
-                        return jsonify({
+                        output_url = rehost_remote_file(output_url, f"converted_document.{output_format}", base_url=artifact_base_url)
+                        update_conversion_record(record_id, 'completed', output_url)
+                        return {
                             "success": True,
                             "output_url": output_url,
                             "filename": f"converted_document.{output_format}"
-                        })
+                        }, 200
                     break
         
         write_log(f"✗ 返回错误：状态={workflow_status}, 输出数={len(outputs)}, 状态是否成功={workflow_status in success_statuses}")
@@ -1036,21 +1289,531 @@ def convert_to_official():
 
         # 更新历史记录为失败
         update_conversion_record(record_id, 'error', None, error_msg)
-        return jsonify({"error": error_msg}), 500
+        return {"error": error_msg}, 500
 
     except requests.exceptions.Timeout:
         write_log(f"转换超时")
         # 更新历史记录为失败
         update_conversion_record(record_id, 'error', None, "Conversion timeout")
-        return jsonify({"error": "Conversion timeout"}), 500
+        return {"error": "Conversion timeout"}, 500
     except Exception as e:
         write_log(f"转换异常: {e}")
         # 更新历史记录为失败
         update_conversion_record(record_id, 'error', None, str(e))
+        return {"error": str(e)}, 500
+
+
+def run_academic_convert(record_id, file_id, user, style='style1', output_format='docx',
+                         reference_files=None, artifact_base_url=None):
+    """同步执行转公文任务（批量接口的工作流阶段使用）"""
+    return run_workflow_task(academic_convert_task(record_id, file_id, user, style, output_format,
+                                                   reference_files, artifact_base_url))
+
+
+def convert_task(data, artifact_base_url=None):
+    """转公文请求任务：创建历史记录后执行转公文工作流"""
+    file_id = data.get('file_id')
+    user = data.get('user', 'default')
+    output_format = data.get('output_format', 'docx')
+    style = data.get('style', 'style1')
+
+    if not file_id:
+        return {"error": "file_id is required"}, 400
+
+    write_log(f"\n{'='*60}")
+    write_log(f"转公文请求: file_id={file_id}, format={output_format}, style={style}")
+    write_log(f"完整请求数据: {json.dumps(data, ensure_ascii=False)}")
+
+    # 创建历史记录
+    record_id = str(uuid.uuid4())
+    record = {
+        "id": record_id,
+        "user_id": user,
+        "task_type": "academic_convert",
+        "input_file_id": file_id,
+        "input_file_name": data.get('filename', '未知文件'),
+        "status": "processing",
+        "created_at": datetime.now().isoformat(),
+        "extra_params": {
+            "style": style,
+            "output_format": output_format
+        }
+    }
+    add_conversion_record(record)
+
+    return (yield from academic_convert_task(record_id, file_id, user, style, output_format,
+                                             data.get('reference_files', []), artifact_base_url))
+
+
+@app.route('/api/dify/convert', methods=['POST'])
+@idempotent
+@admission_controlled('academic_convert')
+@scheduled(BATCH)
+def convert_to_official():
+    """调用Dify工作流进行学术报告转公文（使用流式响应避免超时）"""
+    try:
+        payload, status_code = run_workflow_task(convert_task(request.get_json(), current_base_url()))
+        return jsonify(payload), status_code
+    except Exception as e:
+        write_log(f"转换异常: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# ============= 批量转公文 =============
+# 上传阶段和工作流阶段分别使用独立的线程池，上传完成的文件立即进入工作流阶段（流水线）
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))
+BATCH_WORKFLOW_CONCURRENCY = int(os.getenv("BATCH_WORKFLOW_CONCURRENCY", "2"))
+MAX_BATCH_FILES = 50
+ALLOWED_DOCUMENT_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt', 'rtf'}
+
+_batch_upload_executor = ThreadPoolExecutor(max_workers=BATCH_UPLOAD_CONCURRENCY, thread_name_prefix="batch-upload")
+_batch_workflow_executor = ThreadPoolExecutor(max_workers=BATCH_WORKFLOW_CONCURRENCY, thread_name_prefix="batch-workflow")
+
+
+def library_document_url(doc_id):
+    """查询文献库文档的下载地址，返回 (地址, 文件名)"""
+    doc = get_document_row(doc_id)
+    if not doc:
+        raise Exception(f"Document not found: {doc_id}")
+
+    filename = os.path.basename(doc.get('filename') or '') or f"{doc_id}.pdf"
+    if '.' not in filename:
+        filename = f"{filename}.pdf"
+    return doc.get('source_url') or get_storage_url(doc.get('filename')), filename
+
+
+def download_library_document(doc_id, workdir):
+    """把文献库中的文档下载到临时目录，返回 (本地路径, 文件名)"""
+    file_url, filename = library_document_url(doc_id)
+
+    path = os.path.join(workdir, filename)
+    with requests.get(file_url, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+        r.raise_for_status()
+        with open(path, 'wb') as f:
+            for chunk in r.iter_content(64 * 1024):
+                f.write(chunk)
+    return path, filename
+
+
+def _finish_batch_item(job, index, **fields):
+    """结束一个子项；全部结束后更新父记录"""
+    job.update_item(index, **fields)
+    if job.finished_at is not None:
+        summary = job.to_dict()
+        error_message = None
+        if summary['status'] == 'error':
+            error_message = f"全部 {summary['total']} 个文件转换失败"
+        update_conversion_record(job.id, summary['status'], None, error_message,
+                                 f"成功 {summary['succeeded']} 个，失败 {summary['failed']} 个")
+        write_log(f"批量转换完成: job={job.id}, 成功={summary['succeeded']}, 失败={summary['failed']}")
+
+
+def _batch_convert_stage(job, index, artifact_base_url):
+    """工作流阶段：执行转公文工作流"""
+    item = job.items[index]
+    params = job.params
+    job.update_item(index, status='converting')
+    try:
+        payload, status_code = run_academic_convert(item['record_id'], item['file_id'], job.user,
+                                                     params['style'], params['output_format'],
+                                                     params['reference_files'], artifact_base_url)
+    except Exception as e:
+        payload, status_code = {"error": str(e)}, 500
+
+    if status_code == 200:
+        _finish_batch_item(job, index, status='completed',
+                           output_url=payload.get('output_url'), filename=payload.get('filename'))
+    else:
+        _finish_batch_item(job, index, status='error', error=payload.get('error'))
+
+
+def _batch_upload_stage(job, index, artifact_base_url):
+    """上传阶段：准备本地文件并上传到 Dify，完成后提交到工作流阶段"""
+    item = job.items[index]
+    workdir = item.pop('workdir', None)
+    try:
+        if not item.get('file_id'):
+            job.update_item(index, status='uploading')
+            if item.get('document_id'):
+                workdir = workdir or tempfile.mkdtemp(prefix='batch_')
+                path, filename = download_library_document(item['document_id'], workdir)
+                job.update_item(index, filename=filename)
+            else:
+                path = item['path']
+
+            file_id = init_dify_client().upload_file(path, job.user)
+            if not file_id:
+                raise Exception("Failed to upload file")
+            job.update_item(index, file_id=file_id)
+
+        job.update_item(index, status='queued')
+        _batch_workflow_executor.submit(_batch_convert_stage, job, index, artifact_base_url)
+    except Exception as e:
+        write_log(f"批量转换上传失败: job={job.id}, index={index}, 错误={e}")
+        update_conversion_record(item['record_id'], 'error', None, str(e))
+        _finish_batch_item(job, index, status='error', error=str(e))
+    finally:
+        job.items[index].pop('path', None)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+@app.route('/api/dify/convert-batch', methods=['POST'])
+@admission_controlled('academic_convert')
+def convert_batch():
+    """
+    批量转公文
+
+    请求参数（multipart/form-data 或 JSON）：
+    - files: 多个文件（multipart）
+    - document_ids: 文献库文档 ID 列表
+    - file_ids: 已上传到 Dify 的文件 ID 列表
+    - style / output_format / reference_files / user
+
+    立即返回任务 ID，通过 /api/jobs/<job_id>/events 逐个接收结果
+    """
+    items, submitted = [], False
+    try:
+        if request.files:
+            form = request.form
+            data = {
+                "user": form.get('user', 'default'),
+                "style": form.get('style', 'style1'),
+                "output_format": form.get('output_format', 'docx'),
+                "reference_files": [f for f in form.get('reference_files', '').split(',') if f],
+                "document_ids": [d for d in form.get('document_ids', '').split(',') if d],
+                "file_ids": [],
+            }
+        else:
+            data = request.get_json() or {}
+
+        user = data.get('user', 'default')
+        style = data.get('style', 'style1')
+        output_format = data.get('output_format', 'docx')
+        reference_files = data.get('reference_files', [])
+        uploads = request.files.getlist('files')
+        document_ids = data.get('document_ids', [])
+        file_ids = data.get('file_ids', [])
+
+        total = len(uploads) + len(document_ids) + len(file_ids)
+        if total == 0:
+            return jsonify({"error": "No files provided"}), 400
+        if total > MAX_BATCH_FILES:
+            return jsonify({"error": f"Too many files. Maximum {MAX_BATCH_FILES} allowed"}), 400
+
+        # 先检查全部文件类型，再保存到临时目录
+        for upload in uploads:
+            filename = os.path.basename(upload.filename or '')
+            ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+            if ext not in ALLOWED_DOCUMENT_EXTENSIONS:
+                return jsonify({"error": f"Invalid file type: {filename}"}), 400
+
+        try:
+            for upload in uploads:
+                filename = os.path.basename(upload.filename or '')
+                # 请求结束后上传的文件流会被关闭，先保存到临时目录
+                workdir = tempfile.mkdtemp(prefix='batch_')
+                items.append({"filename": filename, "path": os.path.join(workdir, filename), "workdir": workdir})
+                upload.save(items[-1]['path'])
+                if os.path.getsize(items[-1]['path']) > 50 * 1024 * 1024:
+                    raise ValueError(f"File too large: {filename}. Maximum 50MB allowed")
+        except Exception as e:
+            # 已保存的文件不会进入任务，全部清理
+            for item in items:
+                shutil.rmtree(item['workdir'], ignore_errors=True)
+            return jsonify({"error": str(e)}), 400 if isinstance(e, ValueError) else 500
+        for doc_id in document_ids:
+            items.append({"filename": doc_id, "document_id": doc_id})
+        for file_id in file_ids:
+            items.append({"filename": file_id, "file_id": file_id})
+
+        job = BatchJob('academic_convert_batch', items, user=user, params={
+            "style": style,
+            "output_format": output_format,
+            "reference_files": reference_files
+        })
+
+        write_log(f"\n{'='*60}")
+        write_log(f"批量转公文请求: job={job.id}, 文件数={total}, style={style}")
+
+        # 父记录 + 子记录
+        add_conversion_record({
+            "id": job.id,
+            "user_id": user,
+            "task_type": "academic_convert_batch",
+            "input_file_id": None,
+            "input_file_name": f"批量转换（{total} 个文件）",
+            "status": "processing",
+            "created_at": datetime.now().isoformat(),
+            "extra_params": {"style": style, "output_format": output_format, "count": total}
+        })
+        for item in job.items:
+            item['record_id'] = str(uuid.uuid4())
+            add_conversion_record({
+                "id": item['record_id'],
+                "parent_id": job.id,
+                "user_id": user,
+                "task_type": "academic_convert",
+                "input_file_id": item.get('file_id'),
+                "input_file_name": item['filename'],
+                "status": "processing",
+                "created_at": datetime.now().isoformat(),
+                "extra_params": {"style": style, "output_format": output_format}
+            })
+
+        job_store.add(job)
+        # 准入名额在整个任务期间占用，任务结束后归还，后台的工作流同样受并发上限约束
+        job.on_finish(hold_admission_slot())
+        artifact_base_url = current_base_url()
+        submitted = True
+        for index in range(len(job.items)):
+            _batch_upload_executor.submit(_batch_upload_stage, job, index, artifact_base_url)
+
+        return jsonify({
+            "success": True,
+            "job_id": job.id,
+            "total": total,
+            "status_url": f"/api/jobs/{job.id}",
+            "events_url": f"/api/jobs/{job.id}/events"
+        }), 202
+
+    except Exception as e:
+        write_log(f"批量转换异常: {e}")
+        if not submitted:
+            for item in items:
+                if item.get('workdir'):
+                    shutil.rmtree(item['workdir'], ignore_errors=True)
+        return jsonify({"error": str(e)}), 500
+
+
+# ============= 文档流水线 =============
+# 上传 → 翻译 → 转公文 → 转存 在服务端连续执行；每一步的产物保存在产物缓存中，直接作为下一步的输入
+
+def _pipeline_document(artifact_hash, filename):
+    """产物缓存中的文件作为流水线文档"""
+    if not artifact_cache.path(artifact_hash):
+        raise Exception(f"Artifact not found: {artifact_hash}")
+    return {"filename": filename, "identity": artifact_hash, "artifact_hash": artifact_hash, "file_id": None}
+
+
+def _pipeline_output_document(output, filename):
+    """把工作流输出（产物地址、远程地址或文本）转成流水线文档"""
+    artifact_hash = artifact_hash_from_url(output)
+    if not artifact_hash and isinstance(output, str) and output.startswith(("http://", "https://")):
+        artifact_hash = artifact_cache.fetch_url(output, filename=filename)
+    if not artifact_hash:
+        # 文本输出保存为 txt，之后的步骤按文档处理
+        filename = f"{os.path.splitext(filename)[0]}.txt"
+        artifact_hash = artifact_cache.put_bytes((output or '').encode('utf-8'), filename=filename,
+                                                 mimetype='text/plain; charset=utf-8')
+    meta = artifact_cache.meta(artifact_hash) or {}
+    return _pipeline_document(artifact_hash, meta.get('filename') or filename)
+
+
+def _pipeline_ensure_uploaded(doc, user):
+    """确保文档已上传到 Dify，返回是否命中缓存"""
+    if doc['file_id']:
+        return True
+    key = stage_key('upload', doc['identity'])
+    cached = stage_cache.get(key)
+    if cached:
+        doc['file_id'] = cached['file_id']
+        return True
+
+    with open(artifact_cache.path(doc['artifact_hash']), 'rb') as f:
+        file_id = init_dify_client().upload_file(FileStorage(stream=f, filename=doc['filename']), user)
+    if not file_id:
+        raise Exception("Failed to upload file")
+    doc['file_id'] = file_id
+    stage_cache.put(key, {"file_id": file_id})
+    return False
+
+
+def _pipeline_upload(doc, job, artifact_base_url):
+    return doc, _pipeline_ensure_uploaded(doc, job.user)
+
+
+def _pipeline_translate(doc, job, artifact_base_url):
+    key = stage_key('translate', doc['identity'])
+    cached = stage_cache.get(key)
+    if cached and artifact_cache.path(cached['artifact_hash']):
+        return _pipeline_document(cached['artifact_hash'], cached['filename']), True
+
+    _pipeline_ensure_uploaded(doc, job.user)
+    payload, status_code = run_workflow_task(translate_document_task(
+        {"file_id": doc['file_id'], "user": job.user, "filename": doc['filename']}, artifact_base_url))
+    if status_code != 200:
+        raise Exception(payload.get('error', 'Translation failed'))
+
+    stem = os.path.splitext(doc['filename'])[0]
+    output = payload.get('translated_content') or payload.get('output_url')
+    result = _pipeline_output_document(output, payload.get('filename') or f"{stem}_translated.docx")
+    stage_cache.put(key, {"artifact_hash": result['artifact_hash'], "filename": result['filename']})
+    return result, False
+
+
+def _pipeline_convert(doc, job, artifact_base_url):
+    params = job.params
+    key = stage_key('convert', doc['identity'], params['style'], params['output_format'], params['reference_files'])
+    cached = stage_cache.get(key)
+    if cached and artifact_cache.path(cached['artifact_hash']):
+        return _pipeline_document(cached['artifact_hash'], cached['filename']), True
+
+    _pipeline_ensure_uploaded(doc, job.user)
+    payload, status_code = run_workflow_task(convert_task({
+        "file_id": doc['file_id'],
+        "user": job.user,
+        "filename": doc['filename'],
+        "style": params['style'],
+        "output_format": params['output_format'],
+        "reference_files": params['reference_files']
+    }, artifact_base_url))
+    if status_code != 200:
+        raise Exception(payload.get('error', 'Conversion failed'))
+
+    result = _pipeline_output_document(payload.get('output_url'), payload.get('filename'))
+    stage_cache.put(key, {"artifact_hash": result['artifact_hash'], "filename": result['filename']})
+    return result, False
+
+
+def _pipeline_rehost(doc, job, artifact_base_url):
+    # 前面的步骤已经把产物保存在本地缓存中，这里只确认文件可用
+    if not doc.get('artifact_hash'):
+        raise Exception("Nothing to re-host: input was an uploaded file_id without any processing stage")
+    return _pipeline_document(doc['artifact_hash'], doc['filename']), True
+
+
+PIPELINE_STAGE_HANDLERS = {
+    'upload': _pipeline_upload,
+    'translate': _pipeline_translate,
+    'convert': _pipeline_convert,
+    'rehost': _pipeline_rehost,
+}
+
+
+def run_pipeline(job, source, artifact_base_url):
+    """依次执行流水线的每一步；某一步失败时后续步骤全部标记为跳过"""
+    index = 0
+    try:
+        if source.get('document_id'):
+            file_url, filename = library_document_url(source['document_id'])
+            doc = _pipeline_document(artifact_cache.fetch_url(file_url, filename=filename), filename)
+        elif source.get('artifact_hash'):
+            doc = _pipeline_document(source['artifact_hash'], source['filename'])
+        else:
+            doc = {"filename": source['filename'], "identity": f"file:{source['file_id']}",
+                   "artifact_hash": None, "file_id": source['file_id']}
+
+        for index, item in enumerate(job.items):
+            job.update_item(index, status='running')
+            started_at = time.time()
+            doc, cached = PIPELINE_STAGE_HANDLERS[item['stage']](doc, job, artifact_base_url)
+            write_log(f"流水线 {job.id}: {item['stage']} 完成, 缓存={cached}, 耗时={time.time() - started_at:.1f}s")
+            job.update_item(index, status='completed', cached=cached,
+                            filename=doc['filename'], file_id=doc.get('file_id'),
+                            output_url=artifact_url(doc['artifact_hash'], artifact_base_url) if doc.get('artifact_hash') else None)
+    except Exception as e:
+        write_log(f"流水线 {job.id}: {job.items[index]['stage']} 失败: {e}")
+        job.update_item(index, status='error', error=str(e))
+        for rest in range(index + 1, len(job.items)):
+            job.update_item(rest, status='error', error='Skipped: previous stage failed')
+
+
+@app.route('/api/pipelines', methods=['POST'])
+@admission_controlled('pipeline')
+def create_pipeline():
+    """
+    创建文档流水线
+
+    请求参数（multipart/form-data 或 JSON）：
+    - file: 文件（multipart），或 document_id（文献库文档）/ file_id（已上传到 Dify 的文件）
+    - stages: 步骤列表，按 upload、translate、convert、rehost 的顺序选取，默认全部
+    - style / output_format / reference_files / user：转公文参数
+
+    立即返回任务 ID，通过 /api/jobs/<job_id>/events 接收每一步的结果
+    """
+    try:
+        upload = request.files.get('file')
+        if upload:
+            form = request.form
+            data = {
+                "user": form.get('user', 'default'),
+                "stages": form.get('stages'),
+                "style": form.get('style', 'style1'),
+                "output_format": form.get('output_format', 'docx'),
+                "reference_files": [f for f in form.get('reference_files', '').split(',') if f],
+            }
+        else:
+            data = request.get_json() or {}
+
+        stages, error = parse_stages(data.get('stages'))
+        if error:
+            return jsonify({"error": error}), 400
+
+        if upload:
+            filename = os.path.basename(upload.filename or '')
+            ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+            if ext not in ALLOWED_DOCUMENT_EXTENSIONS:
+                return jsonify({"error": f"Invalid file type: {filename}"}), 400
+            if (request.content_length or 0) > 50 * 1024 * 1024:
+                return jsonify({"error": "File too large. Maximum 50MB allowed"}), 400
+            # 上传的文件直接保存到产物缓存，之后按内容 hash 复用各步骤的结果
+            artifact_hash = artifact_cache.put_stream(iter(lambda: upload.stream.read(64 * 1024), b''),
+                                                      filename=filename, mimetype=upload.mimetype)
+            source = {"artifact_hash": artifact_hash, "filename": filename}
+        elif data.get('document_id'):
+            source = {"document_id": data['document_id']}
+        elif data.get('file_id'):
+            source = {"file_id": data['file_id'], "filename": data.get('filename', '未知文件')}
+        else:
+            return jsonify({"error": "file, document_id or file_id is required"}), 400
+
+        user = data.get('user', 'default')
+        job = BatchJob('pipeline', [{"stage": stage} for stage in stages], user=user, params={
+            "stages": stages,
+            "style": data.get('style', 'style1'),
+            "output_format": data.get('output_format', 'docx'),
+            "reference_files": data.get('reference_files', [])
+        }, require_all=True)
+
+        # 准入名额在整个流水线期间占用（包括在 BATCH 队列中等待），所有步骤结束后归还
+        release = hold_admission_slot()
+        job.on_finish(release)
+        try:
+            scheduler.submit(BATCH, run_pipeline, job, source, current_base_url())
+        except Exception as e:
+            # 任务没有启动，名额立即归还
+            release()
+            if not isinstance(e, SchedulerBusy):
+                raise
+            response = jsonify({
+                "error": "Server is busy, please retry later",
+                "workload": e.workload,
+                "retry_after": e.retry_after
+            })
+            response.status_code = 503
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        job_store.add(job)
+
+        write_log(f"\n{'='*60}")
+        write_log(f"流水线请求: job={job.id}, 步骤={' → '.join(stages)}")
+
+        return jsonify({
+            "success": True,
+            "job_id": job.id,
+            "stages": stages,
+            "status_url": f"/api/jobs/{job.id}",
+            "events_url": f"/api/jobs/{job.id}/events"
+        }), 202
+
+    except Exception as e:
+        write_log(f"流水线创建异常: {e}")
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/api/dify/convert-stream', methods=['POST'])
+@admission_controlled('academic_convert')
 def convert_to_official_streaming():
     """流式版本的文档转公文接口"""
     try:
@@ -1082,17 +1845,14 @@ def convert_to_official_streaming():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/dify/translate-document', methods=['POST'])
-def translate_document():
-    """文档翻译接口"""
+def translate_document_task(data, artifact_base_url=None):
+    """文档翻译任务，返回 (响应数据, HTTP 状态码)"""
     try:
-        data = request.get_json()
-
         file_id = data.get('file_id')
         user = data.get('user', 'default')
 
         if not file_id:
-            return jsonify({"error": "file_id is required"}), 400
+            return {"error": "file_id is required"}, 400
 
         write_log(f"\n{'='*60}")
         write_log(f"文档翻译请求: file_id={file_id}")
@@ -1119,79 +1879,11 @@ def translate_document():
             }
         }
 
-        client = DifyAPIClient(TRANSLATE_API_KEY, DIFY_BASE_URL)
-        
         write_log("使用流式响应模式...")
-        workflow_url = f"{client.base_url}/workflows/run"
-        request_data = {
-            "inputs": workflow_inputs,
-            "response_mode": "streaming",
-            "user": user
-        }
-
-        response = requests.post(workflow_url, headers=client.headers,
-                                   json=request_data,
-                                   stream=True,
-                                   timeout=WORKFLOW_TIMEOUT)
-
-        if response.status_code != 200:
-            write_log(f"工作流启动失败: {response.status_code}")
-            write_log(f"错误信息: {response.text}")
-            return jsonify({"error": "Failed to start workflow"}), 500
-
-        outputs = []
-        workflow_status = None
-        all_data = []
-        
-        write_log("开始接收流式数据...")
-        last_data_time = time.time()
-        timeout_seconds = 1800
-        done_received = False
-        
-        for line in response.iter_lines():
-            if isinstance(line, bytes):
-                line = line.decode('utf-8')
-            line = line.strip()
-            
-            if time.time() - last_data_time > timeout_seconds:
-                write_log(f"接收数据超时，最后数据时间: {last_data_time}")
-                break
-            
-            if line.startswith('data:'):
-                try:
-                    data = json.loads(line[5:])
-                    all_data.append(data)
-                    last_data_time = time.time()
-                    write_log(f"收到数据: {json.dumps(data, ensure_ascii=False)}")
-                    
-                    if 'status' in data:
-                        workflow_status = data['status']
-                        write_log(f"工作流状态: {workflow_status}")
-                    
-                    if 'event' in data and data['event'] == 'node_finished':
-                        if 'data' in data and 'outputs' in data['data']:
-                            current_outputs = data['data']['outputs']
-                            if isinstance(current_outputs, dict):
-                                for key, value in current_outputs.items():
-                                    outputs.append(value)
-                                write_log(f"收到输出(字典): {len(current_outputs)} 个, 总输出数: {len(outputs)} 个, 键: {list(current_outputs.keys())}")
-                            else:
-                                for output in current_outputs:
-                                    outputs.append(output)
-                                write_log(f"收到输出(列表): {len(current_outputs)} 个, 总输出数: {len(outputs)} 个, 内容: {json.dumps(current_outputs, ensure_ascii=False)}")
-                    
-                except json.JSONDecodeError as e:
-                    write_log(f"解析数据行失败: {e}, 行内容: {line}")
-            
-            elif line == '[DONE]':
-                write_log("工作流完成")
-                done_received = True
-                break
-        
-        write_log(f"最终状态: {workflow_status}")
-        write_log(f"最终输出: {len(outputs)} 个")
-        write_log(f"所有数据: {len(all_data)} 条")
-        write_log(f"是否收到DONE: {done_received}")
+        try:
+            outputs, workflow_status, all_data, done_received = yield WorkflowCall(DIFY_POOLS['academic_translate'], workflow_inputs, user)
+        except WorkflowStartError:
+            return {"error": "Failed to start workflow"}, 500
         
         success_statuses = ['succeeded', 'success', 'completed', 'finished', 'running']
         failed_statuses = ['failed']
@@ -1217,22 +1909,22 @@ def translate_document():
                 if isinstance(output, dict):
                     if output.get('remote_url'):
                         write_log(f"从failed状态直接提取remote_url: {output.get('remote_url')}")
-                        return jsonify({
+                        return {
                             "success": True,
-                            "output_url": output.get('remote_url'),
+                            "output_url": rehost_remote_file(output.get('remote_url'), output.get('filename'), base_url=artifact_base_url),
                             "filename": output.get('filename', f"converted_document.{output_format}")
-                        })
+                        }, 200
                 # 处理列表类型（当输出是数组时）
                 elif isinstance(output, list) and len(output) > 0:
                     first_item = output[0]
                     write_log(f"Failed状态输出是列表，第一个元素: {json.dumps(first_item, ensure_ascii=False)[:200]}")
                     if isinstance(first_item, dict) and first_item.get('remote_url'):
                         write_log(f"从failed状态列表提取remote_url: {first_item.get('remote_url')}")
-                        return jsonify({
+                        return {
                             "success": True,
-                            "output_url": first_item.get('remote_url'),
+                            "output_url": rehost_remote_file(first_item.get('remote_url'), first_item.get('filename'), base_url=artifact_base_url),
                             "filename": first_item.get('filename', f"converted_document.{output_format}")
-                        })
+                        }, 200
 
             translated_content = ''
             if isinstance(output, str):
@@ -1290,10 +1982,10 @@ def translate_document():
                 write_log(f"✓ 返回成功，翻译内容长度: {len(translated_content)}")
                 # 更新历史记录（保存内容用于预览）
                 update_conversion_record(record_id, 'completed', None, None, translated_content)
-                return jsonify({
+                return {
                     "success": True,
                     "translated_content": translated_content
-                })
+                }, 200
             else:
                 write_log(f"✗ 翻译内容为空，输出数据: {output}")
         
@@ -1351,32 +2043,38 @@ def translate_document():
                     if translated_content:
                         write_log(f"✓ 从历史数据中找到输出，返回成功，翻译内容长度: {len(translated_content)}")
                         update_conversion_record(record_id, 'completed', None, None, translated_content)
-                        return jsonify({
+                        return {
                             "success": True,
                             "translated_content": translated_content
-                        })
+                        }, 200
                     break
 
         write_log(f"✗ 返回错误：状态={workflow_status}, 输出数={len(outputs)}, 状态是否成功={workflow_status in success_statuses}")
         update_conversion_record(record_id, 'error', None, "Translation failed or no output generated")
-        return jsonify({"error": "Translation failed or no output generated"}), 500
+        return {"error": "Translation failed or no output generated"}, 500
 
     except requests.exceptions.Timeout:
         write_log(f"翻译超时")
         update_conversion_record(record_id, 'error', None, "Translation timeout")
-        return jsonify({"error": "Translation timeout"}), 500
+        return {"error": "Translation timeout"}, 500
     except Exception as e:
         write_log(f"翻译异常: {e}")
         update_conversion_record(record_id, 'error', None, str(e))
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
 
-@app.route('/api/dify/country-report', methods=['POST'])
-def generate_country_report():
-    """生成国别研究报告"""
-    try:
-        data = request.get_json()
+@app.route('/api/dify/translate-document', methods=['POST'])
+@admission_controlled('academic_translate')
+@scheduled(BATCH)
+def translate_document():
+    """文档翻译接口"""
+    payload, status_code = run_workflow_task(translate_document_task(request.get_json(), current_base_url()))
+    return jsonify(payload), status_code
+
 
+def country_report_task(data, artifact_base_url=None):
+    """国别研究报告任务，返回 (响应数据, HTTP 状态码)"""
+    try:
         country = data.get('country', 'egypt')
         report_type = data.get('report_type', 'situation')
         user = data.get('user', 'default')
@@ -1471,115 +2169,11 @@ def generate_country_report():
             }
             write_log(f"已添加参考文件 conference_file 到工作流输入")
 
-        client = DifyAPIClient(COUNTRY_SITUATION_API_KEY, DIFY_BASE_URL)
-
         write_log("使用流式响应模式...")
-        workflow_url = f"{client.base_url}/workflows/run"
-        request_data = {
-            "inputs": workflow_inputs,
-            "response_mode": "streaming",
-            "user": user
-        }
-
-        response = requests.post(workflow_url, headers=client.headers,
-                                   json=request_data,
-                                   stream=True,
-                                   timeout=WORKFLOW_TIMEOUT)
-
-        if response.status_code != 200:
-            write_log(f"工作流启动失败: {response.status_code}")
-            write_log(f"错误信息: {response.text}")
-            return jsonify({"error": "Failed to start workflow"}), 500
-
-        outputs = []
-        workflow_status = None
-        all_data = []
-
-        write_log("开始接收流式数据...")
-        last_data_time = time.time()
-        timeout_seconds = 1800
-        done_received = False
-
-        for line in response.iter_lines():
-            if isinstance(line, bytes):
-                line = line.decode('utf-8')
-            line = line.strip()
-
-            if time.time() - last_data_time > timeout_seconds:
-                write_log(f"接收数据超时，最后数据时间: {last_data_time}")
-                break
-
-            if line.startswith('data:'):
-                try:
-                    data = json.loads(line[5:])
-                    all_data.append(data)
-                    last_data_time = time.time()
-                    write_log(f"收到数据: {json.dumps(data, ensure_ascii=False)}")
-
-                    if 'status' in data:
-                        workflow_status = data['status']
-                        write_log(f"工作流状态: {workflow_status}")
-
-                    if 'event' in data and data['event'] == 'node_finished':
-                        if 'data' in data and 'outputs' in data['data']:
-                            current_outputs = data['data']['outputs']
-                            if isinstance(current_outputs, dict):
-                                for key, value in current_outputs.items():
-                                    outputs.append(value)
-                                write_log(f"收到输出(字典): {len(current_outputs)} 个, 总输出数: {len(outputs)} 个, 键: {list(current_outputs.keys())}")
-                            else:
-                                for output in current_outputs:
-                                    outputs.append(output)
-                                write_log(f"收到输出(列表): {len(current_outputs)} 个, 总输出数: {len(outputs)} 个, 内容: {json.dumps(current_outputs, ensure_ascii=False)}")
-                    
-                    if 'event' in data and data['event'] == 'workflow_finished':
-                        if 'data' in data and 'outputs' in data['data']:
-                            workflow_outputs = data['data']['outputs']
-                            write_log(f"工作流完成，最终输出: {json.dumps(workflow_outputs, ensure_ascii=False)}")
-                            
-                            if isinstance(workflow_outputs, dict):
-                                for key, value in workflow_outputs.items():
-                                    outputs.append(value)
-                                write_log(f"收到工作流输出(字典): {len(workflow_outputs)} 个, 总输出数: {len(outputs)} 个, 键: {list(workflow_outputs.keys())}")
-                            else:
-                                for output in workflow_outputs:
-                                    outputs.append(output)
-                                write_log(f"收到工作流输出(列表): {len(workflow_outputs)} 个, 总输出数: {len(outputs)} 个, 内容: {json.dumps(workflow_outputs, ensure_ascii=False)}")
-                        
-                        if 'data' in data and 'status' in data['data']:
-                            workflow_status = data['data']['status']
-                            write_log(f"工作流最终状态: {workflow_status}")
-                    
-                    if 'event' in data and data['event'] == 'workflow_finished':
-                        if 'data' in data and 'outputs' in data['data']:
-                            workflow_outputs = data['data']['outputs']
-                            write_log(f"工作流完成，最终输出: {json.dumps(workflow_outputs, ensure_ascii=False)}")
-                            
-                            if isinstance(workflow_outputs, dict):
-                                for key, value in workflow_outputs.items():
-                                    outputs.append(value)
-                                write_log(f"收到工作流输出(字典): {len(workflow_outputs)} 个, 总输出数: {len(outputs)} 个, 键: {list(workflow_outputs.keys())}")
-                            else:
-                                for output in workflow_outputs:
-                                    outputs.append(output)
-                                write_log(f"收到工作流输出(列表): {len(workflow_outputs)} 个, 总输出数: {len(outputs)} 个, 内容: {json.dumps(workflow_outputs, ensure_ascii=False)}")
-                        
-                        if 'data' in data and 'status' in data['data']:
-                            workflow_status = data['data']['status']
-                            write_log(f"工作流最终状态: {workflow_status}")
-
-                except json.JSONDecodeError as e:
-                    write_log(f"解析数据行失败: {e}, 行内容: {line}")
-
-            elif line == '[DONE]':
-                write_log("工作流完成")
-                done_received = True
-                break
-
-        write_log(f"最终状态: {workflow_status}")
-        write_log(f"最终输出: {len(outputs)} 个")
-        write_log(f"所有数据: {len(all_data)} 条")
-        write_log(f"是否收到DONE: {done_received}")
+        try:
+            outputs, workflow_status, all_data, done_received = yield WorkflowCall(DIFY_POOLS['country_situation'], workflow_inputs, user)
+        except WorkflowStartError:
+            return {"error": "Failed to start workflow"}, 500
 
         success_statuses = ['succeeded', 'success', 'completed', 'finished', 'running']
         failed_statuses = ['failed']
@@ -1605,22 +2199,22 @@ def generate_country_report():
                 if isinstance(output, dict):
                     if output.get('remote_url'):
                         write_log(f"从failed状态直接提取remote_url: {output.get('remote_url')}")
-                        return jsonify({
+                        return {
                             "success": True,
-                            "output_url": output.get('remote_url'),
+                            "output_url": rehost_remote_file(output.get('remote_url'), output.get('filename'), base_url=artifact_base_url),
                             "filename": output.get('filename', f"converted_document.{output_format}")
-                        })
+                        }, 200
                 # 处理列表类型（当输出是数组时）
                 elif isinstance(output, list) and len(output) > 0:
                     first_item = output[0]
                     write_log(f"Failed状态输出是列表，第一个元素: {json.dumps(first_item, ensure_ascii=False)[:200]}")
                     if isinstance(first_item, dict) and first_item.get('remote_url'):
                         write_log(f"从failed状态列表提取remote_url: {first_item.get('remote_url')}")
-                        return jsonify({
+                        return {
                             "success": True,
-                            "output_url": first_item.get('remote_url'),
+                            "output_url": rehost_remote_file(first_item.get('remote_url'), first_item.get('filename'), base_url=artifact_base_url),
                             "filename": first_item.get('filename', f"converted_document.{output_format}")
-                        })
+                        }, 200
 
             report_content = ''
             if isinstance(output, str):
@@ -1647,11 +2241,11 @@ def generate_country_report():
                 write_log(f"✓ 返回成功，报告内容长度: {len(report_content)}")
                 # 更新历史记录（保存内容用于预览）
                 update_conversion_record(record_id, 'completed', None, None, report_content)
-                return jsonify({
+                return {
                     "success": True,
                     "report_content": report_content,
                     "country": country
-                })
+                }, 200
             else:
                 write_log(f"✗ 报告内容为空，输出数据: {output}")
 
@@ -1697,33 +2291,40 @@ def generate_country_report():
                     if report_content:
                         write_log(f"✓ 从历史数据中找到输出，返回成功，报告内容长度: {len(report_content)}")
                         update_conversion_record(record_id, 'completed', None, None, report_content)
-                        return jsonify({
+                        return {
                             "success": True,
                             "report_content": report_content,
                             "country": country
-                        })
+                        }, 200
                     break
 
         write_log(f"✗ 返回错误：状态={workflow_status}, 输出数={len(outputs)}, 状态是否成功={workflow_status in success_statuses}")
         update_conversion_record(record_id, 'error', None, "Report generation failed or no output generated")
-        return jsonify({"error": "Report generation failed or no output generated"}), 500
+        return {"error": "Report generation failed or no output generated"}, 500
 
     except requests.exceptions.Timeout:
         write_log(f"生成报告超时")
         update_conversion_record(record_id, 'error', None, "Report generation timeout")
-        return jsonify({"error": "Report generation timeout"}), 500
+        return {"error": "Report generation timeout"}, 500
     except Exception as e:
         write_log(f"生成报告异常: {e}")
         update_conversion_record(record_id, 'error', None, str(e))
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
 
-@app.route('/api/dify/quarterly-report', methods=['POST'])
-def generate_quarterly_report():
-    """生成季度研究报告"""
-    try:
-        data = request.get_json()
+@app.route('/api/dify/country-report', methods=['POST'])
+@idempotent
+@admission_controlled('country_report')
+@scheduled(BATCH)
+def generate_country_report():
+    """生成国别研究报告"""
+    payload, status_code = run_workflow_task(country_report_task(request.get_json(), current_base_url()))
+    return jsonify(payload), status_code
+
 
+def quarterly_report_task(data, artifact_base_url=None):
+    """季度研究报告任务，返回 (响应数据, HTTP 状态码)"""
+    try:
         country = data.get('country', 'egypt')
         user = data.get('user', 'default')
 
@@ -1806,79 +2407,11 @@ def generate_quarterly_report():
             }
             write_log(f"已添加参考文件 conference_file 到工作流输入")
 
-        client = DifyAPIClient(QUARTERLY_REPORT_API_KEY, DIFY_BASE_URL)
-
         write_log("使用流式响应模式...")
-        workflow_url = f"{client.base_url}/workflows/run"
-        request_data = {
-            "inputs": workflow_inputs,
-            "response_mode": "streaming",
-            "user": user
-        }
-
-        response = requests.post(workflow_url, headers=client.headers,
-                                   json=request_data,
-                                   stream=True,
-                                   timeout=WORKFLOW_TIMEOUT)
-
-        if response.status_code != 200:
-            write_log(f"工作流启动失败: {response.status_code}")
-            write_log(f"错误信息: {response.text}")
-            return jsonify({"error": "Failed to start workflow"}), 500
-
-        outputs = []
-        workflow_status = None
-        all_data = []
-
-        write_log("开始接收流式数据...")
-        last_data_time = time.time()
-        timeout_seconds = 1800
-        done_received = False
-
-        for line in response.iter_lines():
-            if isinstance(line, bytes):
-                line = line.decode('utf-8')
-            line = line.strip()
-
-            if time.time() - last_data_time > timeout_seconds:
-                write_log(f"接收数据超时，最后数据时间: {last_data_time}")
-                break
-
-            if line.startswith('data:'):
-                try:
-                    data = json.loads(line[5:])
-                    all_data.append(data)
-                    last_data_time = time.time()
-                    write_log(f"收到数据: {json.dumps(data, ensure_ascii=False)}")
-
-                    if 'status' in data:
-                        workflow_status = data['status']
-                        write_log(f"工作流状态: {workflow_status}")
-
-                    if 'event' in data and data['event'] == 'node_finished':
-                        if 'data' in data and 'outputs' in data['data']:
-                            current_outputs = data['data']['outputs']
-                            if isinstance(current_outputs, dict):
-                                for key, value in current_outputs.items():
-                                    outputs.append(value)
-                                write_log(f"收到输出(字典): {len(current_outputs)} 个, 总输出数: {len(outputs)} 个, 键: {list(current_outputs.keys())}")
-                            else:
-                                for output in current_outputs:
-                                    outputs.append(output)
-                                write_log(f"收到输出(列表): {len(current_outputs)} 个, 总输出数: {len(outputs)} 个, 内容: {json.dumps(current_outputs, ensure_ascii=False)}")
-
-                except json.JSONDecodeError as e:
-                    write_log(f"解析数据行失败: {e}, 行内容: {line}")
-
-            elif line == '[DONE]':
-                write_log("工作流完成")
-                done_received = True
-                break
-
-        write_log(f"最终状态: {workflow_status}")
-        write_log(f"最终输出: {len(outputs)} 个")
-        write_log(f"所有数据: {len(all_data)} 条")
-        write_log(f"是否收到DONE: {done_received}")
+        try:
+            outputs, workflow_status, all_data, done_received = yield WorkflowCall(DIFY_POOLS['quarterly_report'], workflow_inputs, user)
+        except WorkflowStartError:
+            return {"error": "Failed to start workflow"}, 500
 
         success_statuses = ['succeeded', 'success', 'completed', 'finished', 'running']
         failed_statuses = ['failed']
@@ -1904,22 +2437,22 @@ def generate_quarterly_report():
                 if isinstance(output, dict):
                     if output.get('remote_url'):
                         write_log(f"从failed状态直接提取remote_url: {output.get('remote_url')}")
-                        return jsonify({
+                        return {
                             "success": True,
-                            "output_url": output.get('remote_url'),
+                            "output_url": rehost_remote_file(output.get('remote_url'), output.get('filename'), base_url=artifact_base_url),
                             "filename": output.get('filename', f"converted_document.{output_format}")
-                        })
+                        }, 200
                 # 处理列表类型（当输出是数组时）
                 elif isinstance(output, list) and len(output) > 0:
                     first_item = output[0]
                     write_log(f"Failed状态输出是列表，第一个元素: {json.dumps(first_item, ensure_ascii=False)[:200]}")
                     if isinstance(first_item, dict) and first_item.get('remote_url'):
                         write_log(f"从failed状态列表提取remote_url: {first_item.get('remote_url')}")
-                        return jsonify({
+                        return {
                             "success": True,
-                            "output_url": first_item.get('remote_url'),
+                            "output_url": rehost_remote_file(first_item.get('remote_url'), first_item.get('filename'), base_url=artifact_base_url),
                             "filename": first_item.get('filename', f"converted_document.{output_format}")
-                        })
+                        }, 200
 
             report_content = ''
             if isinstance(output, str):
@@ -1965,11 +2498,11 @@ def generate_quarterly_report():
                 write_log(f"✓ 返回成功，报告内容长度: {len(report_content)}")
                 # 更新历史记录（保存内容用于预览）
                 update_conversion_record(record_id, 'completed', None, None, report_content)
-                return jsonify({
+                return {
                     "success": True,
                     "report_content": report_content,
                     "country": country
-                })
+                }, 200
             else:
                 write_log(f"✗ 报告内容为空，输出数据: {output}")
 
@@ -2015,28 +2548,59 @@ def generate_quarterly_report():
                     if report_content:
                         write_log(f"✓ 从历史数据中找到输出，返回成功，报告内容长度: {len(report_content)}")
                         update_conversion_record(record_id, 'completed', None, None, report_content)
-                        return jsonify({
+                        return {
                             "success": True,
                             "report_content": report_content,
                             "country": country
-                        })
+                        }, 200
                     break
 
         write_log(f"✗ 返回错误：状态={workflow_status}, 输出数={len(outputs)}, 状态是否成功={workflow_status in success_statuses}")
         update_conversion_record(record_id, 'error', None, "Report generation failed or no output generated")
-        return jsonify({"error": "Report generation failed or no output generated"}), 500
+        return {"error": "Report generation failed or no output generated"}, 500
 
     except requests.exceptions.Timeout:
         write_log(f"生成报告超时")
         update_conversion_record(record_id, 'error', None, "Report generation timeout")
-        return jsonify({"error": "Report generation timeout"}), 500
+        return {"error": "Report generation timeout"}, 500
     except Exception as e:
         write_log(f"生成报告异常: {e}")
         update_conversion_record(record_id, 'error', None, str(e))
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+
+
+@app.route('/api/dify/quarterly-report', methods=['POST'])
+@admission_controlled('quarterly_report')
+@scheduled(BATCH)
+def generate_quarterly_report():
+    """生成季度研究报告"""
+    payload, status_code = run_workflow_task(quarterly_report_task(request.get_json(), current_base_url()))
+    return jsonify(payload), status_code
+
+
+def translated_image_response(result, filename_stem, headers):
+    """
+    返回翻译结果图片
+
+    - 远程结果且不需要转码：逐块转发上游响应（带 Content-Length）
+    - 其余情况：按 Accept 转码，保存到产物缓存，带 ETag 和产物地址
+    """
+    accept = request.headers.get('Accept')
+    if result.streaming and negotiate_image_format(accept, format_from_ext(result.ext)) is None:
+        headers.update(result.stream_headers())
+        headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename_stem + result.ext)}"
+        return Response(result.iter_chunks(), mimetype='image/png' if result.ext == '.png' else 'image/jpeg',
+                        headers=headers)
+
+    data, ext, mimetype, artifact_hash = deliver_image(result.read(), result.ext, accept, filename_stem)
+    headers.update(validator_headers(artifact_hash))
+    headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename_stem + ext)}"
+    return Response(data, mimetype=mimetype, headers=headers)
 
 
 @app.route('/api/translate-image', methods=['POST'])
+@admission_controlled('image_translate')
+@scheduled(INTERACTIVE)
 def translate_image():
     """图片翻译接口（使用OpenAI API）"""
     try:
@@ -2052,7 +2616,12 @@ def translate_image():
         if not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
             return jsonify({"error": "Invalid file type"}), 400
 
-        print(f"\nProcessing: {file.filename}")
+        # single：整图缩放后翻译；tiled：大图分块翻译，保留原分辨率
+        mode = request.form.get('mode', 'single')
+        if mode not in ('single', 'tiled'):
+            return jsonify({"error": "mode must be single or tiled"}), 400
+
+        print(f"\nProcessing: {file.filename} (mode={mode})")
 
         # 创建历史记录
         record_id = str(uuid.uuid4())
@@ -2065,27 +2634,24 @@ def translate_image():
             "input_file_name": file.filename,
             "status": "processing",
             "created_at": datetime.now().isoformat(),
-            "extra_params": {}
+            "extra_params": {"mode": mode}
         }
         add_conversion_record(record)
 
-        image_b64, original_size = load_and_preprocess_image(file)
-
-        client = init_openai_client()
-        completion = client.translate_image(image_b64)
-
-        image_bytes, ext = client.get_image_from_response(completion)
+        if mode == 'tiled':
+            image_bytes, ext, cache_status, encoding = translate_image_tiled(file)
+            result = TranslatedImage(ext, data=image_bytes)
+        else:
+            encoded = preprocess_image(file)
+            print(f"图片编码: {encoded.describe()}")
+            encoding = encoded.report()
+            result, cache_status = open_translated_image(encoded.b64)
 
         # 更新历史记录为完成
         update_conversion_record(record_id, 'completed', None, None)
 
-        output_filename = f"translated_{file.filename.rsplit('.', 1)[0]}{ext}"
-        return send_file(
-            io.BytesIO(image_bytes),
-            mimetype='image/jpeg' if ext == '.jpg' else 'image/png',
-            as_attachment=True,
-            download_name=output_filename
-        )
+        headers = {'X-Translation-Cache': cache_status, **encoding_headers(encoding)}
+        return translated_image_response(result, f"translated_{file.filename.rsplit('.', 1)[0]}", headers)
 
     except Exception as e:
         print(f"Error: {e}")
@@ -2093,6 +2659,199 @@ def translate_image():
         return jsonify({"error": str(e)}), 500
 
 
+# ============= 批量图片翻译 =============
+IMAGE_BATCH_CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "4"))
+MAX_BATCH_IMAGES = 100
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", "150"))
+# 上传 PDF 的大小和页数上限，在渲染之前检查
+PDF_MAX_UPLOAD_MB = int(os.getenv("PDF_MAX_UPLOAD_MB", "50"))
+PDF_MAX_PAGES = min(int(os.getenv("PDF_MAX_PAGES", "50")), MAX_BATCH_IMAGES)
+# 渲染后每页长边的最大像素数（超大页面自动降低分辨率）
+PDF_MAX_PAGE_SIDE = 4096
+ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'bmp'}
+
+_image_batch_executor = ThreadPoolExecutor(max_workers=IMAGE_BATCH_CONCURRENCY, thread_name_prefix="image-batch")
+
+
+def read_pdf_upload(file):
+    """读取上传的 PDF，超过 PDF_MAX_UPLOAD_MB 时抛出 ValueError（最多多读 1 字节）"""
+    max_bytes = PDF_MAX_UPLOAD_MB * 1024 * 1024
+    data = file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"PDF too large. Maximum {PDF_MAX_UPLOAD_MB}MB allowed")
+    return data
+
+
+def split_pdf_pages(data, dpi=PDF_RENDER_DPI):
+    """把 PDF 每一页渲染成 PNG，返回字节列表（需要 PyMuPDF）；页数在渲染之前检查"""
+    try:
+        import pymupdf
+    except ImportError:
+        raise ValueError("PDF support requires PyMuPDF (pip install pymupdf)")
+
+    pages = []
+    try:
+        pdf = pymupdf.open(stream=data, filetype="pdf")
+    except Exception as e:
+        raise ValueError(f"Invalid PDF: {e}")
+    with pdf:
+        if pdf.page_count > PDF_MAX_PAGES:
+            raise ValueError(f"Too many pages. Maximum {PDF_MAX_PAGES} allowed")
+        for page in pdf:
+            longest = max(page.rect.width, page.rect.height) or 1
+            page_dpi = min(dpi, int(PDF_MAX_PAGE_SIDE * 72 / longest))
+            pages.append(page.get_pixmap(dpi=max(page_dpi, 1)).tobytes("png"))
+    return pages
+
+
+def _translate_batch_image(index, name, data, mode='single'):
+    """翻译一张图片，返回结果字典（失败时带 error）"""
+    started_at = time.time()
+    try:
+        image_bytes, ext, cache_status, encoding = translate_upload(io.BytesIO(data), mode)
+        return {"index": index, "name": name, "status": "completed", "cache": cache_status,
+                "image_bytes": image_bytes, "ext": ext, "encoding": encoding,
+                "seconds": round(time.time() - started_at, 2)}
+    except Exception as e:
+        print(f"批量图片翻译失败: index={index}, 错误={e}")
+        return {"index": index, "name": name, "status": "error", "error": str(e),
+                "seconds": round(time.time() - started_at, 2)}
+
+
+def _assemble_zip(results):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as zf:
+        errors = []
+        for r in results:
+            if r['status'] == 'completed':
+                zf.writestr(f"{r['index'] + 1:03d}_translated_{r['name']}{r['ext']}", r['image_bytes'])
+            else:
+                errors.append(f"{r['index'] + 1:03d} {r['name']}: {r['error']}")
+        if errors:
+            zf.writestr("errors.txt", "\n".join(errors))
+    buf.seek(0)
+    return buf
+
+
+def _assemble_pdf(results):
+    pages = [Image.open(io.BytesIO(r['image_bytes'])).convert("RGB") for r in results if r['status'] == 'completed']
+    if not pages:
+        raise Exception("All images failed to translate")
+    buf = io.BytesIO()
+    pages[0].save(buf, format="PDF", save_all=True, append_images=pages[1:], resolution=PDF_RENDER_DPI)
+    buf.seek(0)
+    return buf
+
+
+@app.route('/api/translate-images', methods=['POST'])
+@admission_controlled('image_translate')
+def translate_images_batch():
+    """
+    批量图片翻译
+
+    请求参数（multipart/form-data）：
+    - images: 多张图片，或 pdf: 一个 PDF 文件（按页拆成图片）
+    - output: stream（默认，NDJSON 逐张返回）/ zip / pdf
+    - mode: single（默认）/ tiled（大图分块翻译）
+    - user
+
+    图片并发翻译（IMAGE_BATCH_CONCURRENCY 张同时进行），stream 模式下每完成一张推送一行：
+    {"index": 0, "name": "...", "status": "completed", "output_url": "/api/artifacts/<hash>", "cache": "miss"}
+    zip / pdf 模式等全部完成后按原顺序打包返回
+    """
+    output = request.form.get('output', 'stream')
+    if output not in ('stream', 'zip', 'pdf'):
+        return jsonify({"error": "output must be stream, zip or pdf"}), 400
+    mode = request.form.get('mode', 'single')
+    if mode not in ('single', 'tiled'):
+        return jsonify({"error": "mode must be single or tiled"}), 400
+
+    try:
+        items = []
+        pdf_file = request.files.get('pdf')
+        if pdf_file:
+            stem = os.path.splitext(os.path.basename(pdf_file.filename or 'document.pdf'))[0]
+            for i, page in enumerate(split_pdf_pages(read_pdf_upload(pdf_file))):
+                items.append((f"{stem}_p{i + 1}", page))
+        for file in request.files.getlist('images'):
+            filename = os.path.basename(file.filename or '')
+            if not ('.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS):
+                return jsonify({"error": f"Invalid file type: {filename}"}), 400
+            items.append((filename.rsplit('.', 1)[0], file.read()))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not items:
+        return jsonify({"error": "No images provided"}), 400
+    if len(items) > MAX_BATCH_IMAGES:
+        return jsonify({"error": f"Too many images. Maximum {MAX_BATCH_IMAGES} allowed"}), 400
+
+    user = request.form.get('user', 'default')
+    record_id = str(uuid.uuid4())
+    add_conversion_record({
+        "id": record_id,
+        "user_id": user,
+        "task_type": "image_translate_batch",
+        "input_file_id": None,
+        "input_file_name": pdf_file.filename if pdf_file else f"批量图片翻译（{len(items)} 张）",
+        "status": "processing",
+        "created_at": datetime.now().isoformat(),
+        "extra_params": {"count": len(items), "output": output, "mode": mode}
+    })
+    print(f"\n批量图片翻译: {len(items)} 张, 输出={output}")
+
+    futures = [_image_batch_executor.submit(_translate_batch_image, i, name, data, mode)
+               for i, (name, data) in enumerate(items)]
+
+    def finish(results):
+        failed = len([r for r in results if r['status'] == 'error'])
+        status = 'error' if failed == len(results) else 'completed'
+        update_conversion_record(record_id, status, None,
+                                 f"全部 {failed} 张图片翻译失败" if status == 'error' else None,
+                                 f"成功 {len(results) - failed} 张，失败 {failed} 张")
+
+    if output != 'stream':
+        results = [f.result() for f in futures]
+        finish(results)
+        try:
+            buf = _assemble_zip(results) if output == 'zip' else _assemble_pdf(results)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        stem = items[0][0] if len(items) == 1 else "translated_images"
+        response = send_file(buf, mimetype='application/zip' if output == 'zip' else 'application/pdf',
+                             as_attachment=True, download_name=f"{stem}.{output}")
+        response.headers['X-Failed-Items'] = str(len([r for r in results if r['status'] == 'error']))
+        return response
+
+    base_url = current_base_url()
+
+    def generate():
+        results = []
+        try:
+            for future in as_completed(futures):
+                r = future.result()
+                results.append(r)
+                event = {k: v for k, v in r.items() if k not in ('image_bytes', 'ext')}
+                if r['status'] == 'completed':
+                    artifact_hash = artifact_cache.put_bytes(
+                        r['image_bytes'], filename=f"translated_{r['name']}{r['ext']}",
+                        mimetype='image/jpeg' if r['ext'] == '.jpg' else 'image/png')
+                    event['output_url'] = artifact_url(artifact_hash, base_url)
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+            finish(sorted(results, key=lambda r: r['index']))
+            yield json.dumps({"type": "done", "total": len(futures),
+                              "failed": len([r for r in results if r['status'] == 'error'])}) + "\n"
+        finally:
+            # 客户端断开时取消还没开始的图片
+            for future in futures:
+                future.cancel()
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 # ============= 主程序 ============
 if __name__ == '__main__':
     """
@@ -2117,10 +2876,18 @@ if __name__ == '__main__':
     print("  - POST /api/dify/upload - 上传文档")
     print("  - POST /api/dify/convert - 转公文（阻塔回复）")
     print("  - POST /api/dify/convert-stream - 转公文（流式响应）")
+    print("  - POST /api/dify/convert-batch - 批量转公文")
+    print("  - POST /api/pipelines - 文档流水线（上传 → 翻译 → 转公文 → 转存）")
+    print("  - GET  /api/jobs/<job_id>/events - 订阅后台任务结果")
     print("  - POST /api/dify/translate-document - 文档翻译")
     print("  - POST /api/dify/country-report - 生成国别情况报告")
     print("  - POST /api/dify/quarterly-report - 生成季度研究报告")
     print("  - POST /api/translate-image - 图片翻译（OpenAI）")
+    print("  - POST /api/translate-images - 批量图片 / PDF 翻译")
+    print("  - GET  /api/artifacts/<hash> - 下载缓存的输出文件")
+    print("  - GET  /api/scheduler/stats - 任务队列统计")
+    print("  - GET  /api/idempotency/stats - 幂等键统计")
+    print("  - GET  /api/image-cache/stats - 图片翻译缓存统计")
     print("=" * 60)
     print()
 
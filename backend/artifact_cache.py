@@ -0,0 +1,355 @@
+"""
+产物缓存（内容寻址）
+Dify 工作流生成的输出文件只下载一次并保存在本地，之后通过 /api/artifacts/<hash> 提供下载，
+避免 remote_url 过期以及重复回源到 Dify
+
+文件按内容的 SHA-256 命名，总大小超过上限时按最近访问时间（LRU）淘汰；
+被淘汰文件的来源地址保留在 origins.json 中，之后访问同一个 hash 时重新下载或重定向到来源
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import requests
+from flask import request, jsonify, send_file, redirect, has_request_context
+
+# ============= 配置区域 =============
+ARTIFACT_CACHE_DIR = os.getenv(
+    "ARTIFACT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "artifacts")
+)
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# 对外访问地址（部署在反向代理后面时需要配置，例如 https://smartdocx.jxchen.me）
+ARTIFACT_PUBLIC_BASE_URL = os.getenv("ARTIFACT_PUBLIC_BASE_URL", "")
+ARTIFACT_DOWNLOAD_TIMEOUT = 180
+ARTIFACT_MAX_AGE = 365 * 24 * 3600  # 内容寻址，永不变化
+CHUNK_SIZE = 64 * 1024
+# 保留来源地址的已淘汰文件数（每条只有几百字节）
+ARTIFACT_ORIGINS_MAX_ENTRIES = int(os.getenv("ARTIFACT_ORIGINS_MAX_ENTRIES", "100000"))
+
+_HASH_RE = re.compile(r"[0-9a-f]{64}")
+
+
+class ArtifactCache:
+    """内容寻址的本地文件缓存，按总大小做 LRU 淘汰"""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # hash -> 文件大小，按访问顺序排列
+        self._url_index = {}           # 远程 URL -> hash
+        self._origins = OrderedDict()  # 已淘汰文件的 hash -> 来源信息，按淘汰顺序排列
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _data_path(self, artifact_hash):
+        return os.path.join(self.root, artifact_hash)
+
+    def _meta_path(self, artifact_hash):
+        return os.path.join(self.root, f"{artifact_hash}.json")
+
+    def _origins_path(self):
+        return os.path.join(self.root, "origins.json")
+
+    def _load(self):
+        """启动时扫描缓存目录，按修改时间恢复 LRU 顺序"""
+        found = []
+        for name in os.listdir(self.root):
+            if not _HASH_RE.fullmatch(name):
+                continue
+            path = self._data_path(name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found.append((stat.st_mtime, name, stat.st_size))
+
+        for _, artifact_hash, size in sorted(found):
+            self._entries[artifact_hash] = size
+            self._total_bytes += size
+            meta = self.meta(artifact_hash)
+            if meta and meta.get("source_url"):
+                self._url_index[meta["source_url"]] = artifact_hash
+
+        try:
+            with open(self._origins_path(), "r", encoding="utf-8") as f:
+                self._origins.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+        print(f"[ArtifactCache] 加载缓存: {len(self._entries)} 个文件, {self._total_bytes / 1024 / 1024:.1f} MB")
+
+    def put_stream(self, chunks, filename=None, mimetype=None, source_url=None, extra_meta=None):
+        """写入一个字节块迭代器，返回内容 hash"""
+        committed = []
+        for _ in self.stream_through(chunks, filename, mimetype, source_url, extra_meta, committed.append):
+            pass
+        return committed[0]
+
+    def stream_through(self, chunks, filename=None, mimetype=None, source_url=None, extra_meta=None,
+                       on_commit=None):
+        """
+        边转发边写入缓存：逐块 yield 输入的字节块，全部读完后保存文件并调用 on_commit(hash)
+
+        中途停止迭代（例如客户端断开）时丢弃临时文件，不写入缓存
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            artifact_hash = self._commit(tmp_path, digest.hexdigest(), size, {
+                "filename": filename,
+                "mimetype": mimetype or "application/octet-stream",
+                "size": size,
+                "source_url": source_url,
+                "created_at": time.time(),
+                **(extra_meta or {})
+            })
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if on_commit:
+            on_commit(artifact_hash)
+
+    def _commit(self, tmp_path, artifact_hash, size, meta):
+        """把写完的临时文件移入缓存并保存元数据"""
+        with self._lock:
+            if artifact_hash in self._entries:
+                os.remove(tmp_path)
+                self._touch_locked(artifact_hash)
+            else:
+                os.replace(tmp_path, self._data_path(artifact_hash))
+                self._entries[artifact_hash] = size
+                self._total_bytes += size
+            self._write_meta(artifact_hash, meta)
+            if meta.get("source_url"):
+                self._url_index[meta["source_url"]] = artifact_hash
+            if self._origins.pop(artifact_hash, None):
+                self._save_origins_locked()
+            self._evict_locked(keep=artifact_hash)
+        return artifact_hash
+
+    def _write_meta(self, artifact_hash, meta):
+        with open(self._meta_path(artifact_hash), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    def update_meta(self, artifact_hash, **fields):
+        """更新缓存文件的元数据（例如上游校验信息）"""
+        with self._lock:
+            if artifact_hash not in self._entries:
+                return
+            meta = self.meta(artifact_hash) or {}
+            meta.update(fields)
+            self._write_meta(artifact_hash, meta)
+
+    def put_bytes(self, data, filename=None, mimetype=None, source_url=None):
+        """写入一段字节，返回内容 hash"""
+        return self.put_stream([data], filename=filename, mimetype=mimetype, source_url=source_url)
+
+    def lookup(self, source_url):
+        """按来源地址查找已缓存的文件 hash，不存在时返回 None"""
+        with self._lock:
+            artifact_hash = self._url_index.get(source_url)
+            if artifact_hash and artifact_hash in self._entries:
+                self._touch_locked(artifact_hash)
+                return artifact_hash
+        return None
+
+    def fetch_url(self, url, filename=None, timeout=ARTIFACT_DOWNLOAD_TIMEOUT):
+        """下载远程文件到缓存（同一 URL 只下载一次），返回内容 hash"""
+        with self._lock:
+            artifact_hash = self._url_index.get(url)
+            if artifact_hash and artifact_hash in self._entries:
+                self.hits += 1
+                self._touch_locked(artifact_hash)
+                return artifact_hash
+            self.misses += 1
+
+        with requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            mimetype = response.headers.get("Content-Type", "").split(";")[0].strip() or None
+            return self.put_stream(response.iter_content(CHUNK_SIZE),
+                                   filename=filename, mimetype=mimetype, source_url=url)
+
+    def path(self, artifact_hash):
+        """返回缓存文件路径并刷新访问顺序，不存在时返回 None"""
+        if not _HASH_RE.fullmatch(artifact_hash or ""):
+            return None
+        with self._lock:
+            if artifact_hash not in self._entries:
+                return None
+            self._touch_locked(artifact_hash)
+        return self._data_path(artifact_hash)
+
+    def meta(self, artifact_hash):
+        """读取缓存文件的元数据"""
+        try:
+            with open(self._meta_path(artifact_hash), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def origin(self, artifact_hash):
+        """已淘汰文件的来源信息（source_url、filename、mimetype），没有记录时返回 None"""
+        with self._lock:
+            return self._origins.get(artifact_hash)
+
+    def _save_origins_locked(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._origins, f, ensure_ascii=False)
+            os.replace(tmp_path, self._origins_path())
+        except OSError as e:
+            print(f"[ArtifactCache] 保存来源记录失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                "count": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _touch_locked(self, artifact_hash):
+        self._entries.move_to_end(artifact_hash)
+        try:
+            os.utime(self._data_path(artifact_hash))
+        except OSError:
+            pass
+
+    def _evict_locked(self, keep=None):
+        """超过容量上限时淘汰最久未访问的文件"""
+        evicted_origin = False
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            artifact_hash, size = next(iter(self._entries.items()))
+            if artifact_hash == keep:
+                break
+            self._entries.pop(artifact_hash)
+            self._total_bytes -= size
+            meta = self.meta(artifact_hash) or {}
+            source_url = meta.get("source_url")
+            if isinstance(source_url, str) and source_url.startswith(("http://", "https://")):
+                self._origins[artifact_hash] = {
+                    "source_url": source_url,
+                    "filename": meta.get("filename"),
+                    "mimetype": meta.get("mimetype")
+                }
+                while len(self._origins) > ARTIFACT_ORIGINS_MAX_ENTRIES:
+                    self._origins.popitem(last=False)
+                evicted_origin = True
+            for path in (self._data_path(artifact_hash), self._meta_path(artifact_hash)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._url_index = {u: h for u, h in self._url_index.items() if h != artifact_hash}
+            print(f"[ArtifactCache] 淘汰: {artifact_hash[:12]} ({size} bytes)")
+        if evicted_origin:
+            self._save_origins_locked()
+
+
+artifact_cache = ArtifactCache(ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_BYTES)
+
+
+def current_base_url():
+    """产物链接使用的站点地址：优先使用配置，其次使用当前请求的地址"""
+    if ARTIFACT_PUBLIC_BASE_URL:
+        return ARTIFACT_PUBLIC_BASE_URL
+    if has_request_context():
+        return request.host_url
+    return ''
+
+
+def artifact_url(artifact_hash, base_url=None):
+    """拼接产物的完整访问地址（后台线程中没有请求上下文，需要传入 base_url）"""
+    base = base_url or current_base_url()
+    return f"{base.rstrip('/')}/api/artifacts/{artifact_hash}"
+
+
+def artifact_hash_from_url(url):
+    """从 /api/artifacts/<hash> 地址中取出 hash，不是产物地址时返回 None"""
+    match = re.search(r"/api/artifacts/([0-9a-f]{64})(?:[?#]|$)", url or "")
+    return match.group(1) if match else None
+
+
+def rehost_remote_file(remote_url, filename=None, base_url=None):
+    """
+    将远程输出文件转存到本地产物缓存
+
+    返回 /api/artifacts/<hash> 的完整地址；非 http(s) 地址或下载失败时原样返回
+    """
+    if not isinstance(remote_url, str) or not remote_url.startswith(("http://", "https://")):
+        return remote_url
+    try:
+        artifact_hash = artifact_cache.fetch_url(remote_url, filename=filename)
+    except Exception as e:
+        print(f"[ArtifactCache] 转存失败，使用原始地址: {e}")
+        return remote_url
+    return artifact_url(artifact_hash, base_url)
+
+
+def register_artifact_routes(app):
+    """注册产物下载路由"""
+
+    @app.route('/api/artifacts/<artifact_hash>', methods=['GET'])
+    def get_artifact(artifact_hash):
+        """下载缓存的产物文件（支持 Range / ETag）"""
+        path = artifact_cache.path(artifact_hash)
+        if not path:
+            # 已被淘汰：按来源地址重新下载，内容不一致或下载失败时重定向到来源
+            origin = artifact_cache.origin(artifact_hash)
+            if not origin:
+                return jsonify({"error": "Artifact not found"}), 404
+            try:
+                restored = artifact_cache.fetch_url(origin["source_url"], filename=origin.get("filename"))
+            except Exception as e:
+                print(f"[ArtifactCache] 重新下载失败，重定向到来源: {e}")
+                restored = None
+            path = artifact_cache.path(artifact_hash) if restored == artifact_hash else None
+            if not path:
+                return redirect(origin["source_url"])
+
+        meta = artifact_cache.meta(artifact_hash) or {}
+        filename = meta.get("filename")
+        response = send_file(
+            path,
+            mimetype=meta.get("mimetype", "application/octet-stream"),
+            as_attachment=bool(filename) and request.args.get('inline') != '1',
+            download_name=filename,
+            conditional=True,
+            etag=artifact_hash,
+            max_age=ARTIFACT_MAX_AGE
+        )
+        response.cache_control.immutable = True
+        return response
+
+    @app.route('/api/artifacts/stats', methods=['GET'])
+    def get_artifact_stats():
+        """产物缓存统计"""
+        return jsonify({
+            "success": True,
+            "stats": artifact_cache.stats()
+        }), 200
@@ -0,0 +1,493 @@
+"""
+ASGI 服务模式（可选）
+
+WSGI 模式下每个进行中的 Dify 流式请求都要占用一个线程，最长 30 分钟，
+并发上限就是 worker 数 × 线程数。ASGI 模式下 Dify 工作流接口和图片翻译接口
+在事件循环中用协程调用上游（httpx / AsyncOpenAI），等待上游时不占用线程，
+一个进程可以同时保持数百个长连接；其余接口原样交给 Flask 应用处理。
+
+工作流的业务逻辑（历史记录、输出解析、产物转存）和 app.py 共用同一份任务生成器，
+见 app.run_workflow_task
+
+启动方式：
+    pip install -r requirements.txt
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+import os
+import io
+import json
+import time
+import uuid
+import asyncio
+from datetime import datetime
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+
+import httpx
+import requests
+from a2wsgi import WSGIMiddleware
+from openai import AsyncOpenAI, APIConnectionError
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import app as flask_backend
+from app import (
+    CORS_ORIGINS, OPENAI_POOL, WORKFLOW_TIMEOUT, DOWNLOAD_TIMEOUT, MAX_RETRIES, RETRY_DELAY,
+    WorkflowStreamCollector, WorkflowStartError, image_translation_request,
+    convert_task, translate_document_task, country_report_task, quarterly_report_task,
+    preprocess_image, encoding_headers, add_conversion_record, update_conversion_record,
+    lookup_translated_image, store_translated_image, translate_image_tiled,
+    write_log
+)
+from admission import admission_controller, AdmissionRejected, client_ip
+from completion_images import extract_images
+from image_delivery import (TranslatedImage, STREAM_CHUNK_SIZE, deliver_image, validator_headers,
+                            negotiate_image_format, format_from_ext, format_from_content_type)
+from idempotency import (
+    IDEMPOTENCY_HEADER, REPLAYED_HEADER, IDEMPOTENCY_WAIT, MAX_KEY_LENGTH,
+    idempotency_store, request_fingerprint, scope_key_for
+)
+from artifact_cache import ARTIFACT_PUBLIC_BASE_URL
+
+# ============= 配置区域 =============
+# 同时保持的上游连接数（httpx 默认只有 100）
+ASGI_MAX_UPSTREAM_CONNECTIONS = int(os.getenv("ASGI_MAX_UPSTREAM_CONNECTIONS", "1000"))
+# 交给 Flask 处理的其余接口使用的线程数
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+# 流式数据行攒够这段时间（秒）后交给线程池解析，JSON 解析和写日志文件不占用事件循环
+STREAM_FEED_INTERVAL = 0.2
+
+_http = None
+_async_openai_clients = {}
+
+
+# ============= 上游调用（协程） =============
+
+def _feed_lines(collector, lines):
+    """在线程池中处理一批数据行，返回 False 表示流已结束或超时"""
+    for line in lines:
+        if not collector.feed_line(line):
+            return False
+    return True
+
+
+async def collect_workflow(call):
+    """
+    异步版 DifyAPIClient.run_workflow_collect
+
+    事件循环只负责读取数据行，解析和日志（write_log 写文件）按批在线程池中执行
+    """
+    request_data = {
+        "inputs": call.inputs,
+        "response_mode": "streaming",
+        "user": call.user
+    }
+
+    with call.pool.lease() as lease:
+        try:
+            async with _http.stream("POST", f"{lease.endpoint.base_url}/workflows/run",
+                                    headers=lease.endpoint.headers,
+                                    json=request_data) as response:
+                lease.record_status(response.status_code)
+
+                if response.status_code != 200:
+                    text = (await response.aread()).decode('utf-8', errors='ignore')
+                    await run_in_threadpool(write_log, f"工作流启动失败: {response.status_code}")
+                    await run_in_threadpool(write_log, f"错误信息: {text}")
+                    raise WorkflowStartError(response.status_code, text)
+
+                await run_in_threadpool(write_log, "开始接收流式数据...")
+                collector = WorkflowStreamCollector()
+                pending, fed_at = [], time.monotonic()
+                async for line in response.aiter_lines():
+                    pending.append(line)
+                    if time.monotonic() - fed_at >= STREAM_FEED_INTERVAL:
+                        lines, pending, fed_at = pending, [], time.monotonic()
+                        if not await run_in_threadpool(_feed_lines, collector, lines):
+                            break
+                else:
+                    if pending:
+                        await run_in_threadpool(_feed_lines, collector, pending)
+        except httpx.TransportError:
+            # 连接失败、超时时把端点移出冷却
+            lease.mark_failed()
+            raise
+
+    return await run_in_threadpool(collector.result)
+
+
+def _advance(task, value=None, error=None):
+    """推进任务一步，返回 (是否结束, 下一个 WorkflowCall 或最终结果)"""
+    try:
+        call = task.throw(error) if error is not None else task.send(value)
+    except StopIteration as stop:
+        return True, stop.value
+    return False, call
+
+
+async def run_workflow_task_async(task):
+    """
+    在事件循环中执行工作流任务（app.run_workflow_task 的异步版）
+
+    任务本身的同步代码（读写历史记录、转存产物）放到线程池中执行，只有等待上游时在事件循环中挂起
+    """
+    try:
+        done, result = await run_in_threadpool(_advance, task)
+        while not done:
+            try:
+                collected = await collect_workflow(result)
+            except httpx.TimeoutException as e:
+                # 任务按 requests 的超时异常处理
+                done, result = await run_in_threadpool(_advance, task, None, requests.exceptions.Timeout(str(e)))
+            except Exception as e:
+                done, result = await run_in_threadpool(_advance, task, None, e)
+            else:
+                done, result = await run_in_threadpool(_advance, task, collected)
+        return result
+    finally:
+        task.close()
+
+
+def _async_openai_client(endpoint):
+    key = (endpoint.api_key, endpoint.base_url)
+    if key not in _async_openai_clients:
+        _async_openai_clients[key] = AsyncOpenAI(base_url=endpoint.base_url, api_key=endpoint.api_key)
+    return _async_openai_clients[key]
+
+
+async def translate_image_async(image_b64):
+    """异步版 OpenAIClient.translate_image"""
+    for attempt in range(MAX_RETRIES):
+        try:
+            print(f"API调用尝试 {attempt + 1}/{MAX_RETRIES}...")
+
+            with OPENAI_POOL.lease() as lease:
+                try:
+                    completion = await _async_openai_client(lease.endpoint).chat.completions.create(
+                        **image_translation_request(image_b64)
+                    )
+                except Exception as e:
+                    lease.record_status(getattr(e, 'status_code', None))
+                    if isinstance(e, APIConnectionError):
+                        lease.mark_failed()
+                    raise
+                lease.record_status(200)
+
+            print("API调用成功!")
+            return completion
+
+        except Exception as e:
+            print(f"API错误 (尝试 {attempt + 1}): {e}")
+
+            if attempt < MAX_RETRIES - 1:
+                wait_time = RETRY_DELAY * (attempt + 1)
+                print(f"等待 {wait_time}s 后重试...")
+                await asyncio.sleep(wait_time)
+            else:
+                print(f"所有 {MAX_RETRIES} 次尝试失败")
+                raise
+
+
+async def open_image_from_response_async(completion):
+    """
+    异步版 OpenAIClient.open_image_from_response，返回 (图片字节, 扩展名, 上游响应)
+
+    远程链接只读取响应头，图片字节为 None，正文由调用方转发或读取
+    """
+    all_items = await run_in_threadpool(extract_images, completion)
+    if not all_items:
+        raise Exception("No image found in response")
+
+    image_item = all_items[0]
+
+    if image_item["type"] == "http":
+        upstream = await _http.send(_http.build_request("GET", image_item["url"], timeout=DOWNLOAD_TIMEOUT),
+                                    stream=True)
+        if upstream.is_error:
+            await upstream.aclose()
+            upstream.raise_for_status()
+        return None, format_from_content_type(upstream.headers.get("content-type")), upstream
+    else:
+        ext = ".jpg" if image_item["fmt"] == "jpeg" else ".png"
+        return image_item["data"], ext, None
+
+
+async def release_after(chunks, release):
+    """转发流式响应，发送结束或客户端断开后归还准入名额"""
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        release()
+
+
+async def relay_image(upstream, on_complete):
+    """逐块转发上游图片，完整读取后交给 on_complete（写入翻译缓存）；客户端中途断开时不保存"""
+    chunks = []
+    try:
+        async for chunk in upstream.aiter_bytes(STREAM_CHUNK_SIZE):
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        await upstream.aclose()
+    await run_in_threadpool(on_complete, b"".join(chunks))
+
+
+# ============= 路由 =============
+
+def _request_user(request, user):
+    """与 admission.get_request_user 相同的用户识别规则"""
+    user = user or 'default'
+    if user == 'default':
+        remote_addr = request.client.host if request.client else ''
+        return f"ip:{client_ip(request.headers.get('X-Forwarded-For'), remote_addr)}"
+    return user
+
+
+def _admit(request, user, workflow):
+    """准入控制，返回 (释放函数, 拒绝响应)"""
+    user = _request_user(request, user)
+    try:
+        return admission_controller.admit(user, workflow), None
+    except AdmissionRejected as e:
+        retry_after = max(1, int(e.retry_after + 0.999))
+        print(f"[Admission] 拒绝请求: user={user}, workflow={workflow}, 原因={e.reason}")
+        return None, JSONResponse({
+            "error": "Too many requests",
+            "reason": e.reason,
+            "retry_after": retry_after
+        }, status_code=429, headers={'Retry-After': str(retry_after)})
+
+
+async def _wait_idempotent(entry, fingerprint):
+    """幂等键已存在：等待原请求完成后返回它的结果（与 idempotency.idempotent 的行为一致）"""
+    if entry.fingerprint != fingerprint:
+        return JSONResponse({"error": f"{IDEMPOTENCY_HEADER} was already used with a different request body"},
+                            status_code=422)
+
+    attached = not entry.done
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while not entry.done:
+        if time.monotonic() > deadline:
+            return JSONResponse({"error": "Original request is still in progress"},
+                                status_code=409, headers={'Retry-After': "30"})
+        await asyncio.sleep(1)
+
+    if attached:
+        idempotency_store.attached += 1
+    else:
+        idempotency_store.replayed += 1
+    headers = dict(entry.headers)
+    headers[REPLAYED_HEADER] = "true"
+    return Response(entry.body, status_code=entry.status_code, headers=headers)
+
+
+def workflow_endpoint(task_factory, workflow, idempotent=False):
+    """把工作流任务包装成异步路由"""
+    async def run(request, data):
+        release, rejected = _admit(request, data.get('user'), workflow)
+        if rejected:
+            return rejected
+        try:
+            base_url = ARTIFACT_PUBLIC_BASE_URL or str(request.base_url)
+            payload, status_code = await run_workflow_task_async(task_factory(data, base_url))
+        finally:
+            release()
+        return JSONResponse(payload, status_code=status_code)
+
+    async def endpoint(request):
+        body = await request.body()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+        if not isinstance(data, dict):
+            return JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+
+        key = request.headers.get(IDEMPOTENCY_HEADER) if idempotent else None
+        if not key:
+            return await run(request, data)
+        if len(key) > MAX_KEY_LENGTH:
+            return JSONResponse({"error": f"{IDEMPOTENCY_HEADER} too long"}, status_code=400)
+
+        scope_key = scope_key_for(request.url.path, _request_user(request, data.get('user')), key)
+        fingerprint = request_fingerprint(body)
+        entry, is_owner = idempotency_store.begin(scope_key, fingerprint)
+        if not is_owner:
+            return await _wait_idempotent(entry, fingerprint)
+
+        try:
+            response = await run(request, data)
+        except BaseException:
+            idempotency_store.discard(scope_key, entry)
+            entry.finish(500, b'{"error": "Internal server error"}', {"Content-Type": "application/json"})
+            raise
+        idempotency_store.complete(scope_key, entry, response.status_code, response.body,
+                                   {"Content-Type": response.headers.get("content-type", "application/json")})
+        return response
+    return endpoint
+
+
+async def translate_image(request):
+    """图片翻译接口（异步版，行为与 app.translate_image 相同）"""
+    form = await request.form()
+    file = form.get('image')
+    if file is None or isinstance(file, str):
+        return JSONResponse({"error": "No image file provided"}, status_code=400)
+
+    if file.filename == '':
+        return JSONResponse({"error": "No file selected"}, status_code=400)
+
+    allowed_extensions = {'png', 'jpg', 'jpeg', 'webp', 'bmp'}
+    if not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
+        return JSONResponse({"error": "Invalid file type"}, status_code=400)
+
+    mode = form.get('mode', 'single')
+    if mode not in ('single', 'tiled'):
+        return JSONResponse({"error": "mode must be single or tiled"}, status_code=400)
+
+    user = form.get('user', 'default')
+    release, rejected = _admit(request, user, 'image_translate')
+    if rejected:
+        return rejected
+
+    print(f"\nProcessing: {file.filename} (mode={mode})")
+
+    record_id = str(uuid.uuid4())
+    # 转发上游图片时，名额由响应流归还
+    streaming = False
+    try:
+        await run_in_threadpool(add_conversion_record, {
+            "id": record_id,
+            "user_id": user,
+            "task_type": "image_translate",
+            "input_file_id": None,
+            "input_file_name": file.filename,
+            "status": "processing",
+            "created_at": datetime.now().isoformat(),
+            "extra_params": {"mode": mode}
+        })
+
+        contents = await file.read()
+        upstream = None
+        if mode == 'tiled':
+            # 分块模式的各块在 app 的线程池中并行翻译
+            image_bytes, ext, cache_status, encoding = await run_in_threadpool(
+                translate_image_tiled, io.BytesIO(contents))
+        else:
+            encoded = await run_in_threadpool(preprocess_image, io.BytesIO(contents))
+            print(f"图片编码: {encoded.describe()}")
+            encoding = encoded.report()
+            image_b64 = encoded.b64
+            fingerprint, cached = await run_in_threadpool(lookup_translated_image, image_b64)
+            if cached:
+                image_bytes, ext, cache_status = cached[0], cached[1], 'hit'
+            else:
+                completion = await translate_image_async(image_b64)
+                image_bytes, ext, upstream = await open_image_from_response_async(completion)
+                if upstream is None:
+                    await run_in_threadpool(store_translated_image, fingerprint, image_bytes, ext)
+                cache_status = 'miss'
+
+        await run_in_threadpool(update_conversion_record, record_id, 'completed', None, None)
+
+        stem = f"translated_{file.filename.rsplit('.', 1)[0]}"
+        headers = {'X-Translation-Cache': cache_status, **encoding_headers(encoding)}
+        accept = request.headers.get('accept')
+        if upstream is not None:
+            if negotiate_image_format(accept, format_from_ext(ext)) is None:
+                # 不需要转码时直接转发上游响应
+                headers.update(TranslatedImage(ext, upstream=upstream).stream_headers())
+                headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(stem + ext)}"
+                on_complete = lambda data: store_translated_image(fingerprint, data, ext)  # noqa: E731
+                streaming = True
+                # 响应流没有开始（客户端提前断开）时由 background 归还；release 可以重复调用
+                return StreamingResponse(release_after(relay_image(upstream, on_complete), release),
+                                         media_type='image/png' if ext == '.png' else 'image/jpeg',
+                                         headers=headers, background=BackgroundTask(release))
+            try:
+                image_bytes = await upstream.aread()
+            finally:
+                await upstream.aclose()
+            await run_in_threadpool(store_translated_image, fingerprint, image_bytes, ext)
+
+        data, ext, mimetype, artifact_hash = await run_in_threadpool(deliver_image, image_bytes, ext, accept, stem)
+        headers.update(validator_headers(artifact_hash, ARTIFACT_PUBLIC_BASE_URL or str(request.base_url)))
+        headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(stem + ext)}"
+        return Response(data, media_type=mimetype, headers=headers)
+
+    except Exception as e:
+        print(f"Error: {e}")
+        await run_in_threadpool(update_conversion_record, record_id, 'error', None, str(e))
+        return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        if not streaming:
+            release()
+
+
+ASYNC_ROUTES = [
+    Route('/api/dify/convert', workflow_endpoint(convert_task, 'academic_convert', idempotent=True), methods=['POST']),
+    Route('/api/dify/translate-document', workflow_endpoint(translate_document_task, 'academic_translate'), methods=['POST']),
+    Route('/api/dify/country-report', workflow_endpoint(country_report_task, 'country_report', idempotent=True), methods=['POST']),
+    Route('/api/dify/quarterly-report', workflow_endpoint(quarterly_report_task, 'quarterly_report'), methods=['POST']),
+    Route('/api/translate-image', translate_image, methods=['POST']),
+]
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    global _http
+    _http = httpx.AsyncClient(
+        timeout=httpx.Timeout(WORKFLOW_TIMEOUT),
+        limits=httpx.Limits(max_connections=ASGI_MAX_UPSTREAM_CONNECTIONS,
+                            max_keepalive_connections=ASGI_MAX_UPSTREAM_CONNECTIONS)
+    )
+    print(f"[ASGI] 异步路由: {', '.join(route.path for route in ASYNC_ROUTES)}")
+    try:
+        yield
+    finally:
+        await _http.aclose()
+        for client in _async_openai_clients.values():
+            await client.close()
+
+
+async_app = Starlette(
+    routes=ASYNC_ROUTES,
+    middleware=[Middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_methods=["GET", "POST", "OPTIONS", "PATCH", "DELETE"],
+        allow_headers=["Content-Type", "Authorization", IDEMPOTENCY_HEADER],
+        expose_headers=["Retry-After", REPLAYED_HEADER, "X-Translation-Cache",
+                        "X-Image-Payload-Bytes", "X-Image-Encode-Ms", "X-Image-Encoding",
+                        "ETag", "X-Artifact-Url"]
+    )],
+    lifespan=lifespan
+)
+
+
+class PathDispatcher:
+    """异步路由交给 Starlette，其余请求交给 Flask"""
+
+    def __init__(self, async_app, wsgi_app, async_paths):
+        self.async_app = async_app
+        self.wsgi_app = wsgi_app
+        self.async_paths = set(async_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan" or scope.get("path") in self.async_paths:
+            await self.async_app(scope, receive, send)
+        else:
+            await self.wsgi_app(scope, receive, send)
+
+
+app = PathDispatcher(
+    async_app,
+    WSGIMiddleware(flask_backend.app, workers=ASGI_WSGI_THREADS),
+    [route.path for route in ASYNC_ROUTES]
+)
@@ -0,0 +1,176 @@
+"""
+后台批处理任务
+批量转换等耗时任务在后台线程中执行，接口立即返回任务 ID，
+前端通过 GET /api/jobs/<job_id> 查询状态，或订阅 /api/jobs/<job_id>/events 逐个接收完成的结果
+"""
+import os
+import json
+import time
+import uuid
+import threading
+
+from flask import jsonify, Response
+
+# 已结束任务在内存中保留的时间（秒）
+JOB_TTL = int(os.getenv("JOB_TTL", str(24 * 3600)))
+# 事件流心跳间隔（秒），避免代理断开空闲连接
+EVENT_HEARTBEAT = 15
+
+FINISHED_STATUSES = ('completed', 'error')
+
+
+class BatchJob:
+    """一个批处理任务，包含多个子项"""
+
+    def __init__(self, job_type, items, user='default', params=None, require_all=False):
+        self.id = f"job_{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self.job_type = job_type
+        self.user = user
+        self.params = params or {}
+        # 为 True 时所有子项都成功才算完成（流水线），否则有一项成功即算完成（批量转换）
+        self.require_all = require_all
+        self.items = [dict(item, index=i, status=item.get('status', 'pending')) for i, item in enumerate(items)]
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self._finish_callbacks = []
+        self._cond = threading.Condition()
+
+    @property
+    def status(self):
+        if self.finished_at is None:
+            return 'processing'
+        check = all if self.require_all else any
+        if check(item['status'] == 'completed' for item in self.items):
+            return 'completed'
+        return 'error'
+
+    def on_finish(self, callback):
+        """任务结束（所有子项完成或失败）时调用 callback()；已结束时立即调用"""
+        with self._cond:
+            if self.finished_at is None:
+                self._finish_callbacks.append(callback)
+                return
+        callback()
+
+    def update_item(self, index, **fields):
+        """更新子项；子项结束时推送一条事件"""
+        callbacks = []
+        with self._cond:
+            item = self.items[index]
+            item.update(fields)
+            if fields.get('status') in FINISHED_STATUSES:
+                self.events.append({"type": "item", "item": dict(item)})
+                if self.finished_at is None and all(i['status'] in FINISHED_STATUSES for i in self.items):
+                    self.finished_at = time.time()
+                    self.events.append({"type": "done", "job": self._summary_locked()})
+                    callbacks, self._finish_callbacks = self._finish_callbacks, []
+            elif 'status' in fields:
+                self.events.append({"type": "progress", "item": dict(item)})
+            self._cond.notify_all()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[Jobs] 任务结束回调失败: job={self.id}, 错误={e}")
+
+    def wait_events(self, cursor, timeout):
+        """等待 cursor 之后的新事件，返回 (事件列表, 新 cursor, 是否已结束)"""
+        with self._cond:
+            if cursor >= len(self.events) and self.finished_at is None:
+                self._cond.wait(timeout)
+            events = self.events[cursor:]
+            return events, cursor + len(events), self.finished_at is not None
+
+    def _summary_locked(self):
+        finished = [i for i in self.items if i['status'] in FINISHED_STATUSES]
+        return {
+            "id": self.id,
+            "job_type": self.job_type,
+            "status": self.status,
+            "total": len(self.items),
+            "finished": len(finished),
+            "succeeded": len([i for i in finished if i['status'] == 'completed']),
+            "failed": len([i for i in finished if i['status'] == 'error']),
+        }
+
+    def to_dict(self):
+        with self._cond:
+            summary = self._summary_locked()
+            summary["items"] = [dict(i) for i in self.items]
+            summary["params"] = self.params
+            return summary
+
+
+class JobStore:
+    """内存中的任务表，定期清理过期任务"""
+
+    def __init__(self, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._cleanup_locked()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _cleanup_locked(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+job_store = JobStore()
+
+
+def stream_job_events(job):
+    """以 Server-Sent Events 格式输出任务事件，直到任务结束"""
+    def generate():
+        cursor = 0
+        while True:
+            events, cursor, finished = job.wait_events(cursor, EVENT_HEARTBEAT)
+            if not events:
+                if finished:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if finished and cursor >= len(job.events):
+                return
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+def register_job_routes(app):
+    """注册任务查询路由"""
+
+    @app.route('/api/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        """查询任务状态和每个子项的结果"""
+        job = job_store.get(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({
+            "success": True,
+            "job": job.to_dict()
+        }), 200
+
+    @app.route('/api/jobs/<job_id>/events', methods=['GET'])
+    def get_job_events(job_id):
+        """订阅任务事件流（每完成一个子项推送一次）"""
+        job = job_store.get(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return stream_job_events(job)
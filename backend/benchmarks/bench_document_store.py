@@ -0,0 +1,130 @@
+"""
+文档库存储压测：SQLite 存储对比 PostgREST（Supabase）存储
+
+为一个临时用户写入 --docs 篇文档，然后分别统计单条写入、按 id 读取、第一页列表、
+游标翻页（第 2 页起）、文件夹计数和统计接口的延迟（毫秒，p50/p95）。
+SQLite 使用临时数据库文件；配置了 SUPABASE_URL 时同时测试 PostgREST 存储，
+测试数据写在随机的 user_id 下，结束时删除
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_document_store.py
+    python benchmarks/bench_document_store.py --docs 2000 --page-size 50 --store sqlite
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from document_store import create_document_store  # noqa: E402
+
+FOLDERS = ["金融经济", "国际贸易", "产业研究", "其他"]
+SOURCES = [
+    "https://www.imf.org/en/Publications/WEO/{}.pdf",
+    "https://data.worldbank.org/reports/{}.pdf",
+    "https://www.oecd.org/publications/{}.pdf",
+    "https://example.com/{}.pdf",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def make_doc(user_id, i, now):
+    return {
+        "id": f"bench_{uuid.uuid4().hex[:16]}",
+        "user_id": user_id,
+        "title": f"Benchmark Document {i}",
+        "filename": f"report_{i}.pdf",
+        "file_type": random.choice(["pdf", "pdf", "docx"]),
+        "source_url": random.choice(SOURCES).format(i),
+        "source_type": random.choice(["plugin", "manual", "upload"]),
+        "tags": random.sample(["财政", "贸易", "能源", "非洲", "亚洲"], 2),
+        "folder": random.choice(FOLDERS),
+        "created_at": (now - timedelta(minutes=i)).isoformat(),
+        "updated_at": now.isoformat()
+    }
+
+
+def timed(fn):
+    started_at = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - started_at) * 1000, result
+
+
+def bench_store(store, docs, page_size, repeat):
+    user_id = f"bench_{uuid.uuid4().hex[:12]}"
+    now = datetime.now(timezone.utc)
+    latencies = {name: [] for name in ("写入", "按 id 读取", "第一页", "游标翻页", "文件夹计数", "统计")}
+    ids = []
+    try:
+        for i in range(docs):
+            ms, row = timed(lambda: store.insert_document(make_doc(user_id, i, now)))
+            latencies["写入"].append(ms)
+            ids.append(row['id'])
+
+        for _ in range(repeat):
+            doc_id = random.choice(ids)
+            latencies["按 id 读取"].append(timed(lambda: store.get_document(doc_id))[0])
+            latencies["第一页"].append(timed(lambda: store.list_documents(user_id, limit=page_size))[0])
+            latencies["文件夹计数"].append(timed(lambda: store.folder_counts(user_id))[0])
+            latencies["统计"].append(timed(lambda: store.document_stats(user_id))[0])
+
+        # 游标翻完全部文档
+        after = None
+        while True:
+            ms, page = timed(lambda: store.list_documents(user_id, limit=page_size, after=after))
+            if after is not None:
+                latencies["游标翻页"].append(ms)
+            if len(page) < page_size:
+                break
+            after = {"c": page[-1]['created_at'], "i": page[-1]['id']}
+    finally:
+        for doc_id in ids:
+            store.delete_document(doc_id)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文档库存储压测")
+    parser.add_argument("--store", choices=["sqlite", "postgrest", "both"], default="both")
+    parser.add_argument("--docs", type=int, default=500, help="写入的文档数")
+    parser.add_argument("--page-size", type=int, default=50, help="列表每页文档数")
+    parser.add_argument("--repeat", type=int, default=200, help="读取类操作的重复次数")
+    args = parser.parse_args()
+
+    kinds = ["sqlite", "postgrest"] if args.store == "both" else [args.store]
+    if "postgrest" in kinds and not os.getenv("SUPABASE_URL"):
+        print("未配置 SUPABASE_URL，跳过 PostgREST 存储")
+        kinds.remove("postgrest")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_document_store_") as workdir:
+        for kind in kinds:
+            options = {"path": os.path.join(workdir, "documents.db")} if kind == "sqlite" else {}
+            store = create_document_store(kind, **options)
+            try:
+                results.append((kind, bench_store(store, args.docs, args.page_size, args.repeat)))
+            finally:
+                store.close()
+
+    print()
+    print(f"文档 {args.docs} 篇，每页 {args.page_size} 篇，读取类操作各 {args.repeat} 次（毫秒）")
+    print(f"{'存储':<10}{'操作':<10}{'次数':>8}{'p50':>10}{'p95':>10}")
+    for kind, latencies in results:
+        for name, values in latencies.items():
+            print(f"{kind:<10}{name:<10}{len(values):>8}{percentile(values, 50):>10.2f}{percentile(values, 95):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+响应图片提取压测：对比原来的 extract_image_from_completion 与 completion_images.extract_images
+
+每个响应先还原成 openai SDK 的 ChatCompletion 对象（与线上一致），
+两种实现分别在独立的子进程中处理全部响应，统计 CPU 时间和峰值 RSS 增长。
+
+--responses 指定保存的响应目录（每个文件一个 JSON，即 completion.model_dump_json() 的输出）；
+不指定时生成几种常见形态的模拟响应：message.images 中的 PNG、content 中的 Markdown data URL、
+两处同时带图，以及 content 中只有 http 链接
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_image_extraction.py
+    python benchmarks/bench_image_extraction.py --responses ~/captured --repeat 10
+"""
+import os
+import re
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def legacy_extract(completion):
+    """改造前的实现（只去掉 print），作为对照"""
+    items = []
+    seen = set()
+
+    def add_http(url):
+        u = url.strip()
+        if u.endswith((")", "]", "}", ",")):
+            u = u.rstrip(")]},")
+        key = ("http", u)
+        if key not in seen:
+            seen.add(key)
+            items.append({"type": "http", "url": u, "fmt": None, "b64": None})
+
+    def add_data(fmt, b64):
+        key = ("data", fmt, b64)
+        if key not in seen:
+            seen.add(key)
+            items.append({"type": "data", "url": None, "fmt": fmt.lower(), "b64": b64})
+
+    def add_from_str(s):
+        for m in re.findall(r"https?://\S+", s):
+            add_http(m)
+        for m in re.findall(r"!\[[^\]]*\]\((https?://[^\)]+)\)", s):
+            add_http(m)
+        for m in re.findall(r"data:image/(png|jpeg|jpg);base64,([A-Za-z0-9+/=]+)", s):
+            add_data(m[0], m[1])
+
+    def walk(x):
+        if isinstance(x, dict):
+            for k, v in x.items():
+                if isinstance(v, str):
+                    if k.lower() in ("url", "image_url"):
+                        if v.startswith("http") or v.startswith("data:image"):
+                            add_from_str(v)
+                    add_from_str(v)
+                elif isinstance(v, dict):
+                    if "url" in v and isinstance(v["url"], str):
+                        add_from_str(v["url"])
+                walk(v)
+        elif isinstance(x, list):
+            for v in x:
+                walk(v)
+        elif isinstance(x, str):
+            add_from_str(x)
+
+    obj = completion.model_dump()
+    # 原实现的调试日志会序列化整个响应
+    json.dumps(obj, ensure_ascii=False)[:500]
+    walk(obj)
+    # 原实现在 get_image_from_response 中再解码
+    for item in items[:1]:
+        if item["type"] == "data":
+            base64.b64decode(item["b64"])
+    return items
+
+
+def generate_responses(directory, count, image_kb):
+    """生成模拟响应（大小与真实的翻译结果图相近）"""
+    rnd = random.Random(42)
+
+    def data_url(fmt):
+        payload = base64.b64encode(rnd.getrandbits(8 * image_kb * 1024).to_bytes(image_kb * 1024, "little"))
+        return f"data:image/{fmt};base64,{payload.decode('ascii')}"
+
+    def completion(message):
+        message.setdefault("role", "assistant")
+        return {
+            "id": "gen-bench", "object": "chat.completion", "created": 0, "model": "google/gemini-2.5-flash-image",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": message}]
+        }
+
+    shapes = [
+        ("images", lambda: completion({"content": "", "images": [
+            {"type": "image_url", "image_url": {"url": data_url("png")}}]})),
+        ("markdown", lambda: completion({"content": f"翻译结果：\n![image]({data_url('jpeg')})"})),
+        ("images_and_markdown", lambda: completion({"content": f"![image]({data_url('png')})", "images": [
+            {"type": "image_url", "image_url": {"url": data_url("png")}}]})),
+        ("http_link", lambda: completion({"content": "结果见 https://cdn.example.com/out/translated.png"})),
+    ]
+    for i in range(count):
+        name, build = shapes[i % len(shapes)]
+        with open(os.path.join(directory, f"{i:03d}_{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(build(), f)
+
+
+def run_variant(variant, responses_dir, repeat):
+    """在子进程中执行：提取全部响应 repeat 次"""
+    from openai.types.chat import ChatCompletion
+
+    if variant == "legacy":
+        extract = legacy_extract
+    else:
+        sys.path.insert(0, BACKEND_DIR)
+        from completion_images import extract_images as extract
+
+    files = sorted(os.path.join(responses_dir, f) for f in os.listdir(responses_dir) if f.endswith(".json"))
+    completions = []
+    for path in files:
+        with open(path, "r", encoding="utf-8") as f:
+            completions.append(ChatCompletion.model_validate(json.load(f)))
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    found = 0
+    for _ in range(repeat):
+        for completion in completions:
+            found += 1 if extract(completion) else 0
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(json.dumps({
+        "variant": variant,
+        "responses": len(files) * repeat,
+        "found": found,
+        "cpu_seconds": cpu,
+        "wall_seconds": wall,
+        "ms_per_response": wall * 1000 / max(1, len(files) * repeat),
+        # Linux 上 ru_maxrss 的单位是 KB
+        "rss_growth_mb": (peak_rss - baseline_rss) / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应图片提取压测")
+    parser.add_argument("--responses", help="保存的响应 JSON 目录，不指定时生成模拟响应")
+    parser.add_argument("--count", type=int, default=12, help="生成的模拟响应数量")
+    parser.add_argument("--image-kb", type=int, default=1500, help="模拟图片的大小（KB）")
+    parser.add_argument("--repeat", type=int, default=5, help="每个响应提取的次数")
+    parser.add_argument("--variant", choices=["legacy", "targeted"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.responses, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench_extract_") as workdir:
+        responses_dir = args.responses
+        if not responses_dir:
+            responses_dir = os.path.join(workdir, "responses")
+            os.makedirs(responses_dir)
+            generate_responses(responses_dir, args.count, args.image_kb)
+
+        results = []
+        for variant in ("legacy", "targeted"):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--variant", variant,
+                                  "--responses", responses_dir, "--repeat", str(args.repeat)],
+                                 cwd=workdir, capture_output=True, text=True, check=True)
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print()
+    print(f"{'实现':<10}{'响应数':>8}{'找到图片':>10}{'CPU(s)':>10}{'耗时(s)':>10}{'ms/响应':>10}{'RSS增长MB':>12}")
+    for r in results:
+        print(f"{r['variant']:<10}{r['responses']:>8}{r['found']:>10}{r['cpu_seconds']:>10.2f}{r['wall_seconds']:>10.2f}"
+              f"{r['ms_per_response']:>10.1f}{r['rss_growth_mb']:>12.1f}")
+    legacy, targeted = results
+    if targeted["cpu_seconds"]:
+        print(f"\nCPU 加速: {legacy['cpu_seconds'] / targeted['cpu_seconds']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+图片预处理压测：对比原来的 load_and_preprocess_image 与当前实现
+
+每种实现在独立的子进程中处理整个图片目录，统计 CPU 时间、峰值 RSS 和输出大小。
+没有指定 --corpus 时生成一组模拟的扫描版报告插图（A4 300dpi 扫描 JPEG、PNG 图表、已合规的小 JPEG）
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_image_preprocess.py
+    python benchmarks/bench_image_preprocess.py --corpus ~/scans --repeat 5
+"""
+import os
+import io
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+
+def legacy_preprocess(image_file, max_size=1600, quality=85):
+    """改造前的实现，作为对照"""
+    from PIL import Image
+
+    im = Image.open(image_file).convert("RGB")
+    w, h = im.size
+    m = max(w, h)
+    if m > max_size:
+        scale = max_size / float(m)
+        im = im.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+    buf = io.BytesIO()
+    im.save(buf, format="JPEG", quality=quality, optimize=True)
+    return base64.b64encode(buf.getvalue()).decode("utf-8"), (w, h)
+
+
+def generate_corpus(directory, count):
+    """生成模拟的扫描插图"""
+    from PIL import Image, ImageDraw
+
+    rnd = random.Random(42)
+    kinds = [
+        ("scan_a4", (2480, 3508), "JPEG", {"quality": 95}),
+        ("chart", (2400, 1800), "PNG", {}),
+        ("small", (1200, 900), "JPEG", {"quality": 85}),
+    ]
+    for i in range(count):
+        name, size, fmt, options = kinds[i % len(kinds)]
+        im = Image.new("RGB", size, (250, 248, 240))
+        draw = ImageDraw.Draw(im)
+        # 文字行 + 图表线条 + 扫描噪点
+        for y in range(80, size[1] - 80, 40):
+            x = 100
+            while x < size[0] - 200:
+                width = rnd.randint(20, 120)
+                draw.rectangle([x, y, x + width, y + 14], fill=(rnd.randint(0, 60),) * 3)
+                x += width + rnd.randint(10, 30)
+        for _ in range(30):
+            points = [(rnd.randint(0, size[0]), rnd.randint(0, size[1])) for _ in range(8)]
+            draw.line(points, fill=(rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255)), width=4)
+        noise = Image.effect_noise(size, 12).convert("RGB")
+        im = Image.blend(im, noise, 0.08)
+        ext = ".jpg" if fmt == "JPEG" else ".png"
+        im.save(os.path.join(directory, f"{i:03d}_{name}{ext}"), format=fmt, **options)
+
+
+def run_variant(variant, corpus, repeat):
+    """在子进程中执行：处理整个目录 repeat 次"""
+    if variant == "legacy":
+        preprocess = legacy_preprocess
+    else:
+        sys.path.insert(0, BACKEND_DIR)
+        from app import load_and_preprocess_image as preprocess
+
+    files = sorted(os.path.join(corpus, f) for f in os.listdir(corpus) if f.lower().endswith(IMAGE_EXTENSIONS))
+    payloads = [open(path, "rb").read() for path in files]
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    output_bytes = 0
+    for _ in range(repeat):
+        for data in payloads:
+            b64, _size = preprocess(io.BytesIO(data))
+            output_bytes += len(b64)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(json.dumps({
+        "variant": variant,
+        "images": len(files) * repeat,
+        "cpu_seconds": cpu,
+        "wall_seconds": wall,
+        # Linux 上 ru_maxrss 的单位是 KB
+        "rss_growth_mb": (peak_rss - baseline_rss) / 1024,
+        "peak_rss_mb": peak_rss / 1024,
+        "avg_output_kb": output_bytes / max(1, len(files) * repeat) / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load_and_preprocess_image 压测")
+    parser.add_argument("--corpus", help="图片目录，不指定时生成模拟扫描图")
+    parser.add_argument("--count", type=int, default=12, help="生成的模拟图片数量")
+    parser.add_argument("--repeat", type=int, default=3, help="每张图片处理的次数")
+    parser.add_argument("--variant", choices=["legacy", "fast"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.corpus, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench_image_") as workdir:
+        corpus = args.corpus
+        if not corpus:
+            corpus = os.path.join(workdir, "corpus")
+            os.makedirs(corpus)
+            generate_corpus(corpus, args.count)
+
+        env = dict(os.environ)
+        env.update({
+            "CONVERSION_HISTORY_FILE": os.path.join(workdir, "history.json"),
+            "ARTIFACT_CACHE_DIR": os.path.join(workdir, "artifacts"),
+        })
+        results = []
+        for variant in ("legacy", "fast"):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--variant", variant,
+                                  "--corpus", corpus, "--repeat", str(args.repeat)],
+                                 cwd=workdir, env=env, capture_output=True, text=True, check=True)
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print()
+    print(f"{'实现':<8}{'图片数':>8}{'CPU(s)':>10}{'耗时(s)':>10}{'RSS增长MB':>12}{'峰值RSS MB':>13}{'平均输出KB':>12}")
+    for r in results:
+        print(f"{r['variant']:<8}{r['images']:>8}{r['cpu_seconds']:>10.2f}{r['wall_seconds']:>10.2f}"
+              f"{r['rss_growth_mb']:>12.1f}{r['peak_rss_mb']:>13.1f}{r['avg_output_kb']:>12.1f}")
+    legacy, fast = results
+    if fast["cpu_seconds"]:
+        print(f"\nCPU 加速: {legacy['cpu_seconds'] / fast['cpu_seconds']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
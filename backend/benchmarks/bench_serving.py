@@ -0,0 +1,245 @@
+"""
+服务模式压测：线程模式（gunicorn gthread）对比 ASGI 模式（uvicorn asgi_app）
+
+启动一个模拟的慢速 Dify 上游：每隔 --interval 秒推送一条 SSE 事件，持续 --duration 秒后
+返回 workflow_finished。被测服务的 DIFY_BASE_URLS 指向这个上游，然后同时发起 --concurrency 个
+/api/dify/country-report 请求，统计完成数、延迟，以及服务进程的内存和线程数（仅 Linux）
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_serving.py --concurrency 200 --duration 20
+    python benchmarks/bench_serving.py --mode async --concurrency 500 --duration 60
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ============= 模拟上游 =============
+
+def serve_fake_upstream(port, duration, interval):
+    """模拟 Dify /workflows/run 流式接口"""
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import StreamingResponse
+    from starlette.routing import Route
+
+    async def run_workflow(request):
+        await request.body()
+
+        async def events():
+            yield f"data: {json.dumps({'event': 'workflow_started', 'data': {}})}\n\n"
+            started_at = time.monotonic()
+            while time.monotonic() - started_at < duration:
+                await asyncio.sleep(interval)
+                yield f"data: {json.dumps({'event': 'node_started', 'data': {'node_id': 'llm'}})}\n\n"
+            finished = {
+                "event": "workflow_finished",
+                "data": {"status": "succeeded", "outputs": {"text": "模拟报告内容"}}
+            }
+            yield f"data: {json.dumps(finished, ensure_ascii=False)}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    upstream = Starlette(routes=[Route("/v1/workflows/run", run_workflow, methods=["POST"])])
+    uvicorn.run(upstream, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ============= 工具函数 =============
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"端口 {port} 未就绪")
+
+
+def process_tree(pid):
+    """进程及其子进程的 pid 列表（读取 /proc）"""
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    result, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        result.append(current)
+        stack.extend(children.get(current, []))
+    return result
+
+
+def sample_usage(pid):
+    """返回 (RSS MB, 线程数)"""
+    rss_kb, threads = 0, 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss_kb += int(line.split()[1])
+                    elif line.startswith("Threads:"):
+                        threads += int(line.split()[1])
+        except OSError:
+            continue
+    return rss_kb / 1024, threads
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+# ============= 压测 =============
+
+def start_server(mode, port, upstream_port, threads, concurrency, workdir):
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": BACKEND_DIR,
+        "DIFY_BASE_URLS": f"http://127.0.0.1:{upstream_port}/v1",
+        "COUNTRY_SITUATION_API_KEYS": "app-bench",
+        "CONVERSION_HISTORY_FILE": os.path.join(workdir, "history.json"),
+        "ARTIFACT_CACHE_DIR": os.path.join(workdir, "artifacts"),
+        # 压测不受准入控制限制
+        "USER_RATE_PER_MINUTE": "1000000",
+        "USER_BURST": "1000000",
+        "USER_MAX_CONCURRENCY": "1000000",
+        "COUNTRY_REPORT_MAX_CONCURRENCY": "1000000",
+        # 线程模式下让调度器和 gunicorn 的线程数一致，超出的请求排队而不是直接 503
+        "BATCH_MAX_WORKERS": str(threads),
+        "BATCH_MAX_QUEUE": str(concurrency),
+    })
+
+    if mode == "thread":
+        cmd = [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}",
+               "--worker-class", "gthread", "--workers", "1", "--threads", str(threads), "--timeout", "1900"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning"]
+
+    # 日志目录是相对路径，在临时目录中运行避免写入仓库
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL)
+    wait_for_port(port)
+    return proc
+
+
+async def run_load(port, concurrency, server_pid):
+    import httpx
+
+    latencies, statuses = [], {}
+    peak = {"rss": 0.0, "threads": 0}
+    stop = asyncio.Event()
+
+    async def sampler():
+        while not stop.is_set():
+            rss, threads = sample_usage(server_pid)
+            peak["rss"] = max(peak["rss"], rss)
+            peak["threads"] = max(peak["threads"], threads)
+            await asyncio.sleep(0.5)
+
+    async def one(client, i):
+        started_at = time.monotonic()
+        try:
+            r = await client.post(f"http://127.0.0.1:{port}/api/dify/country-report",
+                                  json={"country": "egypt", "user": f"bench-{i}"})
+            status = r.status_code
+        except Exception as e:
+            status = type(e).__name__
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 200:
+            latencies.append(time.monotonic() - started_at)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        sampler_task = asyncio.create_task(sampler())
+        started_at = time.monotonic()
+        await asyncio.gather(*(one(client, i) for i in range(concurrency)))
+        wall = time.monotonic() - started_at
+        stop.set()
+        await sampler_task
+
+    return {
+        "wall": wall,
+        "statuses": statuses,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "max": max(latencies) if latencies else 0.0,
+        "peak_rss_mb": peak["rss"],
+        "peak_threads": peak["threads"],
+    }
+
+
+def bench_mode(mode, args, upstream_port):
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix="bench_serving_") as workdir:
+        proc = start_server(mode, port, upstream_port, args.threads, args.concurrency, workdir)
+        try:
+            idle_rss, idle_threads = sample_usage(proc.pid)
+            result = asyncio.run(run_load(port, args.concurrency, proc.pid))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    result.update({"mode": mode, "idle_rss_mb": idle_rss, "idle_threads": idle_threads})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="线程模式 vs ASGI 模式压测")
+    parser.add_argument("--mode", choices=["thread", "async", "both"], default="both")
+    parser.add_argument("--concurrency", type=int, default=200, help="同时发起的请求数")
+    parser.add_argument("--duration", type=float, default=20, help="每个上游流持续的秒数")
+    parser.add_argument("--interval", type=float, default=1.0, help="上游推送事件的间隔秒数")
+    parser.add_argument("--threads", type=int, default=64, help="线程模式的 gunicorn 线程数（与 render.yaml 一致）")
+    parser.add_argument("--serve-upstream", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_upstream:
+        serve_fake_upstream(args.serve_upstream, args.duration, args.interval)
+        return
+
+    upstream_port = free_port()
+    upstream = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve-upstream", str(upstream_port),
+                                 "--duration", str(args.duration), "--interval", str(args.interval)])
+    try:
+        wait_for_port(upstream_port)
+        modes = ["thread", "async"] if args.mode == "both" else [args.mode]
+        results = [bench_mode(mode, args, upstream_port) for mode in modes]
+    finally:
+        upstream.terminate()
+        upstream.wait(timeout=30)
+
+    print()
+    print(f"并发 {args.concurrency}，上游流持续 {args.duration}s，线程模式 {args.threads} 线程")
+    print(f"{'模式':<8}{'总耗时':>9}{'p50':>9}{'p95':>9}{'max':>9}{'内存(空闲/峰值)MB':>22}{'线程(空闲/峰值)':>18}  状态码")
+    for r in results:
+        print(f"{r['mode']:<8}{r['wall']:>8.1f}s{r['p50']:>8.1f}s{r['p95']:>8.1f}s{r['max']:>8.1f}s"
+              f"{r['idle_rss_mb']:>12.0f} / {r['peak_rss_mb']:<7.0f}{r['idle_threads']:>10} / {r['peak_threads']:<5}  {r['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
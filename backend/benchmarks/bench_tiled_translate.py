@@ -0,0 +1,158 @@
+"""
+分块翻译压测：对比普通模式（整图缩放）与分块模式（mode=tiled）的耗时和输出分辨率
+
+启动一个模拟的 OpenAI 兼容接口：把收到的图片原样放在 message.content 中返回，
+延迟为 --base-latency + 每百万像素 --latency-per-mp 秒，近似模型耗时随输入尺寸增长的情况。
+被测代码的 OPENAI_API_URLS 指向这个接口，图片翻译缓存关闭
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_tiled_translate.py
+    python benchmarks/bench_tiled_translate.py --sizes 2480x3508,4960x7016 --concurrency 8
+"""
+import os
+import io
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from bench_serving import free_port, wait_for_port
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ============= 模拟上游 =============
+
+def serve_fake_model(port, base_latency, latency_per_mp):
+    """模拟 /v1/chat/completions：延迟后把输入图片原样返回"""
+    import uvicorn
+    from PIL import Image
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    async def completions(request):
+        body = await request.json()
+        image_url = body["messages"][0]["content"][1]["image_url"]["url"]
+        data = base64.b64decode(image_url.split(",", 1)[1])
+        with Image.open(io.BytesIO(data)) as im:
+            megapixels = im.size[0] * im.size[1] / 1e6
+        await asyncio.sleep(base_latency + latency_per_mp * megapixels)
+        return JSONResponse({
+            "id": "bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "bench"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"![translated]({image_url})"}
+            }]
+        })
+
+    upstream = Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+    uvicorn.run(upstream, host="127.0.0.1", port=port, log_level="warning")
+
+
+def generate_scan(size):
+    """模拟扫描页：小字号文字行"""
+    from PIL import Image, ImageDraw
+
+    im = Image.new("RGB", size, (250, 248, 240))
+    draw = ImageDraw.Draw(im)
+    for y in range(60, size[1] - 60, 28):
+        for x in range(60, size[0] - 200, 180):
+            draw.text((x, y), "GDP growth 3.2%", fill=(20, 20, 20))
+    buf = io.BytesIO()
+    im.save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+# ============= 压测 =============
+
+def run_variant(mode, sizes):
+    """在子进程中执行：依次翻译每个尺寸的模拟扫描页"""
+    sys.path.insert(0, BACKEND_DIR)
+    from PIL import Image
+    from app import translate_upload
+
+    results = []
+    for size in sizes:
+        data = generate_scan(size)
+        started_at = time.perf_counter()
+        image_bytes, ext, _, encoding = translate_upload(io.BytesIO(data), mode)
+        elapsed = time.perf_counter() - started_at
+        with Image.open(io.BytesIO(image_bytes)) as im:
+            output_size = im.size
+        results.append({
+            "mode": mode,
+            "input": f"{size[0]}x{size[1]}",
+            "output": f"{output_size[0]}x{output_size[1]}",
+            "seconds": elapsed,
+            "output_kb": len(image_bytes) / 1024,
+            "payload_kb": encoding["payload_bytes"] / 1024,
+        })
+    print(json.dumps(results))
+
+
+def parse_sizes(value):
+    return [tuple(int(v) for v in item.lower().split("x")) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="普通模式 vs 分块模式图片翻译压测")
+    parser.add_argument("--sizes", default="1600x1200,2480x3508,3508x4961", help="输入图片尺寸，逗号分隔")
+    parser.add_argument("--base-latency", type=float, default=2.0, help="模拟模型每次调用的固定延迟（秒）")
+    parser.add_argument("--latency-per-mp", type=float, default=3.0, help="模拟模型每百万像素的额外延迟（秒）")
+    parser.add_argument("--concurrency", type=int, default=4, help="分块并发数（TILE_CONCURRENCY）")
+    parser.add_argument("--serve-model", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--variant", choices=["single", "tiled"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_model:
+        serve_fake_model(args.serve_model, args.base_latency, args.latency_per_mp)
+        return
+    if args.variant:
+        run_variant(args.variant, parse_sizes(args.sizes))
+        return
+
+    port = free_port()
+    upstream = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve-model", str(port),
+                                 "--base-latency", str(args.base_latency),
+                                 "--latency-per-mp", str(args.latency_per_mp)])
+    results = []
+    try:
+        wait_for_port(port)
+        with tempfile.TemporaryDirectory(prefix="bench_tiled_") as workdir:
+            env = dict(os.environ)
+            env.update({
+                "OPENAI_API_URLS": f"http://127.0.0.1:{port}/v1",
+                "OPENAI_API_KEYS": "sk-bench",
+                "IMAGE_CACHE_ENABLED": "false",
+                "TILE_CONCURRENCY": str(args.concurrency),
+                "CONVERSION_HISTORY_FILE": os.path.join(workdir, "history.json"),
+                "ARTIFACT_CACHE_DIR": os.path.join(workdir, "artifacts"),
+            })
+            for mode in ("single", "tiled"):
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), "--variant", mode,
+                                      "--sizes", args.sizes],
+                                     cwd=workdir, env=env, capture_output=True, text=True, check=True)
+                results.extend(json.loads(out.stdout.strip().splitlines()[-1]))
+    finally:
+        upstream.terminate()
+        upstream.wait(timeout=30)
+
+    print()
+    print(f"模拟模型延迟: {args.base_latency}s + {args.latency_per_mp}s/MP，分块并发 {args.concurrency}")
+    print(f"{'模式':<8}{'输入':>12}{'输出':>12}{'耗时(s)':>10}{'上传KB':>10}{'输出KB':>10}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['input']:>12}{r['output']:>12}{r['seconds']:>10.2f}"
+              f"{r['payload_kb']:>10.0f}{r['output_kb']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
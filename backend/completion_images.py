@@ -0,0 +1,140 @@
+"""
+从图片生成模型的响应中提取图片
+
+OpenRouter 等接口把生成的图片放在 choices[].message.images[].image_url.url，
+少数模型放在 message.content（多模态分段或 Markdown 文本）中。
+这里只读取这几个字段，不对整个响应做 model_dump / json.dumps，
+base64 数据直接解码成字节；这些字段都找不到图片时才退回到遍历整个响应的通用扫描
+"""
+import re
+import base64
+import binascii
+
+DATA_URL_PREFIX = "data:image/"
+_DATA_URL_HEADER = re.compile(r"data:image/(png|jpeg|jpg);base64,", re.IGNORECASE)
+_BASE64_RUN = re.compile(r"[A-Za-z0-9+/=]+")
+_HTTP_URL = re.compile(r"https?://[^\s\)\]\}\"'<>,]+")
+
+
+def _field(obj, name):
+    """同时支持 dict 和 openai SDK 的 pydantic 对象（额外字段也可以用 getattr 读取）"""
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _data_item(fmt, payload):
+    fmt = fmt.lower()
+    return {"type": "data", "url": None, "fmt": "jpeg" if fmt == "jpg" else fmt, "data": payload}
+
+
+def _http_item(url):
+    return {"type": "http", "url": url, "fmt": None, "data": None}
+
+
+def _scan_text(text, items, seen):
+    """在一段文本中查找 data URL 和 http(s) 链接"""
+    # base64 数据很长，只从 data URL 头的位置开始截取，不让通用正则扫过整段数据
+    pos = text.find(DATA_URL_PREFIX)
+    while pos != -1:
+        header = _DATA_URL_HEADER.match(text, pos)
+        if header:
+            run = _BASE64_RUN.match(text, header.end())
+            if run:
+                b64 = run.group(0)
+                # message.images 和 content 中常是同一张图
+                key = ("data", len(b64), hash(b64))
+                if key not in seen:
+                    seen.add(key)
+                    try:
+                        items.append(_data_item(header.group(1), base64.b64decode(b64)))
+                    except (binascii.Error, ValueError):
+                        pass
+                pos = run.end()
+            else:
+                pos = header.end()
+        else:
+            pos += len(DATA_URL_PREFIX)
+        pos = text.find(DATA_URL_PREFIX, pos)
+
+    if "http" in text:
+        for url in _HTTP_URL.findall(text):
+            if ("http", url) not in seen:
+                seen.add(("http", url))
+                items.append(_http_item(url))
+
+
+def _image_url(part):
+    """{"type": "image_url", "image_url": {"url": ...}} 或 {"image_url": "..."} 中的 url"""
+    image_url = _field(part, "image_url")
+    if isinstance(image_url, str):
+        return image_url
+    if image_url is not None:
+        return _field(image_url, "url")
+    url = _field(part, "url")
+    return url if isinstance(url, str) else None
+
+
+def extract_known_fields(completion):
+    """只读取 message.images 和 message.content，返回图片列表"""
+    items, seen = [], set()
+    for choice in _field(completion, "choices") or []:
+        message = _field(choice, "message")
+        if message is None:
+            continue
+
+        for part in _field(message, "images") or []:
+            url = _image_url(part)
+            if url:
+                _scan_text(url, items, seen)
+
+        content = _field(message, "content")
+        if isinstance(content, str):
+            _scan_text(content, items, seen)
+        elif isinstance(content, list):
+            for part in content:
+                url = _image_url(part)
+                if url:
+                    _scan_text(url, items, seen)
+                text = _field(part, "text")
+                if isinstance(text, str):
+                    _scan_text(text, items, seen)
+    return items
+
+
+def extract_generic(completion):
+    """通用扫描：遍历整个响应中的所有字符串"""
+    if hasattr(completion, "model_dump"):
+        obj = completion.model_dump()
+    elif isinstance(completion, (dict, list, str)):
+        obj = completion
+    elif hasattr(completion, "__dict__"):
+        obj = completion.__dict__
+    else:
+        obj = str(completion)
+
+    items, seen = [], set()
+    stack = [obj]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, dict):
+            stack.extend(reversed(list(x.values())))
+        elif isinstance(x, (list, tuple)):
+            stack.extend(reversed(x))
+        elif isinstance(x, str):
+            _scan_text(x, items, seen)
+    return items
+
+
+def extract_images(completion):
+    """
+    提取响应中的图片，返回列表，每项为
+    {"type": "data" | "http", "url": http 链接, "fmt": 图片格式, "data": 解码后的字节}
+    """
+    items = extract_known_fields(completion)
+    if items:
+        return items
+    items = extract_generic(completion)
+    if items:
+        print(f"[Image Extract] 已知字段中没有图片，通用扫描找到 {len(items)} 项")
+    return items
@@ -0,0 +1,104 @@
+"""
+单个文档的元数据缓存
+在前端打开一个文档时，/api/documents/<id>、/api/documents/<id>/url、/api/documents/<id>/download
+会依次请求，原来每次都要向 Supabase 查询同一行。
+
+按文档 id 缓存查询结果（读穿透）：
+- 条目超过 DOCUMENT_CACHE_TTL 秒后重新查询，条目数超过 DOCUMENT_CACHE_MAX_ENTRIES 时淘汰最久未访问的
+- PATCH 用更新后的行替换条目，DELETE 删除条目
+- 不存在的文档不缓存
+"""
+import os
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+# ============= 配置区域 =============
+DOCUMENT_CACHE_ENABLED = os.getenv("DOCUMENT_CACHE_ENABLED", "true").lower() != "false"
+DOCUMENT_CACHE_TTL = float(os.getenv("DOCUMENT_CACHE_TTL", "60"))
+DOCUMENT_CACHE_MAX_ENTRIES = int(os.getenv("DOCUMENT_CACHE_MAX_ENTRIES", "1024"))
+
+
+class DocumentMetadataCache:
+    """文档 id -> (过期时间, 行)，按访问顺序做 LRU 淘汰"""
+
+    def __init__(self, ttl=DOCUMENT_CACHE_TTL, max_entries=DOCUMENT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # 写入计数：查询期间文档被修改或删除时，不用查询结果覆盖
+        self._writes = {}
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, doc_id, loader):
+        """
+        返回文档行的副本，未命中时调用 loader(doc_id) 查询（返回 None 表示不存在）
+        """
+        if not DOCUMENT_CACHE_ENABLED:
+            return loader(doc_id)
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is not None:
+                expires_at, doc = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(doc_id)
+                    self.hits += 1
+                    return copy.deepcopy(doc)
+                del self._entries[doc_id]
+                self.expirations += 1
+            self.misses += 1
+            writes = self._writes.get(doc_id, 0)
+
+        doc = loader(doc_id)
+        if doc is not None:
+            with self._lock:
+                if self._writes.get(doc_id, 0) == writes:
+                    self._store_locked(doc_id, doc)
+        return doc
+
+    def _store_locked(self, doc_id, doc):
+        self._entries[doc_id] = (time.monotonic() + self.ttl, copy.deepcopy(doc))
+        self._entries.move_to_end(doc_id)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._writes.pop(evicted, None)
+            self.evictions += 1
+
+    def put(self, doc_id, doc):
+        """文档被修改后用新的行替换条目"""
+        if not DOCUMENT_CACHE_ENABLED:
+            return
+        with self._lock:
+            self._writes[doc_id] = self._writes.get(doc_id, 0) + 1
+            self._store_locked(doc_id, doc)
+
+    def invalidate(self, doc_id):
+        """文档被删除（或修改后没有返回新的行）时删除条目"""
+        with self._lock:
+            if len(self._writes) > self.max_entries * 4:
+                self._writes.clear()
+            self._writes[doc_id] = self._writes.get(doc_id, 0) + 1
+            if self._entries.pop(doc_id, None) is not None:
+                self.invalidations += 1
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": DOCUMENT_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
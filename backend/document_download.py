@@ -0,0 +1,195 @@
+"""
+文档下载代理（/api/documents/<id>/download）
+原来先把远程 PDF 完整下载到内存再返回，每次点击都重新下载。
+
+- 文件保存在单独的下载缓存中（DOCUMENT_DOWNLOAD_CACHE_DIR，按内容寻址，LRU 淘汰），
+  不与产物缓存共用容量，大 PDF 不会挤掉历史记录引用的工作流产物；
+  来源 URL 和上游的 ETag / Last-Modified 记录在元数据里；
+  命中时由 send_file 返回，支持 Range，PDF.js 可以按需分段加载
+- 缓存超过 DOCUMENT_REVALIDATE_AFTER 秒后用条件 GET（If-None-Match / If-Modified-Since）向上游确认，
+  304 时继续使用缓存；上游不可用时也退回到缓存
+- 未命中时逐块转发上游响应，同时写入缓存；带 Range 的请求直接把 Range 转发给上游，
+  并在后台下载完整文件，之后的分段请求从缓存返回
+"""
+import os
+import time
+import threading
+
+import requests
+from flask import Response, jsonify, request, send_file
+
+from artifact_cache import ArtifactCache, CHUNK_SIZE
+
+# ============= 配置区域 =============
+DOCUMENT_DOWNLOAD_CACHE_DIR = os.getenv(
+    "DOCUMENT_DOWNLOAD_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "documents")
+)
+DOCUMENT_DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_DOWNLOAD_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# 缓存在这段时间内直接使用，不向上游确认（秒）
+DOCUMENT_REVALIDATE_AFTER = int(os.getenv("DOCUMENT_REVALIDATE_AFTER", "300"))
+# 连接超时、两次读取之间的超时（秒）；不限制整个文件的下载时间
+DOCUMENT_CONNECT_TIMEOUT = 10
+DOCUMENT_READ_TIMEOUT = 60
+DOCUMENT_MIMETYPE = 'application/pdf'
+
+# 转发给上游 / 从上游转发回来的响应头
+_RANGE_RESPONSE_HEADERS = ('Content-Range', 'Content-Length', 'Accept-Ranges', 'ETag', 'Last-Modified')
+_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Range',
+    'Access-Control-Expose-Headers': 'Accept-Ranges, Content-Range, Content-Length, ETag',
+}
+
+download_cache = ArtifactCache(DOCUMENT_DOWNLOAD_CACHE_DIR, DOCUMENT_DOWNLOAD_CACHE_MAX_BYTES)
+
+_filling = set()
+_filling_lock = threading.Lock()
+
+
+def _timeout():
+    return DOCUMENT_CONNECT_TIMEOUT, DOCUMENT_READ_TIMEOUT
+
+
+def _validators(upstream):
+    """上游响应的校验信息，保存在缓存元数据中"""
+    return {
+        "upstream_etag": upstream.headers.get('ETag'),
+        "upstream_last_modified": upstream.headers.get('Last-Modified'),
+        "checked_at": time.time()
+    }
+
+
+def _conditional_headers(meta):
+    headers = {}
+    if meta.get("upstream_etag"):
+        headers['If-None-Match'] = meta["upstream_etag"]
+    if meta.get("upstream_last_modified"):
+        headers['If-Modified-Since'] = meta["upstream_last_modified"]
+    return headers
+
+
+def _disposition(filename):
+    return {'Content-Disposition': f'attachment; filename="{filename}"'}
+
+
+def _cached_response(artifact_hash, filename, status):
+    """从缓存返回（send_file 处理 Range、If-Range、If-None-Match）"""
+    response = send_file(
+        download_cache.path(artifact_hash),
+        mimetype=DOCUMENT_MIMETYPE,
+        as_attachment=True,
+        download_name=filename,
+        conditional=True,
+        etag=artifact_hash
+    )
+    response.headers.update(_CORS_HEADERS)
+    response.headers['X-Document-Cache'] = status
+    return response
+
+
+def _fill_in_background(file_url, filename):
+    """后台下载完整文件写入缓存（同一 URL 同时只下载一次）"""
+    with _filling_lock:
+        if file_url in _filling:
+            return
+        _filling.add(file_url)
+
+    def run():
+        try:
+            with requests.get(file_url, stream=True, timeout=_timeout()) as upstream:
+                upstream.raise_for_status()
+                download_cache.put_stream(upstream.iter_content(CHUNK_SIZE), filename=filename,
+                                          mimetype=DOCUMENT_MIMETYPE, source_url=file_url,
+                                          extra_meta=_validators(upstream))
+            print(f"[Download] 已缓存: {file_url}")
+        except Exception as e:
+            print(f"[Download] 后台缓存失败: {file_url}: {e}")
+        finally:
+            with _filling_lock:
+                _filling.discard(file_url)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _relay(upstream, filename, status_header, cache_as=None):
+    """
+    逐块转发上游响应；cache_as 不为 None 时同时写入缓存（cache_as 为来源 URL）
+    """
+    headers = dict(_CORS_HEADERS)
+    headers.update(_disposition(filename))
+    headers['X-Document-Cache'] = status_header
+    for name in _RANGE_RESPONSE_HEADERS:
+        if upstream.headers.get(name):
+            headers[name] = upstream.headers[name]
+    if upstream.headers.get('Content-Encoding'):
+        # requests 会解压，长度、分段与转发的字节数不一致
+        headers.pop('Content-Length', None)
+        headers.pop('Content-Range', None)
+        headers.pop('Accept-Ranges', None)
+    # Accept-Ranges 只在上游声明时转发：上游不支持 Range 时，PDF.js 之后的分段请求会得到完整文件
+
+    chunks = upstream.iter_content(CHUNK_SIZE)
+    if cache_as:
+        chunks = download_cache.stream_through(chunks, filename=filename, mimetype=DOCUMENT_MIMETYPE,
+                                               source_url=cache_as, extra_meta=_validators(upstream))
+
+    def generate():
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            # 客户端中途断开时丢弃未写完的缓存文件
+            chunks.close()
+            upstream.close()
+
+    return Response(generate(), status=upstream.status_code, mimetype=DOCUMENT_MIMETYPE, headers=headers)
+
+
+def download_response(file_url, filename):
+    """代理下载 file_url，返回 Flask 响应"""
+    range_header = request.headers.get('Range')
+    artifact_hash = download_cache.lookup(file_url)
+    meta = (download_cache.meta(artifact_hash) or {}) if artifact_hash else {}
+
+    if artifact_hash and time.time() - meta.get("checked_at", 0) < DOCUMENT_REVALIDATE_AFTER:
+        return _cached_response(artifact_hash, filename, 'HIT')
+
+    upstream_headers = _conditional_headers(meta) if artifact_hash else {}
+    if not artifact_hash and range_header:
+        upstream_headers['Range'] = range_header
+    try:
+        upstream = requests.get(file_url, headers=upstream_headers, stream=True, timeout=_timeout())
+    except requests.exceptions.RequestException as e:
+        if artifact_hash:
+            print(f"[Download] 上游不可用，使用缓存: {e}")
+            return _cached_response(artifact_hash, filename, 'STALE')
+        raise
+
+    if upstream.status_code == 304 and artifact_hash:
+        upstream.close()
+        download_cache.update_meta(artifact_hash, checked_at=time.time())
+        return _cached_response(artifact_hash, filename, 'REVALIDATED')
+
+    if upstream.status_code not in (200, 206):
+        upstream.close()
+        if artifact_hash:
+            print(f"[Download] 上游返回 {upstream.status_code}，使用缓存")
+            return _cached_response(artifact_hash, filename, 'STALE')
+        return jsonify({"error": f"Failed to download: {upstream.status_code}"}), 500
+
+    if range_header and artifact_hash and upstream.status_code == 200:
+        # 缓存已过期且上游文件已变化：重新按 Range 请求这一段
+        upstream.close()
+        upstream = requests.get(file_url, headers={'Range': range_header}, stream=True, timeout=_timeout())
+        if upstream.status_code not in (200, 206):
+            upstream.close()
+            return jsonify({"error": f"Failed to download: {upstream.status_code}"}), 500
+
+    if upstream.status_code == 206:
+        # 只转发这一段，完整文件在后台下载到缓存
+        _fill_in_background(file_url, filename)
+        return _relay(upstream, filename, 'MISS')
+    # 上游返回完整文件（包括忽略了 Range 的情况）：边转发边缓存
+    return _relay(upstream, filename, 'MISS', file_url)
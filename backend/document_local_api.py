@@ -2,16 +2,23 @@
 文档管理 API（本地存储模式）
 只存储文档索引，文件保存在用户本地
 
-使用直接的 HTTP 请求访问 Supabase REST API，绕过 DNS 解析问题
+文档索引保存在 Supabase（默认）或本地 SQLite 中，由 DOCUMENT_STORE 选择，见 document_store.py
 """
 import os
 import json
 import uuid
-import requests
+import base64
 from datetime import datetime
 from flask import request, jsonify
 from dotenv import load_dotenv
 
+from document_store import get_document_store, DOCUMENT_FIELDS
+from document_search import search_documents, mirror_upsert, mirror_delete
+from library_stats import LibraryStatsCache, LIBRARY_STATS_CACHE_ENABLED, RECENT_DAYS, STATS_COLUMNS
+from website_sources import website_list, website_host_pattern
+from document_cache import DocumentMetadataCache
+from document_download import download_response, download_cache
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -19,46 +26,104 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 STORAGE_BUCKET_NAME = "documents"  # 存储桶名称
 
 print(f"[DEBUG] Supabase URL: {SUPABASE_URL}")
-print(f"[DEBUG] Supabase Key: {SUPABASE_KEY[:20]}...")
+print(f"[DEBUG] Supabase Key: {(SUPABASE_KEY or '')[:20]}...")
+
+# 文档库存储（DOCUMENT_STORE=postgrest|sqlite，见 document_store.py）
+store = get_document_store()
+
 
-# Supabase REST API 端点
-SUPABASE_REST_URL = f"{SUPABASE_URL}/rest/v1"
+def get_storage_url(file_path):
+    """获取存储文件的公开URL"""
+    return f"{SUPABASE_URL}/storage/v1/object/public/{STORAGE_BUCKET_NAME}/{file_path}"
 
-# 设置请求头
-headers = {
-    "apikey": SUPABASE_KEY,
-    "Authorization": f"Bearer {SUPABASE_KEY}",
-    "Content-Type": "application/json",
-    "Prefer": "return=representation"
-}
 
-def supabase_request(method, table, data=None, params=None):
+# 游标分页依赖的列，始终返回
+CURSOR_FIELDS = ('id', 'created_at')
+# 每页文档数的默认值和上限
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def parse_fields(value):
     """
-    直接发送 HTTP 请求到 Supabase REST API
+    解析 fields=title,tags,... 为要返回的列，未指定时返回 None（全部列）
+
+    未知列抛出 ValueError
     """
-    url = f"{SUPABASE_REST_URL}/{table}"
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in DOCUMENT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    for f in CURSOR_FIELDS:
+        if f not in fields:
+            fields.append(f)
+    return fields
+
+
+def parse_page_size(value):
+    """解析 limit，限制在 1..MAX_PAGE_SIZE；不是整数时抛出 ValueError"""
+    if value is None:
+        return DEFAULT_PAGE_SIZE
     try:
-        if method == "GET":
-            response = requests.get(url, headers=headers, params=params)
-        elif method == "POST":
-            response = requests.post(url, headers=headers, json=data)
-        elif method == "PATCH":
-            response = requests.patch(url, headers=headers, json=data, params=params)
-        elif method == "DELETE":
-            response = requests.delete(url, headers=headers, params=params)
-        else:
-            raise ValueError(f"Unsupported method: {method}")
-
-        response.raise_for_status()
-        return response
-    except requests.exceptions.RequestException as e:
-        print(f"[ERROR] Supabase request failed: {e}")
-        raise Exception(f"Supabase request failed: {e}")
+        limit = int(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError("limit must be an integer") from e
+    return min(max(limit, 1), MAX_PAGE_SIZE)
 
 
-def get_storage_url(file_path):
-    """获取存储文件的公开URL"""
-    return f"{SUPABASE_URL}/storage/v1/object/public/{STORAGE_BUCKET_NAME}/{file_path}"
+def parse_offset(value):
+    """解析 offset（参数或游标中的 o），负数按 0 处理；不是整数时抛出 ValueError"""
+    try:
+        return max(int(value or 0), 0)
+    except (TypeError, ValueError) as e:
+        raise ValueError("offset must be an integer") from e
+
+
+def encode_cursor(position):
+    """游标：{"c": created_at, "i": id}（按时间排序）或 {"o": offset}（按相关度排序）"""
+    raw = json.dumps(position, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(position, dict) or not (('c' in position and 'i' in position) or 'o' in position):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+def normalize_tags(documents):
+    """规范化标签为纯字符串（Supabase可能返回对象格式）"""
+    for doc in documents:
+        if 'tags' in doc and doc['tags']:
+            normalized_tags = []
+            for tag in doc['tags']:
+                if isinstance(tag, dict) and 'label' in tag:
+                    normalized_tags.append(tag['label'])
+                else:
+                    normalized_tags.append(str(tag))
+            doc['tags'] = normalized_tags
+    return documents
+
+
+# 单个文档的元数据缓存（/api/documents/<id>、/url、/download）
+document_cache = DocumentMetadataCache()
+
+
+def get_document_row(doc_id):
+    """查询一个文档（经过元数据缓存），不存在时返回 None"""
+    return document_cache.get(doc_id, store.get_document)
+
+
+# 文档库统计缓存（/api/stats、/api/folders、/api/websites）
+library_stats = LibraryStatsCache(lambda user_id: store.user_documents(user_id, STATS_COLUMNS.split(',')))
 
 
 def register_document_routes(app):
@@ -105,16 +170,14 @@ def register_document_routes(app):
                 "updated_at": datetime.now().isoformat()
             }
 
-            response = supabase_request("POST", "documents", document_data)
-
-            if response.status_code in [200, 201]:
-                return jsonify({
-                    "success": True,
-                    "document": response.json()[0] if response.json() else document_data,
-                    "message": "Document index created"
-                }), 200
-            else:
-                return jsonify({"error": f"Failed to create index: {response.text}"}), 500
+            document = store.insert_document(document_data)
+            mirror_upsert(document)
+            library_stats.record_upsert(document, created=True)
+            return jsonify({
+                "success": True,
+                "document": document,
+                "message": "Document index created"
+            }), 200
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -122,61 +185,72 @@ def register_document_routes(app):
 
     @app.route('/api/documents', methods=['GET'])
     def get_documents():
-        """获取文档列表（分页、筛选）"""
+        """
+        获取文档列表（分页、筛选）
+
+        分页：按 (created_at, id) 降序的游标分页，下一页传入上一页返回的 next_cursor（兼容旧的 offset 参数）
+        fields：只返回指定的列（逗号分隔），例如 fields=title,tags,folder,source_url；id 和 created_at 始终返回
+        """
         try:
             user_id = request.args.get('user_id', 'default')
             folder = request.args.get('folder')
             tag = request.args.get('tag')
             search = request.args.get('search')
             website = request.args.get('website')  # 按来源网站筛选
-            limit = int(request.args.get('limit', 50))
-
-            # 构建查询参数
-            params = {
-                "user_id": f"eq.{user_id}",
-                "order": "created_at.desc",
-                "limit": limit
-            }
-
-            if folder:
-                params["folder"] = f"eq.{folder}"
-
-            response = supabase_request("GET", "documents", params=params)
-            documents = response.json()
-
-            # 规范化标签为纯字符串（Supabase可能返回对象格式）
-            for doc in documents:
-                if 'tags' in doc and doc['tags']:
-                    normalized_tags = []
-                    for tag in doc['tags']:
-                        if isinstance(tag, dict) and 'label' in tag:
-                            normalized_tags.append(tag['label'])
-                        else:
-                            normalized_tags.append(str(tag))
-                    doc['tags'] = normalized_tags
-
-            # 客户端标签筛选
-            if tag:
-                documents = [d for d in documents if tag in (d.get('tags') or [])]
-
-            # 按来源网站筛选
-            if website:
-                documents = [d for d in documents if d.get('source_url') and website.lower() in d.get('source_url', '').lower()]
-
-            # 客户端搜索
+            cursor = request.args.get('cursor')
+            try:
+                limit = parse_page_size(request.args.get('limit'))
+                offset = parse_offset(request.args.get('offset'))
+                fields = parse_fields(request.args.get('fields'))
+                position = decode_cursor(cursor) if cursor else None
+                if position and 'o' in position:
+                    offset = parse_offset(position['o'])
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+            # 有搜索词时优先使用全文检索（按相关度排序，带高亮片段）
             if search:
-                search_lower = search.lower()
-                documents = [
-                    d for d in documents
-                    if search_lower in d.get('title', '').lower()
-                    or search_lower in d.get('filename', '').lower()
-                    or (d.get('notes') and search_lower in d.get('notes', '').lower())
-                ]
+                documents = search_documents(
+                    search, user_id, store.user_documents, store.call_rpc,
+                    folder=folder, tag=tag, source_pattern=website_host_pattern(website) if website else None,
+                    limit=limit + 1, offset=offset
+                )
+                if documents is not None:
+                    has_more = len(documents) > limit
+                    documents = documents[:limit]
+                    if fields:
+                        keep = set(fields) | {'score', 'highlights'}
+                        documents = [{k: v for k, v in d.items() if k in keep} for d in documents]
+                    return jsonify({
+                        "success": True,
+                        "documents": normalize_tags(documents),
+                        "count": len(documents),
+                        "offset": offset,
+                        "has_more": has_more,
+                        "next_cursor": encode_cursor({"o": offset + limit}) if has_more and documents else None,
+                        "ranked": True
+                    }), 200
+
+            # 筛选条件都在数据库端执行，分页基于筛选后的结果；多取一条用于判断是否还有下一页
+            after = position if position and 'c' in position else None
+            documents = store.list_documents(
+                user_id, folder=folder, tag=tag, website=website, search=search, fields=fields,
+                limit=limit + 1, offset=offset, after=after
+            )
+            has_more = len(documents) > limit
+            documents = normalize_tags(documents[:limit])
+            next_cursor = None
+            if has_more and documents:
+                last = documents[-1]
+                next_cursor = encode_cursor({"c": last['created_at'], "i": last['id']})
 
             return jsonify({
                 "success": True,
                 "documents": documents,
-                "count": len(documents)
+                "count": len(documents),
+                "offset": offset,
+                "has_more": has_more,
+                "next_cursor": next_cursor
             }), 200
 
         except Exception as e:
@@ -187,14 +261,12 @@ def register_document_routes(app):
     def get_document(doc_id):
         """获取单个文档详情"""
         try:
-            params = {"id": f"eq.{doc_id}", "limit": 1}
-            response = supabase_request("GET", "documents", params=params)
-            documents = response.json()
+            doc = get_document_row(doc_id)
 
-            if documents:
+            if doc:
                 return jsonify({
                     "success": True,
-                    "document": documents[0]
+                    "document": doc
                 }), 200
             else:
                 return jsonify({"error": "Document not found"}), 404
@@ -207,15 +279,11 @@ def register_document_routes(app):
     def get_document_url(doc_id):
         """获取文档的预览URL"""
         try:
-            params = {"id": f"eq.{doc_id}", "limit": 1}
-            response = supabase_request("GET", "documents", params=params)
-            documents = response.json()
+            doc = get_document_row(doc_id)
 
-            if not documents:
+            if not doc:
                 return jsonify({"error": "Document not found"}), 404
 
-            doc = documents[0]
-
             # 如果有 source_url，都尝试使用 PDF.js 预览
             if doc.get('source_url'):
                 source_url = doc['source_url']
@@ -244,18 +312,14 @@ def register_document_routes(app):
 
     @app.route('/api/documents/<doc_id>/download', methods=['GET'])
     def download_document(doc_id):
-        """代理下载文档（解决跨域问题）"""
+        """代理下载文档（解决跨域问题），见 document_download.py"""
         try:
             # 先获取文档信息
-            params = {"id": f"eq.{doc_id}", "limit": 1}
-            response = supabase_request("GET", "documents", params=params)
-            documents = response.json()
+            doc = get_document_row(doc_id)
 
-            if not documents:
+            if not doc:
                 return jsonify({"error": "Document not found"}), 404
 
-            doc = documents[0]
-
             # 获取文件 URL
             file_url = None
             filename = doc.get('filename', 'document.pdf')
@@ -268,25 +332,8 @@ def register_document_routes(app):
             if not file_url:
                 return jsonify({"error": "No file available"}), 404
 
-            # 通过后端代理下载
-            import requests
-            file_response = requests.get(file_url, timeout=30)
-
-            if file_response.status_code != 200:
-                return jsonify({"error": f"Failed to download: {file_response.status_code}"}), 500
-
-            # 返回文件，添加 CORS 相关头
-            from flask import Response
-            return Response(
-                file_response.content,
-                mimetype='application/pdf',
-                headers={
-                    'Content-Disposition': f'attachment; filename="{filename}"',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type',
-                }
-            )
+            # 通过后端代理下载（逐块转发，支持 Range，文件缓存在本地）
+            return download_response(file_url, filename)
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -312,16 +359,17 @@ def register_document_routes(app):
             if 'folder' in data:
                 update_data['folder'] = data['folder']
 
-            params = {"id": f"eq.{doc_id}"}
-            response = supabase_request("PATCH", "documents", update_data, params)
-
-            if response.status_code in [200, 204] or response.json():
-                return jsonify({
-                    "success": True,
-                    "document": response.json()[0] if response.json() else update_data
-                }), 200
+            document = store.update_document(doc_id, update_data)
+            if document:
+                mirror_upsert(document)
+                library_stats.record_upsert(document)
+                document_cache.put(doc_id, document)
             else:
-                return jsonify({"error": "Update failed"}), 500
+                document_cache.invalidate(doc_id)
+            return jsonify({
+                "success": True,
+                "document": document or update_data
+            }), 200
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -331,8 +379,11 @@ def register_document_routes(app):
     def delete_document(doc_id):
         """删除文档索引（文件仍在本地）"""
         try:
-            params = {"id": f"eq.{doc_id}"}
-            supabase_request("DELETE", "documents", params=params)
+            deleted_rows = store.delete_document(doc_id)
+            mirror_delete(doc_id)
+            document_cache.invalidate(doc_id)
+            for deleted in deleted_rows:
+                library_stats.record_delete(deleted)
 
             return jsonify({
                 "success": True,
@@ -390,16 +441,14 @@ def register_document_routes(app):
                 "updated_at": datetime.now().isoformat()
             }
 
-            response = supabase_request("POST", "documents", document_data)
-
-            if response.status_code in [200, 201]:
-                return jsonify({
-                    "success": True,
-                    "document": response.json()[0] if response.json() else document_data,
-                    "message": f"Document saved to folder '{folder}'"
-                }), 200
-            else:
-                return jsonify({"error": f"Failed to create index: {response.text}"}), 500
+            document = store.insert_document(document_data)
+            mirror_upsert(document)
+            library_stats.record_upsert(document, created=True)
+            return jsonify({
+                "success": True,
+                "document": document,
+                "message": f"Document saved to folder '{folder}'"
+            }), 200
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -411,11 +460,12 @@ def register_document_routes(app):
         try:
             user_id = request.args.get('user_id', 'default')
 
-            # 测试 Supabase 连接
+            # 统计每个文件夹的文档数（统计缓存，未启用时由数据库分组计数）
             try:
-                params = {"user_id": f"eq.{user_id}"}
-                response = supabase_request("GET", "folders", params=params)
-                folders = response.json()
+                if LIBRARY_STATS_CACHE_ENABLED:
+                    folder_counts = library_stats.folder_counts(user_id)
+                else:
+                    folder_counts = store.folder_counts(user_id)
             except Exception as e:
                 return jsonify({
                     "success": False,
@@ -434,16 +484,6 @@ def register_document_routes(app):
                 {"id": "other", "name": "其他", "count": 0, "color": "#6B7280"},
             ]
 
-            # 统计每个文件夹的文档数
-            docs_params = {"user_id": f"eq.{user_id}", "select": "folder"}
-            docs_response = supabase_request("GET", "documents", params=docs_params)
-            docs = docs_response.json()
-
-            folder_counts = {}
-            for doc in docs:
-                folder = doc.get('folder', '其他')
-                folder_counts[folder] = folder_counts.get(folder, 0) + 1
-
             # 更新计数
             for folder in default_folders:
                 if folder['name'] == '其他':
@@ -485,15 +525,11 @@ def register_document_routes(app):
                 "created_at": datetime.now().isoformat()
             }
 
-            response = supabase_request("POST", "folders", folder_data)
-
-            if response.status_code in [200, 201]:
-                return jsonify({
-                    "success": True,
-                    "folder": response.json()[0]
-                }), 200
-            else:
-                return jsonify({"error": "Failed to create folder"}), 500
+            folder = store.create_folder(folder_data)
+            return jsonify({
+                "success": True,
+                "folder": folder
+            }), 200
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -505,26 +541,10 @@ def register_document_routes(app):
         try:
             user_id = request.args.get('user_id', 'default')
 
-            params = {"user_id": f"eq.{user_id}"}
-            response = supabase_request("GET", "documents", params=params)
-            documents = response.json()
-
-            # 统计信息
-            stats = {
-                "total": len(documents),
-                "by_source": {
-                    "plugin": len([d for d in documents if d.get('source_type') == 'plugin']),
-                    "manual": len([d for d in documents if d.get('source_type') == 'manual']),
-                    "upload": len([d for d in documents if d.get('source_type') == 'upload'])
-                },
-                "by_type": {},
-                "recent_count": len([d for d in documents if (datetime.now() - datetime.fromisoformat(d['created_at'].replace('Z', '+00:00')).replace(tzinfo=None)).days < 7])
-            }
-
-            # 按文件类型统计
-            for doc in documents:
-                file_type = doc.get('file_type', 'unknown')
-                stats['by_type'][file_type] = stats['by_type'].get(file_type, 0) + 1
+            if LIBRARY_STATS_CACHE_ENABLED:
+                stats = library_stats.stats(user_id)
+            else:
+                stats = store.document_stats(user_id, RECENT_DAYS)
 
             return jsonify({
                 "success": True,
@@ -541,84 +561,35 @@ def register_document_routes(app):
         try:
             user_id = request.args.get('user_id', 'default')
 
-            # 获取所有文档
-            params = {"user_id": f"eq.{user_id}", "select": "source_url"}
-            response = supabase_request("GET", "documents", params=params)
-            documents = response.json()
-
-            # 预定义所有已知网站（包含没有文档的）
-            known_websites = [
-                {'key': 'worldbank.org', 'name': '世界银行'},
-                {'key': 'imf.org', 'name': 'IMF国际货币基金组织'},
-                {'key': 'un.org', 'name': '联合国'},
-                {'key': 'unea', 'name': '联合国非洲经济委员会'},
-                {'key': 'uneca', 'name': '联合国非洲经济委员会'},
-                {'key': 'afdb.org', 'name': '非洲开发银行'},
-                {'key': 'wto.org', 'name': 'WTO世贸组织'},
-                {'key': 'oecd.org', 'name': 'OECD经合组织'},
-                {'key': 'nielsen.com', 'name': 'Nielsen尼尔森'},
-                {'key': 'mckinsey.com', 'name': '麦肯锡'},
-                {'key': 'bcg.com', 'name': '波士顿咨询'},
-                {'key': 'bain.com', 'name': '贝恩咨询'},
-                {'key': 'centralbank.gov.cn', 'name': '中国人民银行'},
-                {'key': 'stats.gov.cn', 'name': '国家统计局'},
-            ]
-
-            # 网站映射用于匹配
-            website_match_map = {
-                'worldbank.org': 'worldbank.org',
-                'wb': 'worldbank.org',
-                'imf.org': 'imf.org',
-                'un.org': 'un.org',
-                'unea': 'unea',
-                'uneca': 'uneca',
-                'afdb.org': 'afdb.org',
-                'africandevelopmentbank': 'afdb.org',
-                'wto.org': 'wto.org',
-                'oecd.org': 'oecd.org',
-                'nielsen.com': 'nielsen.com',
-                'mckinsey.com': 'mckinsey.com',
-                'bcg.com': 'bcg.com',
-                'bain.com': 'bain.com',
-                'centralbank.gov.cn': 'centralbank.gov.cn',
-                'pbc.gov.cn': 'centralbank.gov.cn',
-                'stats.gov.cn': 'stats.gov.cn',
-            }
-
             # 统计每个网站的文档数
-            website_counts = {w['key']: 0 for w in known_websites}
-
-            for doc in documents:
-                source_url = doc.get('source_url')
-                if source_url:
-                    try:
-                        url_obj = __import__('urllib.parse', fromlist=['urlparse']).urlparse(source_url)
-                        hostname = url_obj.netloc.lower().replace('www.', '')
-
-                        # 查找匹配
-                        for key, info_key in website_match_map.items():
-                            if key in hostname:
-                                website_counts[info_key] = website_counts.get(info_key, 0) + 1
-                                break
-                    except:
-                        pass
-
-            # 构建网站列表（包含0个文档的）
-            website_list = []
-            for w in known_websites:
-                website_list.append({
-                    "id": w['key'],
-                    "name": w['name'],
-                    "count": website_counts.get(w['key'], 0)
-                })
-
-            # 按数量排序
-            website_list.sort(key=lambda x: x['count'], reverse=True)
+            if LIBRARY_STATS_CACHE_ENABLED:
+                website_counts = library_stats.website_counts(user_id)
+            else:
+                website_counts = store.site_counts(user_id)
 
             return jsonify({
                 "success": True,
-                "websites": website_list
+                "websites": website_list(website_counts)
             }), 200
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
+
+
+    @app.route('/api/stats/cache', methods=['GET'])
+    def get_library_stats_cache():
+        """文档库统计缓存的命中情况"""
+        return jsonify({
+            "success": True,
+            "cache": library_stats.metrics()
+        }), 200
+
+
+    @app.route('/api/documents/cache/stats', methods=['GET'])
+    def get_document_cache_stats():
+        """单个文档元数据缓存、文档下载缓存的命中情况"""
+        return jsonify({
+            "success": True,
+            "cache": document_cache.metrics(),
+            "download_cache": download_cache.stats()
+        }), 200
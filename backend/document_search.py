@@ -0,0 +1,309 @@
+"""
+文档库全文检索
+替代原来在 Python 中对标题、文件名、笔记做子串扫描的搜索，结果按相关度排序并带高亮片段
+
+两种实现使用同一套分词规则：英文、数字按词切分并支持前缀匹配；
+中文没有空格分词，按相邻两字（bigram）建立索引，每段中文的最后一个字单独再建一个词，
+搜索「货币」「国际货」或单个字「币」都能命中
+- postgres：documents.search_vector 生成列 + GIN 索引，通过 PostgREST 的 search_documents RPC 查询
+  （表结构见 documents_search.sql）
+- sqlite：本地 SQLite FTS5 镜像，文档增删改时同步更新，未同步过的用户首次搜索时从 Supabase 全量导入
+
+用法（在 backend 目录下重建本地镜像）：
+    python document_search.py --rebuild
+"""
+import os
+import re
+import html
+import json
+import sqlite3
+import threading
+
+# ============= 配置区域 =============
+# postgres / sqlite / off（off 时退回到 ilike 子串匹配）；使用 SQLite 文档库存储时默认 sqlite
+DOCUMENT_SEARCH_BACKEND = os.getenv(
+    "DOCUMENT_SEARCH_BACKEND",
+    "sqlite" if os.getenv("DOCUMENT_STORE", "").lower() == "sqlite" else "postgres"
+).lower()
+DOCUMENT_SEARCH_INDEX_FILE = os.getenv(
+    "DOCUMENT_SEARCH_INDEX_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "document_search.db")
+)
+SNIPPET_RADIUS = 40
+# 字段权重：标题 > 文件名 > 笔记
+FIELD_WEIGHTS = (10.0, 5.0, 1.0)
+SEARCH_FIELDS = ('title', 'filename', 'notes')
+
+_CJK_CHARS = "\u3400-\u9fff\uf900-\ufaff"
+_CJK_RUN = re.compile(f"[{_CJK_CHARS}]+")
+# 一段中文，或一段不含中文的字母数字
+_WORD = re.compile(f"[{_CJK_CHARS}]+|[^\\W_{_CJK_CHARS}]+")
+
+
+# ============= 分词 =============
+
+def _cjk_tokens(run):
+    """一段连续中文的索引词：相邻两字 + 最后一个字"""
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def segment(text):
+    """索引用的文本：中文替换为空格分隔的 bigram，其余保持不变（与 SQL 中的 cjk_segment 一致）"""
+    if not text:
+        return ''
+    return _CJK_RUN.sub(lambda m: ' ' + ' '.join(_cjk_tokens(m.group(0))) + ' ', text)
+
+
+def query_terms(query):
+    """
+    搜索词拆分为 [(词, 是否前缀匹配)]
+
+    英文、数字按前缀匹配；两字以上的中文拆成 bigram 精确匹配，单个汉字按前缀匹配
+    """
+    terms = []
+    for word in _WORD.findall(query or ''):
+        if _CJK_RUN.fullmatch(word):
+            if len(word) == 1:
+                terms.append((word, True))
+            else:
+                terms.extend((word[i:i + 2], False) for i in range(len(word) - 1))
+        else:
+            terms.append((word.lower(), True))
+    seen = set()
+    return [t for t in terms if not (t in seen or seen.add(t))]
+
+
+def to_tsquery(terms):
+    """PostgreSQL to_tsquery('simple', ...) 的查询串，各词之间为 AND"""
+    parts = []
+    for term, prefix in terms:
+        quoted = "'" + term.replace("\\", "\\\\").replace("'", "\\'") + "'"
+        parts.append(quoted + (":*" if prefix else ""))
+    return " & ".join(parts)
+
+
+def to_fts5_query(terms):
+    """SQLite FTS5 MATCH 的查询串"""
+    return " AND ".join('"' + term.replace('"', '""') + '"' + ("*" if prefix else "") for term, prefix in terms)
+
+
+# ============= 高亮片段 =============
+
+def highlight(text, terms, radius=SNIPPET_RADIUS):
+    """截取第一个命中位置附近的片段，命中部分用 <mark> 标出（已做 HTML 转义），没有命中时返回 None"""
+    if not text or not terms:
+        return None
+    words = sorted({term for term, _ in terms}, key=len, reverse=True)
+    pattern = re.compile("|".join(re.escape(w) for w in words), re.IGNORECASE)
+    first = pattern.search(text)
+    if not first:
+        return None
+
+    start = max(0, first.start() - radius)
+    end = min(len(text), first.end() + radius)
+    snippet = text[start:end]
+    pieces, pos = [], 0
+    for match in pattern.finditer(snippet):
+        pieces.append(html.escape(snippet[pos:match.start()]))
+        pieces.append(f"<mark>{html.escape(match.group(0))}</mark>")
+        pos = match.end()
+    pieces.append(html.escape(snippet[pos:]))
+    return ("…" if start > 0 else "") + "".join(pieces) + ("…" if end < len(text) else "")
+
+
+def highlights_for(doc, terms):
+    """各字段的高亮片段"""
+    result = {}
+    for field in SEARCH_FIELDS:
+        snippet = highlight(doc.get(field), terms)
+        if snippet:
+            result[field] = snippet
+    return result
+
+
+# ============= 本地 SQLite FTS5 镜像 =============
+
+class LocalSearchIndex:
+    """文档索引的 SQLite FTS5 镜像（只用于搜索，数据以 Supabase 为准）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.create_function("has_tag", 2, self._has_tag, deterministic=True)
+        self._conn.create_function("regexp", 2, self._regexp, deterministic=True)
+        with self._conn:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5("
+                "title, filename, notes, "
+                "doc_id UNINDEXED, user_id UNINDEXED, folder UNINDEXED, tags UNINDEXED, "
+                "source_url UNINDEXED, created_at UNINDEXED, doc UNINDEXED, "
+                "tokenize = 'unicode61')"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS synced_users (user_id TEXT PRIMARY KEY)")
+
+    @staticmethod
+    def _has_tag(tags_json, tag):
+        try:
+            return 1 if tag in json.loads(tags_json or '[]') else 0
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def _regexp(pattern, value):
+        return 1 if value and re.search(pattern, value, re.IGNORECASE) else 0
+
+    def _insert_locked(self, doc):
+        self._conn.execute("DELETE FROM documents_fts WHERE doc_id = ?", (doc['id'],))
+        self._conn.execute(
+            "INSERT INTO documents_fts (title, filename, notes, doc_id, user_id, folder, tags, source_url, created_at, doc) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (segment(doc.get('title')), segment(doc.get('filename')), segment(doc.get('notes')),
+             doc['id'], doc.get('user_id', 'default'), doc.get('folder'),
+             json.dumps(doc.get('tags') or [], ensure_ascii=False), doc.get('source_url'),
+             doc.get('created_at'), json.dumps(doc, ensure_ascii=False))
+        )
+
+    def upsert(self, doc):
+        with self._lock, self._conn:
+            self._insert_locked(doc)
+
+    def delete(self, doc_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents_fts WHERE doc_id = ?", (doc_id,))
+
+    def is_synced(self, user_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM synced_users WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def replace_user(self, user_id, documents):
+        """用全量数据替换某个用户的镜像"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents_fts WHERE user_id = ?", (user_id,))
+            for doc in documents:
+                self._insert_locked(doc)
+            self._conn.execute("INSERT OR IGNORE INTO synced_users (user_id) VALUES (?)", (user_id,))
+
+    def search(self, user_id, terms, folder=None, tag=None, source_pattern=None, limit=50, offset=0):
+        """按相关度返回 [(文档, 分数)]，分数越大越相关"""
+        sql = (f"SELECT doc, -bm25(documents_fts, {', '.join(map(str, FIELD_WEIGHTS))}) AS score "
+               "FROM documents_fts WHERE documents_fts MATCH ? AND user_id = ?")
+        args = [to_fts5_query(terms), user_id]
+        if folder:
+            sql += " AND folder = ?"
+            args.append(folder)
+        if tag:
+            sql += " AND has_tag(tags, ?)"
+            args.append(tag)
+        if source_pattern:
+            sql += " AND source_url REGEXP ?"
+            args.append(source_pattern)
+        sql += " ORDER BY score DESC, created_at DESC LIMIT ? OFFSET ?"
+        args += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [(json.loads(doc), score) for doc, score in rows]
+
+
+_local_index = None
+_local_index_lock = threading.Lock()
+
+
+def get_local_index():
+    global _local_index
+    with _local_index_lock:
+        if _local_index is None:
+            _local_index = LocalSearchIndex(DOCUMENT_SEARCH_INDEX_FILE)
+        return _local_index
+
+
+def mirror_upsert(doc):
+    """文档新建、修改后同步到本地镜像（失败不影响主流程）"""
+    if DOCUMENT_SEARCH_BACKEND != 'sqlite' or not doc or not doc.get('id'):
+        return
+    try:
+        get_local_index().upsert(doc)
+    except Exception as e:
+        print(f"[Search] 本地索引更新失败: {e}")
+
+
+def mirror_delete(doc_id):
+    if DOCUMENT_SEARCH_BACKEND != 'sqlite':
+        return
+    try:
+        get_local_index().delete(doc_id)
+    except Exception as e:
+        print(f"[Search] 本地索引删除失败: {e}")
+
+
+# ============= 查询入口 =============
+
+def search_documents(query, user_id, fetch_user_documents, call_rpc, folder=None, tag=None,
+                     source_pattern=None, limit=50, offset=0):
+    """
+    全文检索，返回按相关度排序的文档列表（带 score、highlights）；未启用或检索不可用时返回 None
+
+    fetch_user_documents(user_id)：读取某个用户的全部文档，用于首次同步本地镜像
+    call_rpc(name, payload)：调用 PostgREST RPC，返回 JSON
+    """
+    terms = query_terms(query)
+    if not terms or DOCUMENT_SEARCH_BACKEND not in ('postgres', 'sqlite'):
+        return None
+
+    if DOCUMENT_SEARCH_BACKEND == 'sqlite':
+        index = get_local_index()
+        if not index.is_synced(user_id):
+            index.replace_user(user_id, fetch_user_documents(user_id))
+        rows = index.search(user_id, terms, folder=folder, tag=tag, source_pattern=source_pattern,
+                            limit=limit, offset=offset)
+    else:
+        try:
+            result = call_rpc("search_documents", {
+                "p_user_id": user_id,
+                "p_query": to_tsquery(terms),
+                "p_folder": folder,
+                "p_tag": tag,
+                "p_source_pattern": source_pattern,
+                "p_limit": limit,
+                "p_offset": offset
+            })
+        except Exception as e:
+            # 数据库尚未执行 documents_search.sql
+            print(f"[Search] search_documents RPC 不可用，退回子串匹配: {e}")
+            return None
+        rows = [(r['doc'], r['rank']) for r in result]
+
+    documents = []
+    for doc, score in rows:
+        doc['score'] = round(float(score), 6)
+        doc['highlights'] = highlights_for(doc, terms)
+        documents.append(doc)
+    return documents
+
+
+def _rebuild_all():
+    """从文档库存储读取全部文档，重建本地镜像"""
+    from document_store import get_document_store
+
+    documents = list(get_document_store().all_documents())
+
+    by_user = {}
+    for doc in documents:
+        by_user.setdefault(doc.get('user_id', 'default'), []).append(doc)
+    index = get_local_index()
+    for user_id, docs in by_user.items():
+        index.replace_user(user_id, docs)
+    print(f"本地检索镜像已重建: {len(documents)} 篇文档, {len(by_user)} 个用户 -> {DOCUMENT_SEARCH_INDEX_FILE}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="文档库全文检索")
+    parser.add_argument("--rebuild", action="store_true", help="从文档库存储重建本地 SQLite 镜像")
+    args = parser.parse_args()
+    if args.rebuild:
+        _rebuild_all()
+    else:
+        parser.print_help()
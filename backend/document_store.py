@@ -0,0 +1,129 @@
+"""
+文档库存储接口
+文档管理路由（document_local_api.py）只通过 DocumentStore 读写文档索引和文件夹，具体实现由 DOCUMENT_STORE 选择：
+- postgrest：Supabase REST API（document_store_postgrest.py，默认）
+- sqlite：本地 SQLite 数据库（document_store_sqlite.py），表结构与 documents_local_schema.sql 一致，
+  用于本地开发、CI 和无法访问 Supabase 的离线部署
+
+两种实现的行为由 test_document_store.py 中的同一组契约测试约束
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+
+# ============= 配置区域 =============
+DOCUMENT_STORE = os.getenv("DOCUMENT_STORE", "postgrest").lower()
+DOCUMENT_STORE_SQLITE_FILE = os.getenv(
+    "DOCUMENT_STORE_SQLITE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "documents.db")
+)
+
+# 文档表中的列（fields= 可以选择的列）
+DOCUMENT_FIELDS = (
+    'id', 'user_id', 'title', 'filename', 'local_path', 'file_size', 'file_type',
+    'source_url', 'source_type', 'source_site', 'tags', 'notes', 'folder', 'conversion_history',
+    'created_at', 'updated_at'
+)
+FOLDER_FIELDS = ('id', 'user_id', 'name', 'parent_id', 'color', 'created_at')
+
+
+class UnsupportedOperation(Exception):
+    """当前存储不支持的操作（例如 SQLite 存储没有数据库 RPC）"""
+
+
+class DocumentStore(ABC):
+    """
+    文档库存储接口
+
+    文档以 dict 表示，列与 DOCUMENT_FIELDS 一致，tags 为字符串列表，时间为 ISO 8601 字符串。
+    列表按 (created_at, id) 降序排列
+    """
+
+    name = None
+
+    @abstractmethod
+    def insert_document(self, doc):
+        """写入一条文档索引（写入时分类 source_site），返回写入后的行；id 已存在时抛出异常"""
+
+    @abstractmethod
+    def get_document(self, doc_id):
+        """按 id 查询，不存在时返回 None"""
+
+    @abstractmethod
+    def update_document(self, doc_id, changes):
+        """修改部分列，返回修改后的行；文档不存在时返回 None"""
+
+    @abstractmethod
+    def delete_document(self, doc_id):
+        """删除文档，返回被删除的行（列表，不存在时为空）"""
+
+    @abstractmethod
+    def list_documents(self, user_id, folder=None, tag=None, website=None, search=None,
+                       fields=None, limit=50, offset=0, after=None):
+        """
+        按条件列出用户的文档
+
+        tag：包含该标签；website：source_url 主机名包含该关键字；
+        search：标题、文件名、笔记任一包含该子串（不区分大小写）；
+        fields：只返回这些列；after：游标 {"c": created_at, "i": id}，只返回排在它之后的行（此时忽略 offset）
+        """
+
+    @abstractmethod
+    def user_documents(self, user_id, columns=None):
+        """用户的全部文档（columns 指定只读取部分列）"""
+
+    @abstractmethod
+    def all_documents(self):
+        """逐条返回所有用户的文档（重建搜索镜像用）"""
+
+    @abstractmethod
+    def folder_counts(self, user_id):
+        """{文件夹: 文档数}，没有文件夹的文档计入「其他」"""
+
+    @abstractmethod
+    def document_stats(self, user_id, recent_days=7):
+        """{"total", "by_source", "by_type", "recent_count"}，与 /api/stats 的 stats 字段一致"""
+
+    @abstractmethod
+    def site_counts(self, user_id):
+        """{来源网站 key: 文档数}，不属于已知网站的文档不计入"""
+
+    @abstractmethod
+    def create_folder(self, folder):
+        """创建文件夹，返回写入后的行"""
+
+    @abstractmethod
+    def delete_folder(self, folder_id):
+        """删除文件夹，返回被删除的行（列表，不存在时为空）；文件夹中的文档不受影响"""
+
+    def call_rpc(self, name, payload):
+        """调用数据库函数（全文检索 search_documents 等），不支持时抛出 UnsupportedOperation"""
+        raise UnsupportedOperation(f"{self.name} 存储不支持 RPC: {name}")
+
+    def close(self):
+        pass
+
+
+def create_document_store(kind=DOCUMENT_STORE, **options):
+    """按类型创建存储实例（依赖按需导入）"""
+    if kind == 'sqlite':
+        from document_store_sqlite import SqliteDocumentStore
+        return SqliteDocumentStore(options.get('path', DOCUMENT_STORE_SQLITE_FILE))
+    if kind == 'postgrest':
+        from document_store_postgrest import PostgrestDocumentStore
+        return PostgrestDocumentStore(options.get('client'))
+    raise ValueError(f"Unknown DOCUMENT_STORE: {kind}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_document_store():
+    """进程内共享的存储实例"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = create_document_store()
+            print(f"[DocumentStore] 使用 {_store.name} 存储")
+        return _store
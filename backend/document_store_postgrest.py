@@ -0,0 +1,246 @@
+"""
+文档库存储：Supabase REST API（PostgREST）实现
+筛选、分页、分组计数都在数据库中完成：
+- 统计使用 documents_stats.sql、documents_source_site.sql 中的 RPC，未执行时退回到只读取相关列在后端统计
+- 全文检索使用 documents_search.sql 中的 search_documents（通过 call_rpc）
+"""
+import time
+
+from postgrest_client import postgrest, PostgrestError
+from document_store import DocumentStore
+from library_stats import parse_timestamp
+from website_sources import classify_website, website_domains, website_host_pattern
+
+PAGE_SIZE = 1000
+
+# 列不存在时 PostgREST 的错误码（写入时为 PGRST204，查询时为 PostgreSQL 的 42703）
+MISSING_COLUMN_CODES = ('PGRST204', '42703')
+
+
+def postgrest_quote(value):
+    """PostgREST 过滤值加双引号（值中可能有逗号、括号、点号等保留字符）"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def like_pattern(text):
+    """ilike 子串匹配的模式：转义 LIKE 通配符，两侧加 *（PostgREST 会转换为 %）"""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"*{escaped}*"
+
+
+def missing_column(error, column):
+    """PostgREST 错误是否为指定的列不存在"""
+    return error.code in MISSING_COLUMN_CODES and column in (error.detail or '')
+
+
+def keyset_filter(position):
+    """(created_at, id) 降序排列时，位于游标之后的行"""
+    created_at, doc_id = postgrest_quote(position['c']), postgrest_quote(position['i'])
+    return f"or(created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{doc_id}))"
+
+
+def website_filter(website, source_site_column=True):
+    """
+    来源网站筛选条件（放在 and=(...) 中）
+
+    已知网站按 source_site 列筛选（idx_documents_user_site），与 /api/websites 的计数一致；
+    source_site 为空（尚未回填）的行按同样的域名后缀规则匹配 source_url。
+    没有 source_site 列或不是已知网站时只匹配 source_url
+    """
+    pattern = postgrest_quote(website_host_pattern(website))
+    if not source_site_column or not website_domains(website):
+        return f"source_url.imatch.{pattern}"
+    return f"or(source_site.eq.{postgrest_quote(website)},and(source_site.is.null,source_url.imatch.{pattern}))"
+
+
+def apply_document_filters(params, tag=None, website=None, search=None, after=None, source_site_column=True):
+    """
+    把标签、来源网站、搜索词、游标转换为 PostgREST 查询参数，由数据库完成筛选
+
+    - 标签：tags=cs.{"标签"}，使用 tags 上的 GIN 索引
+    - 来源网站：见 website_filter
+    - 搜索：标题、文件名、笔记任一包含搜索词（ilike）
+    - 游标：见 keyset_filter
+    """
+    conditions = []
+    if tag:
+        params["tags"] = "cs.{" + postgrest_quote(tag) + "}"
+    if website:
+        conditions.append(website_filter(website, source_site_column))
+    if after:
+        conditions.append(keyset_filter(after))
+    if conditions:
+        params["and"] = f"({','.join(conditions)})"
+    if search:
+        pattern = postgrest_quote(like_pattern(search))
+        params["or"] = f"(title.ilike.{pattern},filename.ilike.{pattern},notes.ilike.{pattern})"
+    return params
+
+
+class PostgrestDocumentStore(DocumentStore):
+    """通过 PostgREST 访问 Supabase 中的 documents、folders 表"""
+
+    name = 'postgrest'
+
+    def __init__(self, client=None):
+        self.client = client or postgrest
+        # 数据库是否有 source_site 列（未执行 documents_source_site.sql 时为 False）
+        self._source_site_column = True
+
+    def _get(self, table, params):
+        return self.client.request("GET", table, params=params).json()
+
+    def _paged(self, params):
+        """按 id 顺序分页读取全部匹配的文档"""
+        offset = 0
+        while True:
+            batch = self._get("documents", dict(params, order="id", limit=PAGE_SIZE, offset=offset))
+            for doc in batch:
+                yield doc
+            if len(batch) < PAGE_SIZE:
+                return
+            offset += PAGE_SIZE
+
+    # ---------- 文档 ----------
+
+    def insert_document(self, doc):
+        """
+        写入时按域名后缀分类来源网站（source_site）
+
+        数据库还没有 source_site 列时去掉该列重新写入，之后不再写入该列；
+        其他错误（标题过长、缺少必填列、超时等）直接抛出，不影响之后的写入
+        """
+        if self._source_site_column:
+            data = dict(doc, source_site=classify_website(doc.get('source_url')))
+            try:
+                rows = self.client.request("POST", "documents", data).json()
+                return rows[0] if rows else data
+            except PostgrestError as e:
+                if not missing_column(e, 'source_site'):
+                    raise
+            self._source_site_column = False
+            print("[Documents] 数据库没有 source_site 列，请执行 documents_source_site.sql")
+        rows = self.client.request("POST", "documents", doc).json()
+        return rows[0] if rows else dict(doc)
+
+    def get_document(self, doc_id):
+        documents = self._get("documents", {"id": f"eq.{doc_id}", "limit": 1})
+        return documents[0] if documents else None
+
+    def update_document(self, doc_id, changes):
+        rows = self.client.request("PATCH", "documents", changes, {"id": f"eq.{doc_id}"}).json()
+        return rows[0] if rows else None
+
+    def delete_document(self, doc_id):
+        # 返回被删除的行（Prefer: return=representation）
+        response = self.client.request("DELETE", "documents", params={"id": f"eq.{doc_id}"})
+        return response.json() if response.content else []
+
+    def list_documents(self, user_id, folder=None, tag=None, website=None, search=None,
+                       fields=None, limit=50, offset=0, after=None):
+        params = {
+            "user_id": f"eq.{user_id}",
+            "order": "created_at.desc,id.desc",
+            "limit": limit
+        }
+        if fields:
+            params["select"] = ",".join(fields)
+        if offset and not after:
+            params["offset"] = offset
+        if folder:
+            params["folder"] = f"eq.{folder}"
+        if not website or not self._source_site_column:
+            apply_document_filters(params, tag=tag, website=website, search=search, after=after,
+                                   source_site_column=self._source_site_column)
+            return self._get("documents", params)
+
+        try:
+            return self._get("documents", apply_document_filters(dict(params), tag=tag, website=website,
+                                                                 search=search, after=after))
+        except PostgrestError as e:
+            if not missing_column(e, 'source_site'):
+                raise
+        self._source_site_column = False
+        print("[Documents] 数据库没有 source_site 列，请执行 documents_source_site.sql")
+        apply_document_filters(params, tag=tag, website=website, search=search, after=after,
+                               source_site_column=False)
+        return self._get("documents", params)
+
+    def user_documents(self, user_id, columns=None):
+        params = {"user_id": f"eq.{user_id}"}
+        if columns:
+            params["select"] = ",".join(columns)
+        return list(self._paged(params))
+
+    def all_documents(self):
+        return self._paged({})
+
+    # ---------- 统计 ----------
+
+    def folder_counts(self, user_id):
+        """由数据库分组计数（document_folder_counts）；函数不存在时退回到只读取 folder 列统计"""
+        try:
+            rows = self.call_rpc("document_folder_counts", {"p_user_id": user_id})
+            return {row['folder']: row['count'] for row in rows}
+        except Exception as e:
+            print(f"[Stats] document_folder_counts RPC 不可用，退回后端统计: {e}")
+
+        folder_counts = {}
+        for doc in self._get("documents", {"user_id": f"eq.{user_id}", "select": "folder"}):
+            folder = doc.get('folder') or '其他'
+            folder_counts[folder] = folder_counts.get(folder, 0) + 1
+        return folder_counts
+
+    def document_stats(self, user_id, recent_days=7):
+        """由数据库计算（document_stats）；函数不存在时退回到只读取统计需要的列"""
+        try:
+            return self.call_rpc("document_stats", {"p_user_id": user_id, "p_recent_days": recent_days})
+        except Exception as e:
+            print(f"[Stats] document_stats RPC 不可用，退回后端统计: {e}")
+
+        params = {"user_id": f"eq.{user_id}", "select": "source_type,file_type,created_at"}
+        documents = self._get("documents", params)
+        since = time.time() - recent_days * 24 * 3600
+        stats = {
+            "total": len(documents),
+            "by_source": {
+                "plugin": len([d for d in documents if d.get('source_type') == 'plugin']),
+                "manual": len([d for d in documents if d.get('source_type') == 'manual']),
+                "upload": len([d for d in documents if d.get('source_type') == 'upload'])
+            },
+            "by_type": {},
+            "recent_count": len([d for d in documents if (parse_timestamp(d.get('created_at')) or 0) > since])
+        }
+        for doc in documents:
+            file_type = doc.get('file_type') or 'unknown'
+            stats['by_type'][file_type] = stats['by_type'].get(file_type, 0) + 1
+        return stats
+
+    def site_counts(self, user_id):
+        """由数据库按 source_site 分组计数（document_site_counts）；函数不存在时退回到读取 source_url 列在后端分类"""
+        try:
+            rows = self.call_rpc("document_site_counts", {"p_user_id": user_id})
+            return {row['source_site']: row['count'] for row in rows}
+        except Exception as e:
+            print(f"[Stats] document_site_counts RPC 不可用，退回后端统计: {e}")
+
+        website_counts = {}
+        for doc in self._get("documents", {"user_id": f"eq.{user_id}", "select": "source_url"}):
+            website = classify_website(doc.get('source_url'))
+            if website:
+                website_counts[website] = website_counts.get(website, 0) + 1
+        return website_counts
+
+    # ---------- 其他 ----------
+
+    def create_folder(self, folder):
+        rows = self.client.request("POST", "folders", folder).json()
+        return rows[0] if rows else dict(folder)
+
+    def delete_folder(self, folder_id):
+        response = self.client.request("DELETE", "folders", params={"id": f"eq.{folder_id}"})
+        return response.json() if response.content else []
+
+    def call_rpc(self, name, payload):
+        """调用 PostgREST RPC（这里用到的都是只读函数，失败时可以重试）"""
+        return self.client.rpc(name, payload)
@@ -0,0 +1,274 @@
+"""
+文档库存储：本地 SQLite 实现（DOCUMENT_STORE=sqlite）
+表和索引与 documents_local_schema.sql 一致，用于本地开发、CI 和离线部署；不需要 Supabase。
+
+与 PostgreSQL 的差异：
+- tags 以 JSON 数组保存，标签筛选用 json_each
+- 时间统一保存为 UTC 的 ISO 8601 字符串（固定 6 位小数），按字符串比较即按时间先后；
+  不带时区的输入按 UTC 处理（与 Supabase 的默认时区一致）
+- 没有数据库 RPC，全文检索请使用 DOCUMENT_SEARCH_BACKEND=sqlite（本地 FTS5 镜像）
+"""
+import os
+import re
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from document_store import DocumentStore, DOCUMENT_FIELDS, FOLDER_FIELDS
+from website_sources import classify_website, website_domains, website_host_pattern
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'default',
+    title TEXT NOT NULL,
+    filename TEXT,
+    local_path TEXT,
+    file_size INTEGER,
+    file_type TEXT,
+    source_url TEXT,
+    source_type TEXT,
+    source_site TEXT,
+    tags TEXT,                        -- JSON 数组
+    notes TEXT,
+    folder TEXT DEFAULT '未分类',
+    conversion_history TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_documents_user_id ON documents(user_id);
+CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_documents_folder ON documents(folder);
+CREATE INDEX IF NOT EXISTS idx_documents_user_created_id ON documents(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_documents_user_site ON documents(user_id, source_site);
+CREATE INDEX IF NOT EXISTS idx_documents_user_folder ON documents(user_id, folder);
+
+CREATE TABLE IF NOT EXISTS folders (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'default',
+    name TEXT NOT NULL,
+    parent_id TEXT,
+    color TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_folders_user_id ON folders(user_id);
+"""
+
+_FRACTION_RE = re.compile(r"\.(\d+)")
+_TIMESTAMP_COLUMNS = ('created_at', 'updated_at')
+
+
+def normalize_timestamp(value):
+    """ISO 时间字符串转为 UTC、6 位小数的固定格式；格式错误时抛出 ValueError"""
+    text = _FRACTION_RE.sub(lambda m: '.' + m.group(1)[:6].ljust(6, '0'), value.replace('Z', '+00:00'), count=1)
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def utc_now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def like_escape(text):
+    """LIKE 子串匹配的模式（转义通配符，配合 ESCAPE '\\'）"""
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+@lru_cache(maxsize=256)
+def _compile(pattern):
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _regexp(pattern, value):
+    return 1 if value and _compile(pattern).search(value) else 0
+
+
+def _encode_value(column, value):
+    if column == 'tags':
+        return None if value is None else json.dumps(list(value), ensure_ascii=False)
+    if column in _TIMESTAMP_COLUMNS and value is not None:
+        return normalize_timestamp(value)
+    return value
+
+
+def _row_to_doc(row):
+    doc = dict(row)
+    if 'tags' in doc:
+        doc['tags'] = json.loads(doc['tags']) if doc['tags'] else doc['tags']
+    return doc
+
+
+class SqliteDocumentStore(DocumentStore):
+    """单个 SQLite 文件中的 documents、folders 表（一个连接，串行访问）"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.create_function("regexp", 2, _regexp, deterministic=True)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def _select_locked(self, doc_id):
+        row = self._conn.execute("SELECT * FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return _row_to_doc(row) if row else None
+
+    # ---------- 文档 ----------
+
+    def insert_document(self, doc):
+        now = utc_now()
+        data = {k: v for k, v in doc.items() if k in DOCUMENT_FIELDS}
+        data['source_site'] = classify_website(doc.get('source_url'))
+        data.setdefault('created_at', now)
+        data.setdefault('updated_at', now)
+        columns = list(data)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO documents ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [_encode_value(c, data[c]) for c in columns]
+            )
+            return self._select_locked(data.get('id'))
+
+    def get_document(self, doc_id):
+        with self._lock:
+            return self._select_locked(doc_id)
+
+    def update_document(self, doc_id, changes):
+        columns = [c for c in changes if c in DOCUMENT_FIELDS and c != 'id']
+        with self._lock, self._conn:
+            if columns:
+                self._conn.execute(
+                    f"UPDATE documents SET {', '.join(f'{c} = ?' for c in columns)} WHERE id = ?",
+                    [_encode_value(c, changes[c]) for c in columns] + [doc_id]
+                )
+            return self._select_locked(doc_id)
+
+    def delete_document(self, doc_id):
+        with self._lock, self._conn:
+            doc = self._select_locked(doc_id)
+            if doc is None:
+                return []
+            self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+            return [doc]
+
+    def list_documents(self, user_id, folder=None, tag=None, website=None, search=None,
+                       fields=None, limit=50, offset=0, after=None):
+        where, args = ["user_id = ?"], [user_id]
+        if folder:
+            where.append("folder = ?")
+            args.append(folder)
+        if tag:
+            where.append("EXISTS (SELECT 1 FROM json_each(documents.tags) WHERE json_each.value = ?)")
+            args.append(tag)
+        if website and website_domains(website):
+            # 与 site_counts 一致按 source_site 筛选，未分类的行按域名后缀规则匹配
+            where.append("(source_site = ? OR (source_site IS NULL AND source_url REGEXP ?))")
+            args += [website, website_host_pattern(website)]
+        elif website:
+            where.append("source_url REGEXP ?")
+            args.append(website_host_pattern(website))
+        if search:
+            pattern = like_escape(search)
+            where.append("(title LIKE ? ESCAPE '\\' OR filename LIKE ? ESCAPE '\\' OR notes LIKE ? ESCAPE '\\')")
+            args += [pattern, pattern, pattern]
+        if after:
+            created_at = normalize_timestamp(after['c'])
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            args += [created_at, created_at, after['i']]
+
+        select = ", ".join(c for c in fields if c in DOCUMENT_FIELDS) if fields else "*"
+        sql = (f"SELECT {select} FROM documents WHERE {' AND '.join(where)} "
+               f"ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?")
+        args += [limit, 0 if after else offset]
+        return [_row_to_doc(row) for row in self._query(sql, args)]
+
+    def user_documents(self, user_id, columns=None):
+        select = ", ".join(c for c in columns if c in DOCUMENT_FIELDS) if columns else "*"
+        rows = self._query(f"SELECT {select} FROM documents WHERE user_id = ? ORDER BY id", (user_id,))
+        return [_row_to_doc(row) for row in rows]
+
+    def all_documents(self):
+        for row in self._query("SELECT * FROM documents ORDER BY id"):
+            yield _row_to_doc(row)
+
+    # ---------- 统计 ----------
+
+    def folder_counts(self, user_id):
+        rows = self._query(
+            "SELECT COALESCE(folder, '其他') AS folder, COUNT(*) AS count FROM documents "
+            "WHERE user_id = ? GROUP BY 1", (user_id,))
+        return {row['folder']: row['count'] for row in rows}
+
+    def document_stats(self, user_id, recent_days=7):
+        since = (datetime.now(timezone.utc) - timedelta(days=recent_days)).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+        with self._lock:
+            total, recent = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(created_at > ?), 0) FROM documents WHERE user_id = ?",
+                (since, user_id)).fetchone()
+            by_source = self._conn.execute(
+                "SELECT source_type, COUNT(*) FROM documents WHERE user_id = ? GROUP BY source_type",
+                (user_id,)).fetchall()
+            by_type = self._conn.execute(
+                "SELECT COALESCE(file_type, 'unknown'), COUNT(*) FROM documents WHERE user_id = ? GROUP BY 1",
+                (user_id,)).fetchall()
+        sources = {row[0]: row[1] for row in by_source}
+        return {
+            "total": total,
+            "by_source": {
+                "plugin": sources.get('plugin', 0),
+                "manual": sources.get('manual', 0),
+                "upload": sources.get('upload', 0)
+            },
+            "by_type": {row[0]: row[1] for row in by_type},
+            "recent_count": recent
+        }
+
+    def site_counts(self, user_id):
+        rows = self._query(
+            "SELECT source_site, COUNT(*) AS count FROM documents "
+            "WHERE user_id = ? AND source_site IS NOT NULL GROUP BY source_site", (user_id,))
+        return {row['source_site']: row['count'] for row in rows}
+
+    # ---------- 其他 ----------
+
+    def create_folder(self, folder):
+        data = {k: v for k, v in folder.items() if k in FOLDER_FIELDS}
+        data['created_at'] = normalize_timestamp(data['created_at']) if data.get('created_at') else utc_now()
+        columns = list(data)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO folders ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [data[c] for c in columns]
+            )
+            row = self._conn.execute("SELECT * FROM folders WHERE id = ?", (data.get('id'),)).fetchone()
+        return dict(row)
+
+    def delete_folder(self, folder_id):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT * FROM folders WHERE id = ?", (folder_id,)).fetchone()
+            if row is None:
+                return []
+            self._conn.execute("DELETE FROM folders WHERE id = ?", (folder_id,))
+            return [dict(row)]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
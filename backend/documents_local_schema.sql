@@ -18,6 +18,7 @@ CREATE TABLE IF NOT EXISTS documents (
     -- 来源信息
     source_url TEXT,                  -- 来自哪个网页
     source_type VARCHAR(50),          -- plugin/manual/upload
+    source_site VARCHAR(100),         -- 来源网站（website_sources.py 写入时分类）
 
     -- 用户数据
     tags TEXT[],                      -- 标签数组
@@ -37,6 +38,9 @@ CREATE INDEX IF NOT EXISTS idx_documents_user_id ON documents(user_id);
 CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_documents_folder ON documents(folder);
 CREATE INDEX IF NOT EXISTS idx_documents_tags ON documents USING GIN(tags);
+-- /api/documents 的游标分页：按 (created_at, id) 降序
+CREATE INDEX IF NOT EXISTS idx_documents_user_created_id ON documents(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_documents_user_site ON documents(user_id, source_site);
 
 
 -- ============= 创建文件夹表 =============
@@ -0,0 +1,82 @@
+-- ============================================
+-- 文档库全文检索（在 Supabase SQL Editor 中执行，可重复执行）
+-- documents.search_vector 为生成列，标题、文件名、笔记修改后自动更新
+-- 中文按相邻两字（bigram）切分，规则与 document_search.py 中的 segment 一致
+-- ============================================
+
+-- ============= 中文 bigram 切分 =============
+-- 连续中文替换为「相邻两字 + 最后一个字」，标点替换为空格
+CREATE OR REPLACE FUNCTION cjk_segment(input TEXT)
+RETURNS TEXT
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    result TEXT := '';
+    ch TEXT;
+    prev TEXT := NULL;
+    i INT;
+BEGIN
+    IF input IS NULL THEN
+        RETURN '';
+    END IF;
+    FOR i IN 1..char_length(input) LOOP
+        ch := substr(input, i, 1);
+        IF ch ~ '[\u3400-\u9fff\uf900-\ufaff]' THEN
+            IF prev IS NOT NULL THEN
+                result := result || ' ' || prev || ch;
+            END IF;
+            prev := ch;
+        ELSE
+            IF prev IS NOT NULL THEN
+                result := result || ' ' || prev || ' ';
+                prev := NULL;
+            END IF;
+            result := result || CASE WHEN ch ~ '[[:punct:]]' THEN ' ' ELSE ch END;
+        END IF;
+    END LOOP;
+    IF prev IS NOT NULL THEN
+        result := result || ' ' || prev;
+    END IF;
+    RETURN result;
+END $$;
+
+
+-- ============= 检索列与索引 =============
+-- 权重：标题 A > 文件名 B > 笔记 C
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', cjk_segment(title)), 'A') ||
+        setweight(to_tsvector('simple', cjk_segment(filename)), 'B') ||
+        setweight(to_tsvector('simple', cjk_segment(notes)), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_documents_search_vector ON documents USING GIN(search_vector);
+
+
+-- ============= 检索 RPC =============
+-- p_query 为 to_tsquery('simple', ...) 语法，由后端拼接（见 document_search.to_tsquery）
+-- 返回 doc（不含 search_vector）和相关度 rank，按 rank 降序
+CREATE OR REPLACE FUNCTION search_documents(
+    p_user_id TEXT,
+    p_query TEXT,
+    p_folder TEXT DEFAULT NULL,
+    p_tag TEXT DEFAULT NULL,
+    p_source_pattern TEXT DEFAULT NULL,
+    p_limit INT DEFAULT 50,
+    p_offset INT DEFAULT 0
+)
+RETURNS TABLE (doc JSONB, rank REAL)
+LANGUAGE sql STABLE AS $$
+    SELECT to_jsonb(d) - 'search_vector' AS doc,
+           ts_rank_cd(d.search_vector, q) AS rank
+    FROM documents d, to_tsquery('simple', p_query) q
+    WHERE d.user_id = p_user_id
+      AND d.search_vector @@ q
+      AND (p_folder IS NULL OR d.folder = p_folder)
+      AND (p_tag IS NULL OR d.tags @> ARRAY[p_tag])
+      AND (p_source_pattern IS NULL OR d.source_url ~* p_source_pattern)
+    ORDER BY rank DESC, d.created_at DESC
+    LIMIT p_limit OFFSET p_offset
+$$;
+
+-- 也可以直接用 PostgREST 的 fts 过滤（不排序）：
+--   GET /rest/v1/documents?search_vector=fts(simple).'国际'%20%26%20'imf':*
@@ -0,0 +1,22 @@
+-- ============================================
+-- 文档来源网站列（在 Supabase SQL Editor 中执行，可重复执行）
+-- source_site 由后端在创建文档时按域名后缀分类写入（见 website_sources.py），
+-- 已有数据执行 python website_sources.py --backfill 回填
+-- ============================================
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS source_site VARCHAR(100);
+
+CREATE INDEX IF NOT EXISTS idx_documents_user_site ON documents(user_id, source_site);
+
+
+-- ============= 每个来源网站的文档数 =============
+-- 只返回有文档的网站，不属于已知网站的文档不计入
+CREATE OR REPLACE FUNCTION document_site_counts(p_user_id TEXT)
+RETURNS TABLE (source_site TEXT, count BIGINT)
+LANGUAGE sql STABLE AS $$
+    SELECT d.source_site::TEXT, COUNT(*) AS count
+    FROM documents d
+    WHERE d.user_id = p_user_id
+      AND d.source_site IS NOT NULL
+    GROUP BY d.source_site
+$$;
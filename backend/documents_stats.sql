@@ -0,0 +1,53 @@
+-- ============================================
+-- 文档库统计（在 Supabase SQL Editor 中执行，可重复执行）
+-- /api/folders、/api/stats 通过这里的 RPC 在数据库中分组计数，
+-- 不再把用户的全部文档下载到后端统计
+-- ============================================
+
+-- 分组计数使用 (user_id, folder) 索引
+CREATE INDEX IF NOT EXISTS idx_documents_user_folder ON documents(user_id, folder);
+
+
+-- ============= 每个文件夹的文档数 =============
+CREATE OR REPLACE FUNCTION document_folder_counts(p_user_id TEXT)
+RETURNS TABLE (folder TEXT, count BIGINT)
+LANGUAGE sql STABLE AS $$
+    SELECT COALESCE(d.folder, '其他')::TEXT AS folder, COUNT(*) AS count
+    FROM documents d
+    WHERE d.user_id = p_user_id
+    GROUP BY 1
+$$;
+
+
+-- ============= 文档库统计 =============
+-- 返回 {"total", "by_source", "by_type", "recent_count"}，与 /api/stats 的 stats 字段一致
+-- by_source 始终包含 plugin/manual/upload 三项；recent_count 为最近 p_recent_days 天内创建的文档数
+CREATE OR REPLACE FUNCTION document_stats(p_user_id TEXT, p_recent_days INT DEFAULT 7)
+RETURNS JSONB
+LANGUAGE sql STABLE AS $$
+    WITH mine AS (
+        SELECT source_type, file_type, created_at
+        FROM documents
+        WHERE user_id = p_user_id
+    )
+    SELECT jsonb_build_object(
+        'total', (SELECT COUNT(*) FROM mine),
+        'by_source', jsonb_build_object(
+            'plugin', (SELECT COUNT(*) FROM mine WHERE source_type = 'plugin'),
+            'manual', (SELECT COUNT(*) FROM mine WHERE source_type = 'manual'),
+            'upload', (SELECT COUNT(*) FROM mine WHERE source_type = 'upload')
+        ),
+        'by_type', (
+            SELECT COALESCE(jsonb_object_agg(file_type, n), '{}'::JSONB)
+            FROM (
+                SELECT COALESCE(file_type, 'unknown') AS file_type, COUNT(*) AS n
+                FROM mine
+                GROUP BY 1
+            ) t
+        ),
+        'recent_count', (
+            SELECT COUNT(*) FROM mine
+            WHERE created_at > NOW() - make_interval(days => p_recent_days)
+        )
+    )
+$$;
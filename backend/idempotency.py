@@ -0,0 +1,202 @@
+"""
+幂等键（Idempotency-Key）
+浏览器或代理在超时后重试 /api/dify/convert、/api/dify/country-report 时，
+会重新启动一个 30 分钟的工作流并写入重复的历史记录。
+
+客户端在请求头中带上 Idempotency-Key 后：
+- 同一个键的原请求仍在执行时，重试请求最多等待 IDEMPOTENCY_WAIT 秒（默认不等待），仍未完成时返回 409
+- 原请求已完成时，直接返回保存的结果（响应头 Idempotent-Replayed: true）
+- 同一个键配合不同的请求体时返回 422
+键按「路由 + 用户 + 键」区分，保存 IDEMPOTENCY_TTL 秒后过期；
+原请求被限流或排队拒绝（408、429）以及返回 5xx 时不保存结果，之后的重试会重新执行
+"""
+import os
+import time
+import hashlib
+import functools
+import threading
+
+from flask import request, jsonify, make_response, Response
+
+from admission import get_request_user
+
+# ============= 配置区域 =============
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+# 已完成结果的保存时间（秒）
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+# 重试请求等待原请求完成的最长时间（秒）；等待期间占用 worker 线程且不经过准入控制，
+# 所以最多等待 MAX_IDEMPOTENCY_WAIT 秒，默认直接返回 409 由客户端按 Retry-After 重试
+MAX_IDEMPOTENCY_WAIT = 60
+IDEMPOTENCY_WAIT = min(int(os.getenv("IDEMPOTENCY_WAIT", "0")), MAX_IDEMPOTENCY_WAIT)
+MAX_KEY_LENGTH = 255
+# 不保存的状态码（暂时性拒绝，重试时应当重新执行）；5xx 同样不保存
+TRANSIENT_STATUS_CODES = (408, 429)
+
+
+class IdempotencyEntry:
+    """一个幂等键对应的执行状态和结果"""
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.created_at = time.time()
+        self.finished_at = None
+        self.status_code = None
+        self.body = None
+        self.headers = {}
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def finish(self, status_code, body, headers):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers
+        self.finished_at = time.time()
+        self._done.set()
+
+    def wait(self, timeout):
+        """等待原请求完成，返回是否已完成"""
+        return self._done.wait(timeout)
+
+
+class IdempotencyStore:
+    """进程内的幂等键表"""
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.replayed = 0
+        self.attached = 0
+
+    def begin(self, scope_key, fingerprint):
+        """
+        登记一个幂等键，返回 (entry, 是否由当前请求执行)
+
+        键已存在时返回已有的 entry，由调用方等待或直接使用它的结果
+        """
+        with self._lock:
+            self._cleanup_locked()
+            entry = self._entries.get(scope_key)
+            if entry is not None:
+                return entry, False
+            entry = IdempotencyEntry(fingerprint)
+            self._entries[scope_key] = entry
+            return entry, True
+
+    def complete(self, scope_key, entry, status_code, body, headers):
+        """保存结果；暂时性拒绝和 5xx 结果只交给正在等待的重试请求，不保留"""
+        entry.finish(status_code, body, headers)
+        if status_code >= 500 or status_code in TRANSIENT_STATUS_CODES:
+            self.discard(scope_key, entry)
+
+    def discard(self, scope_key, entry):
+        with self._lock:
+            if self._entries.get(scope_key) is entry:
+                del self._entries[scope_key]
+
+    def stats(self):
+        with self._lock:
+            in_progress = len([e for e in self._entries.values() if not e.done])
+            return {
+                "keys": len(self._entries),
+                "in_progress": in_progress,
+                "replayed": self.replayed,
+                "attached": self.attached
+            }
+
+    def _cleanup_locked(self):
+        now = time.time()
+        expired = [key for key, entry in self._entries.items()
+                   if entry.finished_at is not None and now - entry.finished_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+
+idempotency_store = IdempotencyStore()
+
+
+def request_fingerprint(body):
+    """请求体的摘要，用于检测同一个键被用于不同的请求"""
+    return hashlib.sha256(body or b"").hexdigest()
+
+
+def scope_key_for(route, user, key):
+    return f"{route}:{user}:{key}"
+
+
+def _replay(entry, attached):
+    """用保存的结果构造响应"""
+    response = Response(entry.body, status=entry.status_code, headers=entry.headers)
+    response.headers[REPLAYED_HEADER] = "true"
+    if attached:
+        idempotency_store.attached += 1
+    else:
+        idempotency_store.replayed += 1
+    return response
+
+
+def idempotent(view):
+    """
+    路由装饰器：支持 Idempotency-Key 请求头
+
+    放在 admission_controlled、scheduled 之前，重试请求不占用准入名额，也不进入任务队列；
+    准入控制的 429 和任务队列已满的 503 不会保存，之后带同一个键的重试会重新执行
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"{IDEMPOTENCY_HEADER} too long"}), 400
+
+        scope_key = scope_key_for(request.path, get_request_user(), key)
+        fingerprint = request_fingerprint(request.get_data())
+        entry, is_owner = idempotency_store.begin(scope_key, fingerprint)
+
+        if not is_owner:
+            if entry.fingerprint != fingerprint:
+                return jsonify({"error": f"{IDEMPOTENCY_HEADER} was already used with a different request body"}), 422
+            attached = not entry.done
+            if attached and IDEMPOTENCY_WAIT:
+                print(f"[Idempotency] 原请求仍在执行，等待结果: {scope_key}")
+            if not entry.wait(IDEMPOTENCY_WAIT):
+                response = jsonify({"error": "Original request is still in progress"})
+                response.status_code = 409
+                response.headers['Retry-After'] = "30"
+                return response
+            return _replay(entry, attached)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency_store.discard(scope_key, entry)
+            entry.finish(500, b'{"error": "Internal server error"}', {"Content-Type": "application/json"})
+            raise
+
+        if response.is_streamed:
+            # 流式响应无法保存，不做去重
+            idempotency_store.discard(scope_key, entry)
+            entry.finish(409, b'{"error": "Original response was streamed"}', {"Content-Type": "application/json"})
+            return response
+
+        idempotency_store.complete(scope_key, entry, response.status_code, response.get_data(),
+                                   {"Content-Type": response.headers.get("Content-Type", "application/json")})
+        return response
+    return wrapper
+
+
+def register_idempotency_routes(app):
+    """注册幂等键监控路由"""
+
+    @app.route('/api/idempotency/stats', methods=['GET'])
+    def get_idempotency_stats():
+        """幂等键数量、去重次数"""
+        return jsonify({
+            "success": True,
+            "stats": idempotency_store.stats()
+        }), 200
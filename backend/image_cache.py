@@ -0,0 +1,283 @@
+"""
+图片翻译结果缓存
+IMF 图表、世界银行表格等报告插图经常被不同用户重复翻译，每次调用模型都要几十秒并产生费用。
+
+缓存键由两部分组成：
+- 精确 hash：预处理后 JPEG 的 SHA-256，同一张图片再次上传时直接命中（默认只用这一种）
+- 感知 hash（dHash，IMAGE_CACHE_PHASH_DISTANCE > 0 时启用）：同一张图重新截图、重新压缩后字节不同，
+  但 dHash 的汉明距离很小。64 位 dHash 分不清版式相同、数字不同的表格，所以距离不超过
+  IMAGE_CACHE_PHASH_DISTANCE 且宽高比一致的候选还要逐像素比较缩略图，几乎没有差异才视为命中
+翻译后的图片和原图缩略图保存在产物缓存中（本地磁盘，按 LRU 淘汰），索引保存在 JSON 文件中
+"""
+import os
+import io
+import json
+import time
+import base64
+import hashlib
+import tempfile
+import threading
+
+from flask import jsonify
+from PIL import Image, ImageChops
+
+from artifact_cache import artifact_cache, ARTIFACT_CACHE_DIR
+
+# ============= 配置区域 =============
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() != "false"
+# 感知 hash 允许的最大汉明距离（0 表示只用精确 hash）
+IMAGE_CACHE_PHASH_DISTANCE = int(os.getenv("IMAGE_CACHE_PHASH_DISTANCE", "0"))
+IMAGE_CACHE_INDEX_FILE = os.getenv(
+    "IMAGE_CACHE_INDEX_FILE",
+    os.path.join(ARTIFACT_CACHE_DIR, "image_translation_index.json")
+)
+# 宽高比相差超过该比例时不算感知命中
+ASPECT_TOLERANCE = 0.02
+
+PHASH_BITS = 64
+
+# 感知命中的像素校验：两张图缩成长边 VERIFY_SIZE 的灰度缩略图，
+# 灰度差超过 VERIFY_PIXEL_DELTA 的像素不超过 VERIFY_MAX_CHANGED_PIXELS 个才算同一张图。
+# 表格中改动一个数字在缩略图上只有几个像素不同，所以按像素个数而不是比例判断
+VERIFY_SIZE = 384
+VERIFY_PIXEL_DELTA = 32
+VERIFY_MAX_CHANGED_PIXELS = 2
+
+
+def dhash(image, hash_size=8):
+    """差值 hash：缩成 (hash_size+1) x hash_size 的灰度图，比较相邻像素"""
+    if image.format == 'JPEG':
+        image.draft('L', (hash_size * 8, hash_size * 8))
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def thumbnail(image):
+    """像素校验用的灰度缩略图"""
+    small = image.convert('L')
+    small.thumbnail((VERIFY_SIZE, VERIFY_SIZE), Image.BILINEAR)
+    return small
+
+
+def same_pixels(a, b):
+    """两张缩略图是否几乎没有差异（尺寸不同时按 a 的尺寸缩放 b）"""
+    if b.size != a.size:
+        b = b.resize(a.size, Image.BILINEAR)
+    histogram = ImageChops.difference(a, b).histogram()
+    return sum(histogram[VERIFY_PIXEL_DELTA + 1:]) <= VERIFY_MAX_CHANGED_PIXELS
+
+
+class ImageFingerprint:
+    """预处理后图片的精确 hash、感知 hash、尺寸和校验用缩略图"""
+
+    def __init__(self, exact, phash, size, thumb=None):
+        self.exact = exact
+        self.phash = phash
+        self.size = size
+        self.thumb = thumb
+
+
+def fingerprint_image(image_b64, with_thumbnail=None):
+    """根据 load_and_preprocess_image 的输出计算指纹（启用感知命中时附带缩略图）"""
+    if with_thumbnail is None:
+        with_thumbnail = IMAGE_CACHE_PHASH_DISTANCE > 0
+    exact = hashlib.sha256(image_b64.encode('ascii')).hexdigest()
+    with Image.open(io.BytesIO(base64.b64decode(image_b64))) as im:
+        size = im.size
+        thumb = thumbnail(im) if with_thumbnail else None
+        phash = dhash(im)
+    return ImageFingerprint(exact, phash, size, thumb)
+
+
+def band_layout(max_distance):
+    """
+    把 64 位 dHash 拆成 max_distance + 1 段，返回每段的 (起始位, 位数)
+
+    汉明距离 ≤ max_distance 的两个 hash，不同的位最多落在 max_distance 段中，
+    至少有一段完全相同，所以只需要比较至少一段相同的候选
+    """
+    bands = min(max_distance + 1, PHASH_BITS)
+    base, extra = divmod(PHASH_BITS, bands)
+    layout, start = [], 0
+    for i in range(bands):
+        bits = base + (1 if i < extra else 0)
+        layout.append((start, bits))
+        start += bits
+    return layout
+
+
+def _bands(phash, layout):
+    return [(i, (phash >> start) & ((1 << bits) - 1)) for i, (start, bits) in enumerate(layout)]
+
+
+class ImageTranslationCache:
+    """翻译结果索引：精确 hash -> 条目；感知 hash 按分段建立倒排索引"""
+
+    def __init__(self, index_file, namespace, max_distance=IMAGE_CACHE_PHASH_DISTANCE):
+        self.index_file = index_file
+        # 模型或提示词变化时旧结果失效
+        self.namespace = namespace
+        self.max_distance = max_distance
+        self._band_layout = band_layout(max_distance) if max_distance > 0 else []
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._bands = {}
+        self.exact_hits = 0
+        self.perceptual_hits = 0
+        self.perceptual_rejected = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        for exact, entry in entries.items():
+            if entry.get('namespace') == self.namespace:
+                self._add_locked(exact, entry)
+
+    def _save_locked(self):
+        directory = os.path.dirname(self.index_file) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_file)
+
+    def _add_locked(self, exact, entry):
+        self._entries[exact] = entry
+        for band in _bands(entry['phash'], self._band_layout):
+            self._bands.setdefault(band, set()).add(exact)
+
+    def _remove_locked(self, exact):
+        entry = self._entries.pop(exact, None)
+        if entry:
+            for band in _bands(entry['phash'], self._band_layout):
+                self._bands.get(band, set()).discard(exact)
+
+    def _verified(self, entry, fp):
+        """逐像素比较缩略图；没有缩略图（或已被淘汰）的条目不参与感知命中"""
+        path = artifact_cache.path(entry['thumb_hash']) if entry.get('thumb_hash') else None
+        if not path or fp.thumb is None:
+            return False
+        try:
+            with Image.open(path) as im:
+                return same_pixels(fp.thumb, im.convert('L'))
+        except OSError:
+            return False
+
+    def _similar_locked(self, fp):
+        """感知 hash 距离在范围内、宽高比一致且通过像素校验的最接近条目"""
+        candidates = set()
+        for band in _bands(fp.phash, self._band_layout):
+            candidates |= self._bands.get(band, set())
+        aspect = fp.size[0] / float(fp.size[1])
+        matches = []
+        for exact in candidates:
+            entry = self._entries[exact]
+            distance = bin(entry['phash'] ^ fp.phash).count('1')
+            entry_aspect = entry['width'] / float(entry['height'])
+            if distance <= self.max_distance and abs(entry_aspect - aspect) <= aspect * ASPECT_TOLERANCE:
+                matches.append((distance, exact))
+        for _, exact in sorted(matches):
+            if self._verified(self._entries[exact], fp):
+                return exact
+            self.perceptual_rejected += 1
+        return None
+
+    def get(self, fp):
+        """查找翻译结果，返回 (图片字节, 扩展名, 命中类型) 或 None"""
+        with self._lock:
+            exact, kind = fp.exact, 'exact'
+            if exact not in self._entries:
+                exact, kind = (self._similar_locked(fp), 'perceptual') if self.max_distance > 0 else (None, None)
+            if not exact:
+                self.misses += 1
+                return None
+
+            entry = self._entries[exact]
+            path = artifact_cache.path(entry['artifact_hash'])
+            if not path:
+                # 产物已被 LRU 淘汰
+                self._remove_locked(exact)
+                self._save_locked()
+                self.misses += 1
+                return None
+
+            if kind == 'exact':
+                self.exact_hits += 1
+            else:
+                self.perceptual_hits += 1
+
+        try:
+            with open(path, 'rb') as f:
+                return f.read(), entry['ext'], kind
+        except OSError:
+            return None
+
+    def put(self, fp, image_bytes, ext):
+        """保存翻译结果"""
+        mimetype = 'image/jpeg' if ext == '.jpg' else 'image/png'
+        artifact_hash = artifact_cache.put_bytes(image_bytes, filename=f"translated_{fp.exact[:12]}{ext}",
+                                                 mimetype=mimetype)
+        thumb_hash = None
+        if fp.thumb is not None:
+            buffer = io.BytesIO()
+            fp.thumb.save(buffer, format='PNG')
+            thumb_hash = artifact_cache.put_bytes(buffer.getvalue(), filename=f"thumb_{fp.exact[:12]}.png",
+                                                  mimetype='image/png')
+        with self._lock:
+            self._remove_locked(fp.exact)
+            self._add_locked(fp.exact, {
+                "namespace": self.namespace,
+                "phash": fp.phash,
+                "width": fp.size[0],
+                "height": fp.size[1],
+                "artifact_hash": artifact_hash,
+                "thumb_hash": thumb_hash,
+                "ext": ext,
+                "created_at": time.time()
+            })
+            self._save_locked()
+        return artifact_hash
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": IMAGE_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_distance": self.max_distance,
+                "exact_hits": self.exact_hits,
+                "perceptual_hits": self.perceptual_hits,
+                "perceptual_rejected": self.perceptual_rejected,
+                "misses": self.misses
+            }
+
+
+def create_image_translation_cache(model, prompt):
+    """按模型和提示词创建缓存，未启用时返回 None"""
+    if not IMAGE_CACHE_ENABLED:
+        return None
+    namespace = hashlib.sha256(f"{model}\n{prompt}".encode('utf-8')).hexdigest()[:16]
+    return ImageTranslationCache(IMAGE_CACHE_INDEX_FILE, namespace)
+
+
+def register_image_cache_routes(app, cache):
+    """注册图片翻译缓存监控路由"""
+
+    @app.route('/api/image-cache/stats', methods=['GET'])
+    def get_image_cache_stats():
+        """图片翻译缓存命中统计"""
+        return jsonify({
+            "success": True,
+            "stats": cache.stats() if cache else {"enabled": False}
+        }), 200
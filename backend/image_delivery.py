@@ -0,0 +1,226 @@
+"""
+翻译结果图片的返回方式
+- 模型返回远程链接、且不需要转码时，直接把上游响应逐块转发给前端（带 Content-Length），
+  不再先完整下载到内存
+- 按请求的 Accept 头转码为 AVIF / WebP / PNG；转码结果按「原图 hash + 格式」保存在产物缓存中，
+  同一张图再次请求时不重复转码
+- 返回 ETag 和产物地址（X-Artifact-Url），前端通过 GET /api/artifacts/<hash> 再次显示时直接命中浏览器缓存
+
+AVIF 需要 Pillow 支持（Pillow ≥ 11.2 自带，旧版本需要 pip install pillow-avif-plugin），不支持时不会选择 AVIF
+"""
+import os
+import io
+import hashlib
+
+from PIL import Image
+
+from artifact_cache import artifact_cache, artifact_url
+
+# ============= 配置区域 =============
+IMAGE_TRANSCODE_ENABLED = os.getenv("IMAGE_TRANSCODE_ENABLED", "true").lower() != "false"
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+AVIF_QUALITY = int(os.getenv("AVIF_QUALITY", "60"))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+FORMAT_MIMETYPES = {
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'avif': 'image/avif'
+}
+FORMAT_EXTENSIONS = {
+    'jpeg': '.jpg',
+    'png': '.png',
+    'webp': '.webp',
+    'avif': '.avif'
+}
+# Pillow 中的格式名
+_PIL_FORMATS = {'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP', 'avif': 'AVIF'}
+# 只转码为体积更小的格式；PNG 只在客户端明确偏好时使用
+_SMALLER_FORMATS = ('avif', 'webp')
+
+_encodable = None
+
+
+def _encodable_formats():
+    """当前 Pillow 能编码的格式"""
+    global _encodable
+    if _encodable is None:
+        try:
+            import pillow_avif  # noqa: F401  旧版 Pillow 的 AVIF 插件
+        except ImportError:
+            pass
+        Image.init()
+        _encodable = {fmt for fmt, name in _PIL_FORMATS.items() if name in Image.SAVE}
+    return _encodable
+
+
+def format_from_ext(ext):
+    return 'png' if ext == '.png' else 'jpeg'
+
+
+def format_from_content_type(content_type):
+    """上游响应的 Content-Type 对应的扩展名（未知时按 JPEG 处理，与原来一致）"""
+    mimetype = (content_type or '').split(';')[0].strip().lower()
+    return '.png' if mimetype == 'image/png' else '.jpg'
+
+
+def _parse_accept(accept):
+    """解析 Accept 头，返回 {媒体类型: q 值}"""
+    ranges = {}
+    for part in accept.split(','):
+        fields = [f.strip() for f in part.split(';')]
+        if not fields[0]:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        ranges[fields[0].lower()] = q
+    return ranges
+
+
+def negotiate_image_format(accept, source_fmt):
+    """
+    按 Accept 选择返回格式，返回 None 表示保持原格式
+
+    原格式通过 image/* 或 */* 也算可接受；其他格式必须在 Accept 中明确列出。
+    q 值相同时依次优先 AVIF、WebP、原格式
+    """
+    if not IMAGE_TRANSCODE_ENABLED or not accept:
+        return None
+    ranges = _parse_accept(accept)
+
+    def quality(fmt):
+        mimetype = FORMAT_MIMETYPES[fmt]
+        if mimetype in ranges:
+            return ranges[mimetype]
+        if fmt == source_fmt:
+            return ranges.get('image/*', ranges.get('*/*', 0.0))
+        return 0.0
+
+    order = [f for f in _SMALLER_FORMATS if f != source_fmt] + [source_fmt]
+    order += [f for f in FORMAT_MIMETYPES if f not in order]
+    candidates = [f for f in order if f == source_fmt or f in _encodable_formats()]
+    best = max(candidates, key=lambda f: (quality(f), -order.index(f)))
+    if best == source_fmt or quality(best) <= 0:
+        return None
+    return best
+
+
+def transcode_image(data, fmt):
+    """把图片转码为指定格式"""
+    buf = io.BytesIO()
+    with Image.open(io.BytesIO(data)) as im:
+        if fmt == 'jpeg' or im.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            im = im.convert('RGB' if fmt == 'jpeg' or 'transparency' not in im.info else 'RGBA')
+        if fmt == 'webp':
+            im.save(buf, format='WEBP', quality=WEBP_QUALITY, method=4)
+        elif fmt == 'avif':
+            im.save(buf, format='AVIF', quality=AVIF_QUALITY)
+        elif fmt == 'png':
+            im.save(buf, format='PNG', optimize=True)
+        else:
+            im.save(buf, format='JPEG', quality=90, optimize=True)
+    return buf.getvalue()
+
+
+def _cached_bytes(artifact_hash):
+    path = artifact_cache.path(artifact_hash)
+    if not path:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def deliver_image(data, ext, accept, filename_stem='translated'):
+    """
+    准备返回给前端的图片（按 Accept 转码，并保存到产物缓存）
+
+    返回 (图片字节, 扩展名, mimetype, 产物 hash)
+    """
+    source_fmt = format_from_ext(ext)
+    target = negotiate_image_format(accept, source_fmt)
+    source_hash = hashlib.sha256(data).hexdigest()
+    if target is None:
+        if not artifact_cache.path(source_hash):
+            artifact_cache.put_bytes(data, filename=f"{filename_stem}{ext}", mimetype=FORMAT_MIMETYPES[source_fmt])
+        return data, ext, FORMAT_MIMETYPES[source_fmt], source_hash
+
+    variant_key = f"transcode://{source_hash}/{target}"
+    variant_hash = artifact_cache.lookup(variant_key)
+    output = _cached_bytes(variant_hash) if variant_hash else None
+    if output is None:
+        output = transcode_image(data, target)
+        variant_hash = artifact_cache.put_bytes(output, filename=f"{filename_stem}{FORMAT_EXTENSIONS[target]}",
+                                                mimetype=FORMAT_MIMETYPES[target], source_url=variant_key)
+        print(f"[Image Delivery] 转码 {source_fmt} -> {target}: {len(data) / 1024:.0f}KB -> {len(output) / 1024:.0f}KB")
+    return output, FORMAT_EXTENSIONS[target], FORMAT_MIMETYPES[target], variant_hash
+
+
+def validator_headers(artifact_hash, base_url=None):
+    """缓存校验相关的响应头"""
+    return {
+        'ETag': f'"{artifact_hash}"',
+        'Vary': 'Accept',
+        'Content-Location': f"/api/artifacts/{artifact_hash}",
+        'X-Artifact-Url': artifact_url(artifact_hash, base_url)
+    }
+
+
+class TranslatedImage:
+    """翻译结果：完整的图片字节，或尚未读取正文的远程响应（requests 流式响应）"""
+
+    def __init__(self, ext, data=None, upstream=None, on_complete=None):
+        self.ext = ext
+        self.data = data
+        self.upstream = upstream
+        self.on_complete = on_complete
+
+    @property
+    def streaming(self):
+        return self.data is None
+
+    def stream_headers(self):
+        """逐块转发时可以直接沿用的上游响应头"""
+        headers = {}
+        if not self.upstream.headers.get('Content-Encoding'):
+            length = self.upstream.headers.get('Content-Length')
+            if length:
+                headers['Content-Length'] = length
+        for name in ('ETag', 'Last-Modified'):
+            if self.upstream.headers.get(name):
+                headers[name] = self.upstream.headers[name]
+        return headers
+
+    def _complete(self):
+        if self.on_complete:
+            self.on_complete(self.data, self.ext)
+
+    def read(self):
+        """读取完整字节（远程响应在这里下载）"""
+        if self.data is None:
+            try:
+                self.data = self.upstream.content
+            finally:
+                self.upstream.close()
+            self._complete()
+        return self.data
+
+    def iter_chunks(self, chunk_size=STREAM_CHUNK_SIZE):
+        """逐块转发远程响应，完整读取后交给 on_complete（写入翻译缓存）；客户端中途断开时不保存"""
+        chunks = []
+        try:
+            for chunk in self.upstream.iter_content(chunk_size):
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            self.upstream.close()
+        self.data = b''.join(chunks)
+        self._complete()
@@ -0,0 +1,159 @@
+"""
+按体积预算自适应编码待翻译的图片
+固定 JPEG 质量 85、最长边 1600 时，简单图表的上传体积偏大，文字密集的扫描页又压得太狠；
+而上传到 OpenRouter 的时间是图片翻译延迟的主要部分。
+
+每张图片先做一次快速分析：
+- 颜色数不超过 PALETTE_MAX_COLORS 的图表、示意图先尝试调色板 PNG（无损，文字边缘清晰）
+- 其余图片用 JPEG，在质量区间内二分查找不超过 IMAGE_PAYLOAD_BUDGET 的最高质量；
+  边缘像素占比高（文字密集）的图片使用更高的质量下限
+- 最低质量仍超出预算时按 DOWNSCALE_STEP 缩小尺寸后重试，最长边不小于 MIN_ENCODE_SIZE；
+  文字密集的图片和分块翻译的块（allow_downscale=False）不缩小，以质量下限按原尺寸发送，
+  缩小会让小字号的文字无法辨认
+"""
+import os
+import io
+import time
+import base64
+
+from PIL import Image, ImageFilter
+
+# ============= 配置区域 =============
+ADAPTIVE_ENCODING = os.getenv("ADAPTIVE_ENCODING", "true").lower() != "false"
+# 单张图片编码后的体积上限（字节）
+IMAGE_PAYLOAD_BUDGET = int(os.getenv("IMAGE_PAYLOAD_BUDGET", str(512 * 1024)))
+# 为满足预算缩小尺寸时，最长边的下限
+MIN_ENCODE_SIZE = int(os.getenv("MIN_ENCODE_SIZE", "1024"))
+
+# 边缘像素占比超过该值时视为文字密集
+TEXT_EDGE_DENSITY = 0.08
+EDGE_THRESHOLD = 48
+ANALYSIS_SIZE = 256
+QUALITY_RANGE_TEXT = (70, 92)
+QUALITY_RANGE_DEFAULT = (45, 88)
+PALETTE_MAX_COLORS = 64
+DOWNSCALE_STEP = 0.8
+
+
+class EncodedImage:
+    """编码结果及统计信息"""
+
+    def __init__(self, data, fmt, size, original_size, quality=None, edge_density=None, encode_ms=0.0):
+        self.data = data
+        self.fmt = fmt
+        self.size = size
+        self.original_size = original_size
+        self.quality = quality
+        self.edge_density = edge_density
+        self.encode_ms = encode_ms
+        self._b64 = None
+
+    @property
+    def b64(self):
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self.data).decode('ascii')
+        return self._b64
+
+    @property
+    def payload_bytes(self):
+        return len(self.data)
+
+    def report(self):
+        """写入日志和响应头的统计信息"""
+        return {
+            "format": self.fmt,
+            "quality": self.quality,
+            "width": self.size[0],
+            "height": self.size[1],
+            "payload_bytes": self.payload_bytes,
+            "encode_ms": round(self.encode_ms, 1),
+            "edge_density": None if self.edge_density is None else round(self.edge_density, 4)
+        }
+
+    def describe(self):
+        quality = f" q={self.quality}" if self.quality else ""
+        return (f"{self.fmt}{quality} {self.size[0]}x{self.size[1]} {self.payload_bytes / 1024:.0f}KB "
+                f"编码 {self.encode_ms:.0f}ms")
+
+
+def edge_density(im):
+    """缩略图上边缘像素的占比，文字越密集越高"""
+    gray = im.convert('L')
+    gray.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+    histogram = gray.filter(ImageFilter.FIND_EDGES).histogram()
+    total = sum(histogram)
+    return sum(histogram[EDGE_THRESHOLD:]) / float(total) if total else 0.0
+
+
+def _encode_jpeg(im, quality, optimize=False):
+    buf = io.BytesIO()
+    im.save(buf, format="JPEG", quality=quality, optimize=optimize)
+    return buf.getvalue()
+
+
+def _encode_palette_png(im, colors):
+    buf = io.BytesIO()
+    im.convert('P', palette=Image.ADAPTIVE, colors=colors).save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def _search_quality(im, low, high, budget):
+    """二分查找不超过预算的最高质量，返回 (JPEG 字节, 质量)；最低质量也超出时返回 (None, None)"""
+    data = _encode_jpeg(im, high)
+    if len(data) <= budget:
+        return _encode_jpeg(im, high, optimize=True), high
+    best = None
+    while low < high:
+        mid = (low + high) // 2
+        data = _encode_jpeg(im, mid)
+        if len(data) <= budget:
+            best, low = mid, mid + 1
+        else:
+            high = mid
+    if best is None:
+        return None, None
+    # 搜索时不开 optimize 以节省时间，最终结果开启后只会更小
+    return _encode_jpeg(im, best, optimize=True), best
+
+
+def encode_image(im, original_size=None, budget=IMAGE_PAYLOAD_BUDGET, fixed_quality=85, started_at=None,
+                 allow_downscale=True):
+    """
+    编码一张 RGB 图片，返回 EncodedImage
+
+    未启用自适应编码时按 fixed_quality 编码 JPEG；
+    allow_downscale=False 时任何图片都不缩小尺寸（分块翻译的块会按块尺寸放大回去）
+    """
+    started_at = started_at or time.perf_counter()
+    original_size = original_size or im.size
+
+    def done(data, fmt, image, quality=None, density=None):
+        return EncodedImage(data, fmt, image.size, original_size, quality, density,
+                            (time.perf_counter() - started_at) * 1000)
+
+    if not ADAPTIVE_ENCODING:
+        return done(_encode_jpeg(im, fixed_quality, optimize=True), 'jpeg', im, fixed_quality)
+
+    colors = im.getcolors(PALETTE_MAX_COLORS)
+    if colors is not None:
+        data = _encode_palette_png(im, len(colors))
+        if len(data) <= budget:
+            return done(data, 'png', im)
+
+    density = edge_density(im)
+    text_dense = density >= TEXT_EDGE_DENSITY
+    low, high = QUALITY_RANGE_TEXT if text_dense else QUALITY_RANGE_DEFAULT
+    while True:
+        data, quality = _search_quality(im, low, high, budget)
+        if data is not None:
+            return done(data, 'jpeg', im, quality, density)
+        w, h = im.size
+        if text_dense or not allow_downscale or max(w, h) * DOWNSCALE_STEP < MIN_ENCODE_SIZE:
+            # 不允许缩小或已经缩到下限，用最低质量发送，超出预算也不再降低
+            return done(_encode_jpeg(im, low, optimize=True), 'jpeg', im, low, density)
+        im = im.resize((int(w * DOWNSCALE_STEP), int(h * DOWNSCALE_STEP)), Image.LANCZOS)
+
+
+def image_mime_type(image_b64):
+    """根据 base64 开头的文件头判断图片类型"""
+    return 'image/png' if image_b64.startswith('iVBORw0KGgo') else 'image/jpeg'
@@ -6,38 +6,18 @@
 """
 import os
 import sys
-import requests
 from dotenv import load_dotenv
 
+from postgrest_client import postgrest
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# Supabase REST API 端点
-SUPABASE_REST_URL = f"{SUPABASE_URL}/rest/v1"
-
-# 设置请求头
-headers = {
-    "apikey": SUPABASE_KEY,
-    "Authorization": f"Bearer {SUPABASE_KEY}",
-    "Content-Type": "application/json",
-    "Prefer": "return=representation"
-}
-
 def supabase_request(method, table, data=None, params=None):
-    """直接发送 HTTP 请求到 Supabase REST API"""
-    url = f"{SUPABASE_REST_URL}/{table}"
-    try:
-        if method == "GET":
-            response = requests.get(url, headers=headers, params=params)
-        elif method == "POST":
-            response = requests.post(url, headers=headers, json=data)
-        else:
-            raise ValueError(f"Unsupported method: {method}")
-        return response
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Supabase request failed: {e}")
+    """直接发送 HTTP 请求到 Supabase REST API（不检查状态码；超时和重试见 postgrest_client.py）"""
+    return postgrest.request(method, table, data=data, params=params, raise_for_status=False)
 
 
 def init_database():
@@ -0,0 +1,154 @@
+"""
+API Key / 端点池
+每个工作流可以配置多个 API Key 和多个服务地址（例如多个自部署的 Dify 副本），
+请求按「当前进行中的请求数最少」选择端点；返回 429 / 5xx 或连接失败的端点暂时移出，冷却后再恢复
+
+配置方式（逗号分隔，未配置时使用代码里的默认值）：
+    ACADEMIC_TO_OFFICIAL_API_KEYS=app-xxx,app-yyy
+    DIFY_BASE_URLS=https://dify-a.example.com/v1,https://dify-b.example.com/v1
+
+注意：同一个池中的多个 Dify 地址必须共享存储，否则上传得到的 file_id 在其它副本上不可用
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from flask import jsonify
+
+# 端点被移出后的冷却时间（秒）
+ENDPOINT_COOLDOWN = int(os.getenv("ENDPOINT_COOLDOWN", "30"))
+
+
+class Endpoint:
+    """一个 API Key + 服务地址组合"""
+
+    def __init__(self, api_key, base_url):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.in_flight = 0
+        self.total = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self.ejected_until = 0.0
+        self.last_status = None
+
+    @property
+    def headers(self):
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+
+    def describe(self):
+        """用于统计输出，隐藏 key 的大部分内容"""
+        return f"{self.api_key[:8]}…@{self.base_url}"
+
+
+class Lease:
+    """一次端点占用，记录上游返回的状态码"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.status_code = None
+        self.failed = False
+
+    def record_status(self, status_code):
+        self.status_code = status_code
+
+    def mark_failed(self):
+        """标记连接失败（用于不继承 OSError 的客户端异常）"""
+        self.failed = True
+
+
+class EndpointPool:
+    """按最少进行中请求数做负载均衡的端点池"""
+
+    def __init__(self, name, endpoints, cooldown=ENDPOINT_COOLDOWN):
+        if not endpoints:
+            raise ValueError(f"端点池 {name} 没有可用的端点")
+        self.name = name
+        self.endpoints = endpoints
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.created_at = time.monotonic()
+
+    def acquire(self):
+        """选择一个端点；全部处于冷却时选择最早恢复的那个"""
+        now = time.monotonic()
+        with self._lock:
+            available = [e for e in self.endpoints if e.ejected_until <= now]
+            if available:
+                endpoint = min(available, key=lambda e: e.in_flight)
+            else:
+                endpoint = min(self.endpoints, key=lambda e: e.ejected_until)
+            endpoint.in_flight += 1
+            endpoint.total += 1
+            return endpoint
+
+    def release(self, endpoint, status_code=None, failed=False, busy_seconds=0.0):
+        """归还端点；限流、服务端错误或连接失败时移出冷却"""
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.busy_seconds += busy_seconds
+            endpoint.last_status = status_code
+            if failed or status_code == 429 or (status_code is not None and status_code >= 500):
+                endpoint.failures += 1
+                endpoint.ejected_until = time.monotonic() + self.cooldown
+                print(f"[EndpointPool] {self.name}: {endpoint.describe()} 返回 {status_code or '连接失败'}，冷却 {self.cooldown}s")
+
+    @contextmanager
+    def lease(self):
+        """占用一个端点，退出时根据状态码或异常决定是否移出"""
+        endpoint = self.acquire()
+        lease = Lease(endpoint)
+        started_at = time.monotonic()
+        try:
+            yield lease
+        except OSError:
+            # requests 的连接错误、超时都继承自 OSError
+            self.release(endpoint, lease.status_code, failed=True, busy_seconds=time.monotonic() - started_at)
+            raise
+        except Exception:
+            self.release(endpoint, lease.status_code, failed=lease.failed, busy_seconds=time.monotonic() - started_at)
+            raise
+        else:
+            self.release(endpoint, lease.status_code, failed=lease.failed, busy_seconds=time.monotonic() - started_at)
+
+    def stats(self):
+        """每个端点的利用率"""
+        now = time.monotonic()
+        elapsed = max(now - self.created_at, 1e-6)
+        with self._lock:
+            return [{
+                "endpoint": e.describe(),
+                "in_flight": e.in_flight,
+                "total": e.total,
+                "failures": e.failures,
+                "last_status": e.last_status,
+                "ejected": e.ejected_until > now,
+                "utilization": round(e.busy_seconds / elapsed, 4)
+            } for e in self.endpoints]
+
+
+def _split_env(name):
+    return [v.strip() for v in os.getenv(name, "").split(",") if v.strip()]
+
+
+def build_pool(name, keys_env, default_key, urls_env, default_url):
+    """根据环境变量构建端点池：每个 key 与每个地址组合成一个端点"""
+    keys = _split_env(keys_env) or [default_key]
+    urls = _split_env(urls_env) or [default_url]
+    return EndpointPool(name, [Endpoint(key, url) for key in keys for url in urls])
+
+
+def register_pool_routes(app, pools):
+    """注册端点池监控路由"""
+
+    @app.route('/api/pools/stats', methods=['GET'])
+    def get_pool_stats():
+        """各工作流端点池的利用率"""
+        return jsonify({
+            "success": True,
+            "pools": {name: pool.stats() for name, pool in pools.items()}
+        }), 200
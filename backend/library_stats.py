@@ -0,0 +1,300 @@
+"""
+文档库统计缓存
+前端每次打开文档库都会请求 /api/stats、/api/folders、/api/websites，原来每次都要扫描用户的全部文档。
+
+每个用户的统计（总数、来源、文件类型、文件夹、来源网站、最近创建）保存在内存中：
+- 首次请求时读取一次该用户文档的统计相关列建立缓存，之后读取不再访问数据库
+- 创建、插件保存、修改、删除文档的路由把变更增量应用到缓存上
+- 增量与缓存不一致（例如修改了缓存中不存在的文档）时丢弃该用户的缓存，下次请求时重建
+- 超过 LIBRARY_STATS_TTL 秒后重建，兜住直接修改数据库等绕过后端的写入
+配置 LIBRARY_STATS_SNAPSHOT_FILE 后缓存会保存到磁盘，重启后在有效期内无需重建
+"""
+import os
+import re
+import json
+import time
+import bisect
+import tempfile
+import threading
+from datetime import datetime
+
+from website_sources import classify_website
+
+# ============= 配置区域 =============
+LIBRARY_STATS_CACHE_ENABLED = os.getenv("LIBRARY_STATS_CACHE_ENABLED", "true").lower() != "false"
+# 缓存有效期（秒），0 表示不过期
+LIBRARY_STATS_TTL = int(os.getenv("LIBRARY_STATS_TTL", "3600"))
+# 缓存快照文件，留空不保存
+LIBRARY_STATS_SNAPSHOT_FILE = os.getenv("LIBRARY_STATS_SNAPSHOT_FILE", "")
+# 合并短时间内的多次写入，最多每隔这么久保存一次快照（秒）
+SNAPSHOT_DELAY = 5
+
+# /api/stats 中「最近」的天数
+RECENT_DAYS = 7
+# 建立缓存时读取的列
+STATS_COLUMNS = "id,user_id,folder,source_type,file_type,source_url,created_at"
+
+_FRACTION_RE = re.compile(r"\.(\d+)")
+
+
+def parse_timestamp(value):
+    """ISO 时间字符串转为 Unix 时间戳，无法解析时返回 None（无时区时按本地时间）"""
+    if not value:
+        return None
+    text = value.replace('Z', '+00:00')
+    # Python 3.9 的 fromisoformat 只接受 3 或 6 位小数秒
+    text = _FRACTION_RE.sub(lambda m: '.' + m.group(1)[:6].ljust(6, '0'), text, count=1)
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+def document_entry(doc):
+    """一个文档对各项统计的贡献：[文件夹, 来源类型, 文件类型, 来源网站, 创建时间戳]"""
+    return [
+        doc.get('folder') or '其他',
+        doc.get('source_type'),
+        doc.get('file_type') or 'unknown',
+        classify_website(doc.get('source_url')),
+        parse_timestamp(doc.get('created_at'))
+    ]
+
+
+def _bump(counter, key, delta):
+    count = counter.get(key, 0) + delta
+    if count:
+        counter[key] = count
+    else:
+        counter.pop(key, None)
+
+
+class UserLibraryStats:
+    """单个用户的统计：保留每个文档的贡献，变更时先减去旧贡献再加上新贡献"""
+
+    def __init__(self, built_at):
+        self.built_at = built_at
+        self.docs = {}
+        self.folders = {}
+        self.by_source = {}
+        self.by_type = {}
+        self.websites = {}
+        self.created = []  # 创建时间戳（升序），用于计算最近创建数
+
+    @classmethod
+    def build(cls, docs, built_at=None):
+        stats = cls(built_at or time.time())
+        for doc in docs:
+            stats.add(doc['id'], document_entry(doc))
+        return stats
+
+    def add(self, doc_id, entry):
+        folder, source_type, file_type, website, created_ts = entry
+        self.docs[doc_id] = entry
+        _bump(self.folders, folder, 1)
+        _bump(self.by_source, source_type, 1)
+        _bump(self.by_type, file_type, 1)
+        if website:
+            _bump(self.websites, website, 1)
+        if created_ts is not None:
+            bisect.insort(self.created, created_ts)
+
+    def remove(self, doc_id):
+        """减去文档的贡献，文档不在缓存中时返回 False"""
+        entry = self.docs.pop(doc_id, None)
+        if entry is None:
+            return False
+        folder, source_type, file_type, website, created_ts = entry
+        _bump(self.folders, folder, -1)
+        _bump(self.by_source, source_type, -1)
+        _bump(self.by_type, file_type, -1)
+        if website:
+            _bump(self.websites, website, -1)
+        if created_ts is not None:
+            index = bisect.bisect_left(self.created, created_ts)
+            if index < len(self.created) and self.created[index] == created_ts:
+                del self.created[index]
+        return True
+
+    def summary(self, now=None):
+        """与 /api/stats 的 stats 字段一致"""
+        since = (now or time.time()) - RECENT_DAYS * 24 * 3600
+        return {
+            "total": len(self.docs),
+            "by_source": {
+                "plugin": self.by_source.get('plugin', 0),
+                "manual": self.by_source.get('manual', 0),
+                "upload": self.by_source.get('upload', 0)
+            },
+            "by_type": dict(self.by_type),
+            "recent_count": len(self.created) - bisect.bisect_right(self.created, since)
+        }
+
+
+class LibraryStatsCache:
+    """按用户缓存文档库统计"""
+
+    def __init__(self, loader, ttl=LIBRARY_STATS_TTL, snapshot_file=LIBRARY_STATS_SNAPSHOT_FILE):
+        """loader(user_id)：读取用户全部文档（至少包含 STATS_COLUMNS 中的列）"""
+        self.loader = loader
+        self.ttl = ttl
+        self.snapshot_file = snapshot_file
+        self._lock = threading.Lock()
+        self._users = {}
+        # 每个用户的写入版本：重建期间有写入时不保存重建结果，避免覆盖掉这次写入
+        self._versions = {}
+        self._save_timer = None
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.invalidations = 0
+        self._load()
+
+    # ---------- 读取 ----------
+
+    def _expired(self, stats, now):
+        return self.ttl > 0 and now - stats.built_at > self.ttl
+
+    def _read(self, user_id, read):
+        """在锁内对用户统计执行 read，缓存不存在或过期时先重建"""
+        with self._lock:
+            stats = self._users.get(user_id)
+            if stats is not None and not self._expired(stats, time.time()):
+                self.hits += 1
+                return read(stats)
+            self.misses += 1
+            version = self._versions.get(user_id, 0)
+
+        stats = UserLibraryStats.build(self.loader(user_id))
+        with self._lock:
+            self.rebuilds += 1
+            if self._versions.get(user_id, 0) == version:
+                self._users[user_id] = stats
+                self._schedule_save_locked()
+            return read(stats)
+
+    def stats(self, user_id):
+        """/api/stats 的统计信息"""
+        return self._read(user_id, lambda s: s.summary())
+
+    def folder_counts(self, user_id):
+        """{文件夹: 文档数}"""
+        return self._read(user_id, lambda s: dict(s.folders))
+
+    def website_counts(self, user_id):
+        """{网站 key: 文档数}"""
+        return self._read(user_id, lambda s: dict(s.websites))
+
+    # ---------- 增量更新 ----------
+
+    def _invalidate_locked(self, user_id, reason):
+        if self._users.pop(user_id, None) is not None:
+            self.invalidations += 1
+            print(f"[LibraryStats] 缓存与变更不一致，丢弃用户 {user_id} 的统计: {reason}")
+            self._schedule_save_locked()
+
+    def record_upsert(self, doc, created=False):
+        """
+        应用一次文档创建（created=True）或修改，doc 为写入后的完整行
+
+        创建的文档已在缓存中、修改的文档不在缓存中时视为不一致
+        """
+        user_id, doc_id = doc.get('user_id', 'default'), doc.get('id')
+        if not doc_id:
+            return
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            stats = self._users.get(user_id)
+            if stats is None:
+                return
+            existed = stats.remove(doc_id)
+            if existed == created:
+                self._invalidate_locked(user_id, f"{'创建' if created else '修改'} {doc_id}")
+                return
+            stats.add(doc_id, document_entry(doc))
+            self._schedule_save_locked()
+
+    def record_delete(self, doc):
+        """应用一次文档删除，doc 为被删除的行（至少包含 id、user_id）"""
+        user_id, doc_id = doc.get('user_id', 'default'), doc.get('id')
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            stats = self._users.get(user_id)
+            if stats is None:
+                return
+            if not stats.remove(doc_id):
+                self._invalidate_locked(user_id, f"删除 {doc_id}")
+                return
+            self._schedule_save_locked()
+
+    def invalidate(self, user_id=None):
+        """丢弃某个用户（不指定时为全部用户）的缓存"""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+            self._schedule_save_locked()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "enabled": LIBRARY_STATS_CACHE_ENABLED,
+                "users": len(self._users),
+                "documents": sum(len(s.docs) for s in self._users.values()),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rebuilds": self.rebuilds,
+                "invalidations": self.invalidations
+            }
+
+    # ---------- 快照 ----------
+
+    def _load(self):
+        if not self.snapshot_file:
+            return
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for user_id, item in snapshot.get('users', {}).items():
+            stats = UserLibraryStats(item['built_at'])
+            if self._expired(stats, now):
+                continue
+            for doc_id, entry in item['docs'].items():
+                stats.add(doc_id, entry)
+            self._users[user_id] = stats
+        print(f"[LibraryStats] 加载快照: {len(self._users)} 个用户")
+
+    def _schedule_save_locked(self):
+        if not self.snapshot_file or self._save_timer is not None:
+            return
+        self._save_timer = threading.Timer(SNAPSHOT_DELAY, self.save)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def save(self):
+        """把缓存写入快照文件"""
+        with self._lock:
+            self._save_timer = None
+            snapshot = {
+                "saved_at": time.time(),
+                "users": {
+                    user_id: {"built_at": stats.built_at, "docs": dict(stats.docs)}
+                    for user_id, stats in self._users.items()
+                }
+            }
+        directory = os.path.dirname(self.snapshot_file) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_file)
+        except OSError as e:
+            print(f"[LibraryStats] 保存快照失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,106 @@
+"""
+文档流水线
+把「上传 → 翻译 → 转公文 → 转存」这样的多步处理放在服务端连续执行，
+中间产物直接交给下一步，不需要浏览器下载后再上传
+
+每一步的结果按「步骤 + 输入内容 + 参数」缓存，同一份文档重复执行相同的步骤时直接复用
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import jsonify
+
+# 支持的步骤，必须按这个顺序出现
+PIPELINE_STAGES = ('upload', 'translate', 'convert', 'rehost')
+DEFAULT_STAGES = list(PIPELINE_STAGES)
+
+# 步骤结果缓存
+PIPELINE_CACHE_TTL = int(os.getenv("PIPELINE_CACHE_TTL", str(24 * 3600)))
+PIPELINE_CACHE_MAX_ENTRIES = int(os.getenv("PIPELINE_CACHE_MAX_ENTRIES", "2000"))
+
+
+def parse_stages(value):
+    """解析步骤列表（JSON 数组或逗号分隔字符串），返回 (步骤列表, 错误信息)"""
+    if value is None or value == '':
+        return DEFAULT_STAGES, None
+    if isinstance(value, str):
+        value = [v.strip() for v in value.split(',') if v.strip()]
+    if not isinstance(value, list) or not value:
+        return None, "stages must be a non-empty list"
+
+    unknown = [s for s in value if s not in PIPELINE_STAGES]
+    if unknown:
+        return None, f"Unknown stages: {', '.join(map(str, unknown))}"
+    order = [PIPELINE_STAGES.index(s) for s in value]
+    if order != sorted(set(order)):
+        return None, f"Stages must be unique and ordered as {' → '.join(PIPELINE_STAGES)}"
+    return value, None
+
+
+def stage_key(stage, *parts):
+    """步骤缓存键：步骤名 + 输入内容标识 + 参数"""
+    raw = json.dumps([stage, *parts], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class StageCache:
+    """步骤结果缓存（进程内 LRU + TTL）"""
+
+    def __init__(self, ttl=PIPELINE_CACHE_TTL, max_entries=PIPELINE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (写入时间, 结果)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.time(), dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+stage_cache = StageCache()
+
+
+def register_pipeline_routes(app):
+    """注册流水线监控路由"""
+
+    @app.route('/api/pipelines/stats', methods=['GET'])
+    def get_pipeline_stats():
+        """步骤结果缓存统计"""
+        return jsonify({
+            "success": True,
+            "stages": list(PIPELINE_STAGES),
+            "cache": stage_cache.stats()
+        }), 200
@@ -0,0 +1,182 @@
+"""
+Supabase REST API（PostgREST）客户端
+document_local_api、init_db、init_db_api 共用，原来各自直接调用 requests，没有超时也不重试，
+Supabase 变慢时 Flask 线程会一直挂起。
+
+- 每次调用都有连接超时和读取超时（POSTGREST_CONNECT_TIMEOUT / POSTGREST_READ_TIMEOUT）
+- 幂等请求（GET、HEAD、PUT、DELETE，以及标记为幂等的只读 RPC）在连接失败、超时、429、502/503/504 时
+  按指数退避重试，最多 POSTGREST_MAX_RETRIES 次
+- 在 Flask 请求中，同一个请求内的所有调用共享一个截止时间（从第一次调用起 POSTGREST_REQUEST_BUDGET 秒），
+  每次调用的超时和重试等待都不超过剩余时间，到期后直接失败，不再占用线程
+
+使用直接的 HTTP 请求访问 Supabase REST API，绕过 DNS 解析问题
+"""
+import os
+import time
+import random
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import g, has_request_context
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ============= 配置区域 =============
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+POSTGREST_CONNECT_TIMEOUT = float(os.getenv("POSTGREST_CONNECT_TIMEOUT", "3"))
+POSTGREST_READ_TIMEOUT = float(os.getenv("POSTGREST_READ_TIMEOUT", "10"))
+POSTGREST_MAX_RETRIES = int(os.getenv("POSTGREST_MAX_RETRIES", "2"))
+# 一个 Flask 请求内所有 Supabase 调用的总时间（秒），0 表示不限制
+POSTGREST_REQUEST_BUDGET = float(os.getenv("POSTGREST_REQUEST_BUDGET", "15"))
+# 连接池大小，与 gunicorn 线程数相当
+POSTGREST_POOL_SIZE = int(os.getenv("POSTGREST_POOL_SIZE", "64"))
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE")
+RETRY_STATUS = (429, 502, 503, 504)
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 2.0
+
+
+class PostgrestError(Exception):
+    """
+    Supabase 请求失败（status_code 为 HTTP 状态码，连接失败、超时时为 None）
+
+    code、detail 为 PostgREST 错误响应中的 code（PGRST204、42703 等）和 message
+    """
+
+    def __init__(self, message, status_code=None, code=None, detail=None):
+        super().__init__(f"Supabase request failed: {message}" + (f" ({code}: {detail})" if code else ""))
+        self.status_code = status_code
+        self.code = code
+        self.detail = detail
+
+
+def _error_body(response):
+    """PostgREST 错误响应中的 (code, message)"""
+    try:
+        body = response.json()
+    except ValueError:
+        return None, None
+    if not isinstance(body, dict):
+        return None, None
+    return body.get('code'), body.get('message')
+
+
+class DeadlineExceeded(PostgrestError):
+    """当前请求的截止时间已到"""
+
+
+def request_deadline():
+    """当前 Flask 请求的截止时间（time.monotonic()），不在请求中或不限制时返回 None"""
+    if not has_request_context() or POSTGREST_REQUEST_BUDGET <= 0:
+        return None
+    deadline = g.get('postgrest_deadline')
+    if deadline is None:
+        deadline = g.postgrest_deadline = time.monotonic() + POSTGREST_REQUEST_BUDGET
+    return deadline
+
+
+def _retry_delay(attempt, response=None):
+    """第 attempt 次重试前的等待时间：指数退避加随机抖动，429 时参考 Retry-After"""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+    if response is not None and response.status_code == 429:
+        try:
+            delay = max(delay, min(BACKOFF_MAX, float(response.headers.get('Retry-After', 0))))
+        except ValueError:
+            pass
+    return delay
+
+
+class PostgrestClient:
+    """带超时、重试和截止时间的 PostgREST 客户端"""
+
+    def __init__(self, base_url, api_key, connect_timeout=POSTGREST_CONNECT_TIMEOUT,
+                 read_timeout=POSTGREST_READ_TIMEOUT, max_retries=POSTGREST_MAX_RETRIES):
+        self.rest_url = f"{base_url}/rest/v1"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.headers = {
+            "apikey": api_key,
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Prefer": "return=representation"
+        }
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POSTGREST_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _timeout(self, deadline, read_timeout):
+        """本次调用的 (连接超时, 读取超时)，不超过剩余时间"""
+        connect, read = self.connect_timeout, read_timeout or self.read_timeout
+        if deadline is None:
+            return connect, read
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("request deadline exceeded")
+        return min(connect, remaining), min(read, remaining)
+
+    def request(self, method, path, data=None, params=None, timeout=None, idempotent=None,
+                raise_for_status=True):
+        """
+        发送请求，返回 requests.Response
+
+        path：表名或 rpc/<函数名>
+        timeout：本次调用的读取超时（秒），默认 POSTGREST_READ_TIMEOUT
+        idempotent：是否允许重试，默认按请求方法判断
+        raise_for_status：状态码为 4xx/5xx 时抛出 PostgrestError
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        retries = self.max_retries if idempotent else 0
+        deadline = request_deadline()
+        url = f"{self.rest_url}/{path}"
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, headers=self.headers, params=params,
+                                                json=data if method in ("POST", "PATCH", "PUT") else None,
+                                                timeout=self._timeout(deadline, timeout))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error, response = e, None
+            except requests.exceptions.RequestException as e:
+                raise PostgrestError(e)
+            else:
+                error = None
+                if response.status_code not in RETRY_STATUS:
+                    break
+
+            if attempt >= retries:
+                break
+            delay = _retry_delay(attempt, response)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                break
+            attempt += 1
+            print(f"[PostgREST] {method} {path} 失败（{error or response.status_code}），{delay:.2f}s 后第 {attempt} 次重试")
+            time.sleep(delay)
+
+        if response is None:
+            if isinstance(error, requests.exceptions.Timeout) and deadline is not None \
+                    and time.monotonic() >= deadline:
+                raise DeadlineExceeded(f"request deadline exceeded ({error})")
+            raise PostgrestError(error)
+        if raise_for_status:
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                code, detail = _error_body(response)
+                print(f"[ERROR] Supabase request failed: {e} {code or ''} {detail or ''}")
+                raise PostgrestError(e, response.status_code, code, detail)
+        return response
+
+    def rpc(self, name, payload, idempotent=True, **kwargs):
+        """调用数据库函数，返回 JSON；只读函数（默认）允许重试"""
+        return self.request("POST", f"rpc/{name}", payload, idempotent=idempotent, **kwargs).json()
+
+
+postgrest = PostgrestClient(SUPABASE_URL, SUPABASE_KEY)
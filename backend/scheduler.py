@@ -0,0 +1,165 @@
+"""
+任务调度器
+将交互式请求（图片翻译、上传）与批处理请求（转公文、文档翻译、国别/季度报告）分到不同的优先级类别，
+每个类别使用独立的线程池和有界队列，避免大量长时间运行的报告占满 worker 线程导致图片翻译不可用
+
+用法：
+    @app.route('/api/translate-image', methods=['POST'])
+    @scheduled(INTERACTIVE)
+    def translate_image(): ...
+"""
+import os
+import time
+import functools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import jsonify, copy_current_request_context
+
+# ============= 优先级类别 =============
+INTERACTIVE = "interactive"  # 几秒内完成的请求
+BATCH = "batch"              # 几十分钟的工作流
+
+# 每个类别的并发数和排队上限（可通过环境变量调整）
+WORKLOAD_CONFIG = {
+    INTERACTIVE: {
+        "max_workers": int(os.getenv("INTERACTIVE_MAX_WORKERS", "8")),
+        "max_queue": int(os.getenv("INTERACTIVE_MAX_QUEUE", "32")),
+    },
+    BATCH: {
+        "max_workers": int(os.getenv("BATCH_MAX_WORKERS", "4")),
+        "max_queue": int(os.getenv("BATCH_MAX_QUEUE", "8")),
+    },
+}
+
+
+class SchedulerBusy(Exception):
+    """队列已满，请求被拒绝"""
+
+    def __init__(self, workload, retry_after):
+        super().__init__(f"{workload} queue is full")
+        self.workload = workload
+        self.retry_after = retry_after
+
+
+class WorkloadPool:
+    """单个优先级类别的线程池，记录排队深度和耗时"""
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_times = deque(maxlen=200)
+        self._run_times = deque(maxlen=200)
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务，队列已满时抛出 SchedulerBusy"""
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise SchedulerBusy(self.name, self._estimate_retry_after_locked())
+            self.queued += 1
+        enqueued_at = time.monotonic()
+
+        def task():
+            started_at = time.monotonic()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self._wait_times.append(started_at - enqueued_at)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self._run_times.append(time.monotonic() - started_at)
+
+        try:
+            return self.executor.submit(task)
+        except Exception:
+            with self._lock:
+                self.queued -= 1
+            raise
+
+    def _estimate_retry_after_locked(self):
+        """按平均耗时估算需要等待的秒数"""
+        avg_run = sum(self._run_times) / len(self._run_times) if self._run_times else 30
+        return max(1, int(avg_run * (self.queued + 1) / self.max_workers))
+
+    def stats(self):
+        """队列深度与耗时统计"""
+        with self._lock:
+            wait_times = sorted(self._wait_times)
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_seconds": round(sum(wait_times) / len(wait_times), 3) if wait_times else 0,
+                "p95_wait_seconds": round(wait_times[int(len(wait_times) * 0.95)], 3) if wait_times else 0,
+                "avg_run_seconds": round(sum(self._run_times) / len(self._run_times), 3) if self._run_times else 0,
+            }
+
+
+class WorkloadScheduler:
+    """按优先级类别分发任务"""
+
+    def __init__(self, config):
+        self.pools = {name: WorkloadPool(name, **cfg) for name, cfg in config.items()}
+
+    def submit(self, workload, fn, *args, **kwargs):
+        return self.pools[workload].submit(fn, *args, **kwargs)
+
+    def run(self, workload, fn, *args, **kwargs):
+        """提交任务并等待结果"""
+        return self.submit(workload, fn, *args, **kwargs).result()
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+
+scheduler = WorkloadScheduler(WORKLOAD_CONFIG)
+
+
+def scheduled(workload):
+    """路由装饰器：在对应类别的线程池中执行视图函数"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            task = copy_current_request_context(view)
+            try:
+                return scheduler.run(workload, task, *args, **kwargs)
+            except SchedulerBusy as e:
+                print(f"[Scheduler] {e.workload} 队列已满，拒绝请求")
+                response = jsonify({
+                    "error": "Server is busy, please retry later",
+                    "workload": e.workload,
+                    "retry_after": e.retry_after
+                })
+                response.status_code = 503
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+        return wrapper
+    return decorator
+
+
+def register_scheduler_routes(app):
+    """注册调度器监控路由"""
+
+    @app.route('/api/scheduler/stats', methods=['GET'])
+    def get_scheduler_stats():
+        """各优先级类别的队列深度和耗时"""
+        return jsonify({
+            "success": True,
+            "workloads": scheduler.stats()
+        }), 200
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+文档库存储契约测试
+同一组测试分别在 SQLite 存储和 PostgREST 存储上运行，保证两种实现对路由表现一致。
+
+- SQLite：每个测试使用一个临时数据库，不需要任何外部服务
+- PostgREST：需要可访问的 Supabase（已执行 documents_local_schema.sql、documents_stats.sql、
+  documents_source_site.sql），设置 DOCUMENT_STORE_TEST_POSTGREST=1 后运行；
+  测试数据（文档和文件夹）写在随机的 user_id 下，结束时删除
+
+用法（在 backend 目录下）：
+    python -m pytest test_document_store.py
+    DOCUMENT_STORE_TEST_POSTGREST=1 python -m pytest test_document_store.py
+"""
+import os
+import uuid
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from document_store import create_document_store
+
+
+def iso(days_ago=0, seconds=0):
+    return (datetime.now(timezone.utc) - timedelta(days=days_ago, seconds=seconds)).isoformat()
+
+
+def same_instant(a, b):
+    return datetime.fromisoformat(a.replace('Z', '+00:00')) == datetime.fromisoformat(b.replace('Z', '+00:00'))
+
+
+class DocumentStoreContract:
+    """两种存储共用的契约测试，子类实现 make_store()"""
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+        self.user = f"contract_{uuid.uuid4().hex[:12]}"
+        self.folder_ids = []
+
+    def tearDown(self):
+        for user in (self.user, f"{self.user}_other"):
+            for doc in self.store.user_documents(user, ['id']):
+                self.store.delete_document(doc['id'])
+        for folder_id in self.folder_ids:
+            self.store.delete_folder(folder_id)
+        self.store.close()
+
+    def make_doc(self, **fields):
+        doc = {
+            "id": f"doc_{uuid.uuid4().hex[:16]}",
+            "user_id": self.user,
+            "title": "Test Document",
+            "filename": "test.pdf",
+            "file_type": "pdf",
+            "source_url": "",
+            "source_type": "manual",
+            "tags": [],
+            "folder": "其他",
+            "notes": None,
+            "conversion_history": None,
+            "created_at": iso(),
+            "updated_at": iso()
+        }
+        doc.update(fields)
+        return doc
+
+    def insert(self, **fields):
+        return self.store.insert_document(self.make_doc(**fields))
+
+    def make_folder(self, **fields):
+        folder = {
+            "id": f"folder_{uuid.uuid4().hex[:12]}",
+            "user_id": self.user,
+            "name": "契约测试",
+            "color": "#3B82F6",
+            "parent_id": None,
+            "created_at": iso()
+        }
+        folder.update(fields)
+        self.folder_ids.append(folder['id'])
+        return self.store.create_folder(folder)
+
+    # ---------- 单个文档 ----------
+
+    def test_insert_returns_row_and_get_finds_it(self):
+        doc = self.make_doc(title="World Economic Outlook", tags=["IMF", "报告"],
+                            source_url="https://www.imf.org/en/Publications/WEO")
+        inserted = self.store.insert_document(doc)
+        self.assertEqual(inserted['id'], doc['id'])
+        self.assertEqual(inserted['tags'], ["IMF", "报告"])
+        self.assertEqual(inserted['source_site'], "imf.org")
+
+        fetched = self.store.get_document(doc['id'])
+        self.assertEqual(fetched['title'], "World Economic Outlook")
+        self.assertEqual(fetched['user_id'], self.user)
+        self.assertTrue(same_instant(fetched['created_at'], doc['created_at']))
+
+    def test_get_missing_document_returns_none(self):
+        self.assertIsNone(self.store.get_document(f"missing_{uuid.uuid4().hex}"))
+
+    def test_insert_duplicate_id_raises(self):
+        doc = self.insert()
+        with self.assertRaises(Exception):
+            self.store.insert_document(self.make_doc(id=doc['id']))
+
+    def test_update_changes_only_given_columns(self):
+        doc = self.insert(title="Old", notes="keep me")
+        updated = self.store.update_document(doc['id'], {"title": "New", "tags": ["a", "b"]})
+        self.assertEqual(updated['title'], "New")
+        self.assertEqual(updated['tags'], ["a", "b"])
+        self.assertEqual(updated['notes'], "keep me")
+        self.assertEqual(self.store.get_document(doc['id'])['title'], "New")
+
+    def test_update_missing_document_returns_none(self):
+        self.assertIsNone(self.store.update_document(f"missing_{uuid.uuid4().hex}", {"title": "x"}))
+
+    def test_delete_returns_deleted_rows(self):
+        doc = self.insert()
+        deleted = self.store.delete_document(doc['id'])
+        self.assertEqual([d['id'] for d in deleted], [doc['id']])
+        self.assertEqual(deleted[0]['user_id'], self.user)
+        self.assertIsNone(self.store.get_document(doc['id']))
+        self.assertEqual(self.store.delete_document(doc['id']), [])
+
+    # ---------- 列表 ----------
+
+    def test_list_orders_by_created_at_then_id_descending(self):
+        same_time = iso(seconds=30)
+        a = self.insert(id=f"doc_a_{uuid.uuid4().hex[:8]}", created_at=same_time)
+        b = self.insert(id=f"doc_b_{uuid.uuid4().hex[:8]}", created_at=same_time)
+        newest = self.insert(created_at=iso())
+        oldest = self.insert(created_at=iso(days_ago=3))
+        ids = [d['id'] for d in self.store.list_documents(self.user)]
+        self.assertEqual(ids, [newest['id'], b['id'], a['id'], oldest['id']])
+
+    def test_keyset_pagination_visits_every_row_once(self):
+        same_time = iso(seconds=10)
+        expected = set()
+        for i in range(7):
+            created_at = same_time if i % 2 else iso(seconds=100 * i)
+            expected.add(self.insert(created_at=created_at)['id'])
+
+        seen, after = [], None
+        while True:
+            page = self.store.list_documents(self.user, limit=3, after=after)
+            seen.extend(d['id'] for d in page)
+            if len(page) < 3:
+                break
+            after = {"c": page[-1]['created_at'], "i": page[-1]['id']}
+        self.assertEqual(len(seen), len(expected))
+        self.assertEqual(set(seen), expected)
+        self.assertEqual(seen, [d['id'] for d in self.store.list_documents(self.user, limit=20)])
+
+    def test_offset_pagination(self):
+        for i in range(5):
+            self.insert(created_at=iso(seconds=i))
+        everything = [d['id'] for d in self.store.list_documents(self.user)]
+        page = [d['id'] for d in self.store.list_documents(self.user, limit=2, offset=2)]
+        self.assertEqual(page, everything[2:4])
+
+    def test_filters(self):
+        imf = self.insert(title="IMF Fiscal Monitor", folder="金融经济", tags=["财政"],
+                          source_url="https://www.imf.org/fm.pdf")
+        wb = self.insert(title="Trade Report", folder="国际贸易", tags=["贸易", "财政"],
+                         source_url="https://data.worldbank.org/r.pdf", notes="关于关税的笔记")
+        self.insert(title="100 ways", filename="1000.pdf")
+
+        def ids(**filters):
+            return {d['id'] for d in self.store.list_documents(self.user, **filters)}
+
+        self.assertEqual(ids(folder="金融经济"), {imf['id']})
+        self.assertEqual(ids(tag="财政"), {imf['id'], wb['id']})
+        self.assertEqual(ids(tag="贸易"), {wb['id']})
+        self.assertEqual(ids(website="worldbank"), {wb['id']})
+        self.assertEqual(ids(search="fiscal"), {imf['id']})
+        self.assertEqual(ids(search="关税"), {wb['id']})
+        # LIKE 通配符按字面匹配
+        self.assertEqual(ids(search="100%"), set())
+        self.assertEqual(ids(search="fiscal", tag="贸易"), set())
+
+    def test_website_filter_matches_site_counts(self):
+        pbc = self.insert(source_url="http://www.pbc.gov.cn/report.pdf")
+        un = self.insert(source_url="https://www.un.org/report.pdf")
+        self.insert(source_url="https://fun.org/report.pdf")
+        self.insert(source_url="https://un.org.evil.com/report.pdf")
+        # 尚未回填 source_site 的行按域名后缀规则匹配
+        legacy = self.insert(source_url="https://news.un.org/story")
+        self.store.update_document(legacy['id'], {"source_site": None})
+
+        def ids(website):
+            return {d['id'] for d in self.store.list_documents(self.user, website=website)}
+
+        counts = self.store.site_counts(self.user)
+        self.assertEqual(counts, {"centralbank.gov.cn": 1, "un.org": 1})
+        self.assertEqual(ids("centralbank.gov.cn"), {pbc['id']})
+        self.assertEqual(ids("un.org"), {un['id'], legacy['id']})
+
+    def test_fields_projection(self):
+        self.insert(title="Projected", tags=["x"])
+        docs = self.store.list_documents(self.user, fields=['id', 'created_at', 'title', 'tags'])
+        self.assertEqual(set(docs[0]), {'id', 'created_at', 'title', 'tags'})
+        self.assertEqual(docs[0]['tags'], ["x"])
+
+    def test_users_are_isolated(self):
+        mine = self.insert()
+        self.insert(user_id=f"{self.user}_other")
+        self.assertEqual([d['id'] for d in self.store.list_documents(self.user)], [mine['id']])
+        self.assertEqual([d['id'] for d in self.store.user_documents(self.user)], [mine['id']])
+        self.assertEqual(self.store.document_stats(self.user)['total'], 1)
+
+    def test_user_documents_with_columns(self):
+        doc = self.insert(source_url="https://www.oecd.org/x")
+        rows = self.store.user_documents(self.user, ['id', 'source_url'])
+        self.assertEqual(rows, [{"id": doc['id'], "source_url": "https://www.oecd.org/x"}])
+
+    # ---------- 统计 ----------
+
+    def test_folder_counts(self):
+        self.insert(folder="金融经济")
+        self.insert(folder="金融经济")
+        self.insert(folder="其他")
+        self.assertEqual(self.store.folder_counts(self.user), {"金融经济": 2, "其他": 1})
+
+    def test_site_counts(self):
+        self.insert(source_url="https://www.imf.org/a")
+        self.insert(source_url="https://elibrary.imf.org/b")
+        self.insert(source_url="https://www.uneca.org/c")
+        self.insert(source_url="https://example.com/d")
+        self.assertEqual(self.store.site_counts(self.user), {"imf.org": 2, "uneca": 1})
+
+    def test_document_stats(self):
+        self.insert(source_type="plugin", file_type="pdf")
+        self.insert(source_type="plugin", file_type="docx", created_at=iso(days_ago=2))
+        self.insert(source_type="manual", file_type=None, created_at=iso(days_ago=30))
+        self.assertEqual(self.store.document_stats(self.user, recent_days=7), {
+            "total": 3,
+            "by_source": {"plugin": 2, "manual": 1, "upload": 0},
+            "by_type": {"pdf": 1, "docx": 1, "unknown": 1},
+            "recent_count": 2
+        })
+
+    def test_stats_for_empty_library(self):
+        self.assertEqual(self.store.folder_counts(self.user), {})
+        self.assertEqual(self.store.site_counts(self.user), {})
+        self.assertEqual(self.store.document_stats(self.user), {
+            "total": 0,
+            "by_source": {"plugin": 0, "manual": 0, "upload": 0},
+            "by_type": {},
+            "recent_count": 0
+        })
+
+    # ---------- 文件夹 ----------
+
+    def test_create_folder(self):
+        folder = self.make_folder()
+        self.assertEqual(folder['name'], "契约测试")
+        self.assertEqual(folder['user_id'], self.user)
+
+    def test_delete_folder_returns_deleted_rows(self):
+        folder = self.make_folder(name="待删除")
+        deleted = self.store.delete_folder(folder['id'])
+        self.assertEqual([f['id'] for f in deleted], [folder['id']])
+        self.assertEqual(deleted[0]['name'], "待删除")
+        self.assertEqual(self.store.delete_folder(folder['id']), [])
+
+
+class SqliteDocumentStoreTest(DocumentStoreContract, unittest.TestCase):
+
+    def make_store(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="document_store_")
+        return create_document_store('sqlite', path=os.path.join(self.tmpdir, "documents.db"))
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+@unittest.skipUnless(os.getenv("DOCUMENT_STORE_TEST_POSTGREST"), "设置 DOCUMENT_STORE_TEST_POSTGREST=1 后在 Supabase 上运行")
+class PostgrestDocumentStoreTest(DocumentStoreContract, unittest.TestCase):
+
+    def make_store(self):
+        return create_document_store('postgrest')
+
+
+if __name__ == "__main__":
+    unittest.main()
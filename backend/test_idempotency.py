@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+幂等键测试
+路由按线上的顺序装饰（idempotent → admission_controlled → scheduled），检查：
+- 准入控制的 429、任务队列已满的 503 不会保存，带同一个键的重试会重新执行
+- 视图自己返回的 2xx/4xx 会保存并重放
+- 原请求仍在执行时，重试请求直接返回 409，不占用 worker 线程等待
+
+用法（在 backend 目录下）：
+    python -m pytest test_idempotency.py
+"""
+import uuid
+import threading
+import unittest
+
+from flask import Flask, jsonify
+
+import admission
+import scheduler
+import idempotency
+from admission import admission_controlled, AdmissionController, MemoryCounterBackend
+from scheduler import scheduled, WorkloadPool, BATCH
+from idempotency import idempotent, IDEMPOTENCY_HEADER, REPLAYED_HEADER
+
+
+class RejectingBackend(MemoryCounterBackend):
+    """令牌桶总是拒绝的计数器"""
+
+    def take_token(self, key, rate, burst):
+        return False, 30
+
+
+class IdempotencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.release_view = threading.Event()
+        self.release_view.set()
+        self.status_code = 200
+
+        app = Flask(__name__)
+
+        @app.route('/workflow', methods=['POST'])
+        @idempotent
+        @admission_controlled('country_report')
+        @scheduled(BATCH)
+        def workflow():
+            self.calls.append(1)
+            self.release_view.wait(10)
+            return jsonify({"run": len(self.calls)}), self.status_code
+
+        self.client = app.test_client()
+        self.key = f"test-{uuid.uuid4().hex}"
+
+        self._controller = admission.admission_controller
+        self._pool = scheduler.scheduler.pools[BATCH]
+        self._wait = idempotency.IDEMPOTENCY_WAIT
+        admission.admission_controller = AdmissionController(MemoryCounterBackend())
+
+    def tearDown(self):
+        self.release_view.set()
+        admission.admission_controller = self._controller
+        scheduler.scheduler.pools[BATCH] = self._pool
+        idempotency.IDEMPOTENCY_WAIT = self._wait
+
+    def post(self, body=None):
+        return self.client.post('/workflow', json=body or {"user": "alice"},
+                                headers={IDEMPOTENCY_HEADER: self.key})
+
+    def test_admission_rejection_is_not_stored(self):
+        admission.admission_controller = AdmissionController(RejectingBackend())
+        self.assertEqual(self.post().status_code, 429)
+        self.assertEqual(self.calls, [])
+
+        admission.admission_controller = AdmissionController(MemoryCounterBackend())
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(REPLAYED_HEADER, response.headers)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_scheduler_rejection_is_not_stored(self):
+        scheduler.scheduler.pools[BATCH] = WorkloadPool(BATCH, max_workers=1, max_queue=0)
+        self.assertEqual(self.post().status_code, 503)
+        self.assertEqual(self.calls, [])
+
+        scheduler.scheduler.pools[BATCH] = self._pool
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_final_result_is_replayed(self):
+        first = self.post()
+        second = self.post()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.headers[REPLAYED_HEADER], "true")
+        self.assertEqual(second.get_json(), first.get_json())
+        self.assertEqual(len(self.calls), 1)
+
+    def test_client_error_is_replayed(self):
+        self.status_code = 400
+        self.assertEqual(self.post().status_code, 400)
+        replay = self.post()
+        self.assertEqual(replay.status_code, 400)
+        self.assertEqual(replay.headers[REPLAYED_HEADER], "true")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_server_error_is_not_stored(self):
+        self.status_code = 502
+        self.assertEqual(self.post().status_code, 502)
+        self.status_code = 200
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_retry_while_in_progress_returns_409(self):
+        idempotency.IDEMPOTENCY_WAIT = 0
+        self.release_view.clear()
+        original = threading.Thread(target=self.post)
+        original.start()
+        try:
+            for _ in range(100):
+                if self.calls:
+                    break
+                threading.Event().wait(0.05)
+            retry = self.post()
+            self.assertEqual(retry.status_code, 409)
+            self.assertIn('Retry-After', retry.headers)
+        finally:
+            self.release_view.set()
+            original.join(10)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_different_body_returns_422(self):
+        self.post()
+        self.assertEqual(self.post({"user": "alice", "x": 1}).status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
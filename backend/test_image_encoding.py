@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+图片自适应编码测试
+检查体积预算不够时的处理：
+- 文字密集的图片、分块翻译的块（allow_downscale=False）保持原尺寸，以质量下限发送
+- 普通照片仍然缩小尺寸来满足预算
+
+用法（在 backend 目录下）：
+    python -m pytest test_image_encoding.py
+"""
+import random
+import unittest
+
+from PIL import Image, ImageDraw
+
+import image_encoding
+from image_encoding import encode_image, edge_density, TEXT_EDGE_DENSITY, QUALITY_RANGE_TEXT
+
+
+def dense_text_tile(size=1600, seed=7):
+    """整页小字号文字，按 512KB 预算在最低文字质量下也放不下"""
+    rng = random.Random(seed)
+    im = Image.new('RGB', (size, size), 'white')
+    draw = ImageDraw.Draw(im)
+    for y in range(0, size, 12):
+        line = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789 ') for _ in range(size // 6))
+        draw.text((2, y), line, fill=(rng.randint(0, 60),) * 3)
+    return im
+
+
+def noise_photo(size=1600):
+    """渐变加细小噪声，边缘占比低于文字阈值，但 JPEG 压缩率低"""
+    noise = Image.effect_noise((size, size), 12).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((size, size)).convert('RGB')
+    return Image.blend(noise, gradient, 0.5)
+
+
+class EncodeImageTest(unittest.TestCase):
+
+    def setUp(self):
+        self._adaptive = image_encoding.ADAPTIVE_ENCODING
+        image_encoding.ADAPTIVE_ENCODING = True
+
+    def tearDown(self):
+        image_encoding.ADAPTIVE_ENCODING = self._adaptive
+
+    def test_dense_text_tile_keeps_full_resolution(self):
+        tile = dense_text_tile()
+        self.assertGreaterEqual(edge_density(tile), TEXT_EDGE_DENSITY)
+        encoded = encode_image(tile, budget=512 * 1024, allow_downscale=False)
+        self.assertEqual(encoded.size, (1600, 1600))
+        self.assertEqual(encoded.fmt, 'jpeg')
+        self.assertGreaterEqual(encoded.quality, QUALITY_RANGE_TEXT[0])
+
+    def test_dense_text_is_never_downscaled(self):
+        encoded = encode_image(dense_text_tile(), budget=512 * 1024)
+        self.assertEqual(encoded.size, (1600, 1600))
+        self.assertEqual(encoded.quality, QUALITY_RANGE_TEXT[0])
+
+    def test_photo_over_budget_is_downscaled(self):
+        photo = noise_photo()
+        self.assertLess(edge_density(photo), TEXT_EDGE_DENSITY)
+        encoded = encode_image(photo, budget=64 * 1024)
+        self.assertLess(max(encoded.size), 1600)
+        self.assertLessEqual(encoded.payload_bytes, 64 * 1024)
+
+    def test_photo_tile_keeps_full_resolution(self):
+        encoded = encode_image(noise_photo(), budget=64 * 1024, allow_downscale=False)
+        self.assertEqual(encoded.size, (1600, 1600))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+"""
+文档来源网站分类
+根据 source_url 的主机名判断文档来自哪个已知网站（世界银行、IMF、联合国等）
+
+按域名后缀匹配：域名按标签倒序存入前缀树（org -> imf），查找时从顶级域名逐级向下，
+取最长的匹配，例如 data.worldbank.org 属于 worldbank.org，而 uneca.org 不会被 un.org 误匹配。
+分类结果在写入时保存到 documents.source_site 列（documents_source_site.sql），
+/api/websites 由数据库分组计数，/api/documents?website= 按该列筛选；
+已有数据用 python website_sources.py --backfill 回填
+"""
+import re
+from urllib.parse import urlparse
+
+# 预定义所有已知网站（包含没有文档的）
+KNOWN_WEBSITES = [
+    {'key': 'worldbank.org', 'name': '世界银行'},
+    {'key': 'imf.org', 'name': 'IMF国际货币基金组织'},
+    {'key': 'un.org', 'name': '联合国'},
+    {'key': 'unea', 'name': '联合国非洲经济委员会'},
+    {'key': 'uneca', 'name': '联合国非洲经济委员会'},
+    {'key': 'afdb.org', 'name': '非洲开发银行'},
+    {'key': 'wto.org', 'name': 'WTO世贸组织'},
+    {'key': 'oecd.org', 'name': 'OECD经合组织'},
+    {'key': 'nielsen.com', 'name': 'Nielsen尼尔森'},
+    {'key': 'mckinsey.com', 'name': '麦肯锡'},
+    {'key': 'bcg.com', 'name': '波士顿咨询'},
+    {'key': 'bain.com', 'name': '贝恩咨询'},
+    {'key': 'centralbank.gov.cn', 'name': '中国人民银行'},
+    {'key': 'stats.gov.cn', 'name': '国家统计局'},
+]
+
+# 域名后缀 -> 网站 key（子域名同样匹配）
+WEBSITE_DOMAINS = {
+    'worldbank.org': 'worldbank.org',
+    'imf.org': 'imf.org',
+    'un.org': 'un.org',
+    'unea.org': 'unea',
+    'uneca.org': 'uneca',
+    'afdb.org': 'afdb.org',
+    'wto.org': 'wto.org',
+    'oecd.org': 'oecd.org',
+    'nielsen.com': 'nielsen.com',
+    'mckinsey.com': 'mckinsey.com',
+    'bcg.com': 'bcg.com',
+    'bain.com': 'bain.com',
+    'centralbank.gov.cn': 'centralbank.gov.cn',
+    'pbc.gov.cn': 'centralbank.gov.cn',
+    'stats.gov.cn': 'stats.gov.cn',
+}
+
+_SITE = object()  # 前缀树节点上保存网站 key 的键
+
+
+def build_suffix_trie(domains):
+    """{域名后缀: 网站 key} 转为按标签倒序的前缀树"""
+    root = {}
+    for domain, site in domains.items():
+        node = root
+        for label in reversed(domain.lower().split('.')):
+            node = node.setdefault(label, {})
+        node[_SITE] = site
+    return root
+
+
+_TRIE = build_suffix_trie(WEBSITE_DOMAINS)
+
+
+def hostname_of(source_url):
+    """source_url 的主机名（小写，去掉端口、用户信息和末尾的点），无法解析时返回 None"""
+    try:
+        hostname = urlparse(source_url).hostname
+    except ValueError:
+        return None
+    return hostname.rstrip('.') if hostname else None
+
+
+def match_hostname(hostname, trie=_TRIE):
+    """主机名最长匹配的网站 key"""
+    site, node = None, trie
+    for label in reversed(hostname.split('.')):
+        node = node.get(label)
+        if node is None:
+            break
+        site = node.get(_SITE, site)
+    return site
+
+
+def classify_website(source_url):
+    """返回 source_url 所属的已知网站 key，不属于任何已知网站时返回 None"""
+    if not source_url:
+        return None
+    hostname = hostname_of(source_url)
+    return match_hostname(hostname) if hostname else None
+
+
+def website_domains(website):
+    """已知网站 key 对应的域名后缀，不是已知网站时为空列表"""
+    return sorted(domain for domain, site in WEBSITE_DOMAINS.items() if site == website)
+
+
+def website_host_pattern(website):
+    """
+    匹配 source_url 属于该网站的正则（不区分大小写，PostgreSQL 和 Python 通用）
+
+    已知网站 key：主机名是它的某个域名或其子域名，与 classify_website 的结果一致
+    （centralbank.gov.cn 包括 pbc.gov.cn；un.org 不包括 fun.org、un.org.evil.com）；
+    其他关键字：主机名部分包含关键字
+    """
+    domains = website_domains(website)
+    if not domains:
+        return f"^[a-z][a-z0-9+.-]*://[^/]*{re.escape(website.lower())}"
+    alternatives = "|".join(re.escape(domain) for domain in domains)
+    return rf"^[a-z][a-z0-9+.-]*://([^/?#@]*@)?([^/?#@]*\.)?({alternatives})\.?(:[0-9]+)?([/?#]|$)"
+
+
+def website_list(website_counts):
+    """构建 /api/websites 返回的网站列表（包含 0 个文档的），按数量降序"""
+    websites = [{
+        "id": w['key'],
+        "name": w['name'],
+        "count": website_counts.get(w['key'], 0)
+    } for w in KNOWN_WEBSITES]
+    websites.sort(key=lambda x: x['count'], reverse=True)
+    return websites
+
+
+def backfill_source_site(batch_size=500, dry_run=False):
+    """
+    为 source_site 为空的已有文档补充分类
+
+    按 id 顺序分批读取，同一网站的文档用一次 PATCH（id=in.(...)）更新；
+    不属于已知网站的文档保持为空
+    """
+    from postgrest_client import postgrest
+    from document_store_postgrest import postgrest_quote
+
+    last_id, scanned, updated = None, 0, 0
+    while True:
+        params = {
+            "select": "id,source_url",
+            "source_site": "is.null",
+            "source_url": "not.is.null",
+            "order": "id",
+            "limit": batch_size
+        }
+        if last_id is not None:
+            params["id"] = f"gt.{postgrest_quote(last_id)}"
+        rows = postgrest.request("GET", "documents", params=params).json()
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        scanned += len(rows)
+
+        by_site = {}
+        for row in rows:
+            site = classify_website(row.get('source_url'))
+            if site:
+                by_site.setdefault(site, []).append(row['id'])
+        for site, ids in by_site.items():
+            updated += len(ids)
+            if not dry_run:
+                id_list = ",".join(postgrest_quote(i) for i in ids)
+                postgrest.request("PATCH", "documents", {"source_site": site}, {"id": f"in.({id_list})"})
+        print(f"[Backfill] 已扫描 {scanned} 条，分类 {updated} 条")
+        if len(rows) < batch_size:
+            break
+
+    action = "需要更新" if dry_run else "已更新"
+    print(f"[Backfill] 完成：扫描 {scanned} 条，{action} {updated} 条")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="文档来源网站分类")
+    parser.add_argument("--backfill", action="store_true", help="为已有文档回填 source_site 列")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批读取的文档数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不写入数据库")
+    args = parser.parse_args()
+    if args.backfill:
+        backfill_source_site(args.batch_size, args.dry_run)
+    else:
+        parser.print_help()